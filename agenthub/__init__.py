@@ -2,22 +2,17 @@ from dotenv import load_dotenv
 
 from opendevin.controller.agent import Agent
 
-from .micro.agent import MicroAgent
-from .micro.registry import all_microagents
-
 load_dotenv()
 
-
-from . import (  # noqa: E402
-    SWE_agent,
-    browsing_agent,
-    codeact_agent,
-    codeact_swe_agent,
-    delegator_agent,
-    dummy_agent,
-    monologue_agent,
-    planner_agent,
-)
+# the agents are imported when first used, as some of them take long to import
+Agent.register_lazy('MonologueAgent', 'agenthub.monologue_agent')
+Agent.register_lazy('CodeActAgent', 'agenthub.codeact_agent')
+Agent.register_lazy('CodeActSWEAgent', 'agenthub.codeact_swe_agent')
+Agent.register_lazy('PlannerAgent', 'agenthub.planner_agent')
+Agent.register_lazy('SWEAgent', 'agenthub.SWE_agent')
+Agent.register_lazy('DelegatorAgent', 'agenthub.delegator_agent')
+Agent.register_lazy('DummyAgent', 'agenthub.dummy_agent')
+Agent.register_lazy('BrowsingAgent', 'agenthub.browsing_agent')
 
 __all__ = [
     'monologue_agent',
@@ -30,17 +25,25 @@ __all__ = [
     'browsing_agent',
 ]
 
-for agent in all_microagents.values():
-    name = agent['name']
-    prompt = agent['prompt']
 
-    anon_class = type(
-        name,
-        (MicroAgent,),
-        {
-            'prompt': prompt,
-            'agent_definition': agent,
-        },
-    )
+def _register_microagents():
+    from .micro.agent import MicroAgent
+    from .micro.registry import all_microagents
+
+    for agent in all_microagents.values():
+        name = agent['name']
+        prompt = agent['prompt']
+
+        anon_class = type(
+            name,
+            (MicroAgent,),
+            {
+                'prompt': prompt,
+                'agent_definition': agent,
+            },
+        )
+
+        Agent.register(name, anon_class)
+
 
-    Agent.register(name, anon_class)
+Agent.register_loader(_register_microagents)
@@ -38,7 +38,10 @@ class CodeActResponseParser(ResponseParser):
         return self.parse_action(action_str)
 
     def parse_response(self, response) -> str:
-        action = response.choices[0].message.content
+        return self.close_blocks(response.choices[0].message.content)
+
+    def close_blocks(self, action: str) -> str:
+        # the stop sequences leave the closing tag out
         for lang in ['bash', 'ipython', 'browse']:
             if f'<execute_{lang}>' in action and f'</execute_{lang}>' not in action:
                 action += f'</execute_{lang}>'
@@ -51,6 +54,49 @@ class CodeActResponseParser(ResponseParser):
         return self.default_parser.parse(action_str)
 
 
+class CodeActStreamParser:
+    """
+    Parses a response as it streams in. The action is parsed as soon as its block
+    closes, and the rest of the response is dropped, like the stop sequences would.
+    """
+
+    closing_tags = ['</execute_bash>', '</execute_ipython>', '</execute_browse>']
+
+    def __init__(self, response_parser: CodeActResponseParser):
+        self.response_parser = response_parser
+        self.text = ''
+        self.action: Action | None = None
+
+    def feed(self, delta: str) -> Action | None:
+        """
+        Adds a piece of the response, and returns the action if it is now complete.
+        """
+        if self.action is not None:
+            return self.action
+        # a tag can be split across pieces
+        start = max(len(self.text) - max(len(tag) for tag in self.closing_tags), 0)
+        self.text += delta
+        ends = [
+            index + len(tag)
+            for tag in self.closing_tags
+            if (index := self.text.find(tag, start)) != -1
+        ]
+        if ends:
+            self.text = self.text[: min(ends)]
+            self.action = self.response_parser.parse_action(self.text)
+        return self.action
+
+    def finish(self) -> Action:
+        """
+        Returns the action of the whole response, once it has ended.
+        """
+        if self.action is None:
+            self.action = self.response_parser.parse_action(
+                self.response_parser.close_blocks(self.text)
+            )
+        return self.action
+
+
 class CodeActActionParserFinish(ActionParser):
     """
     Parser action:
@@ -1,4 +1,7 @@
-from agenthub.codeact_agent.action_parser import CodeActResponseParser
+from agenthub.codeact_agent.action_parser import (
+    CodeActResponseParser,
+    CodeActStreamParser,
+)
 from agenthub.codeact_agent.prompt import (
     COMMAND_DOCS,
     EXAMPLES,
@@ -23,6 +26,7 @@ from opendevin.events.observation import (
     IPythonRunCellObservation,
 )
 from opendevin.llm.llm import LLM
+from opendevin.memory.context_window import ContextWindow
 from opendevin.runtime.plugins import (
     AgentSkillsRequirement,
     JupyterRequirement,
@@ -32,6 +36,12 @@ from opendevin.runtime.tools import RuntimeTool
 
 ENABLE_GITHUB = True
 
+STOP_SEQUENCES = [
+    '</execute_ipython>',
+    '</execute_bash>',
+    '</execute_browse>',
+]
+
 
 def action_to_str(action: Action) -> str:
     if isinstance(action, CmdRunAction):
@@ -176,6 +186,7 @@ class CodeActAgent(Agent):
         - llm (LLM): The llm to be used by this agent
         """
         super().__init__(llm)
+        self.context_window = ContextWindow(llm)
         self.reset()
 
     def reset(self) -> None:
@@ -183,6 +194,7 @@ class CodeActAgent(Agent):
         Resets the CodeAct Agent.
         """
         super().reset()
+        self.context_window.reset()
 
     def step(self, state: State) -> Action:
         """
@@ -199,41 +211,100 @@ class CodeActAgent(Agent):
         - MessageAction(content) - Message action to run (e.g. ask for clarification)
         - AgentFinishAction() - end the interaction
         """
-        messages: list[dict[str, str]] = [
+        messages = self._get_messages(state)
+        if messages is None:
+            return AgentFinishAction()
+        response = self.llm.completion(
+            messages=messages,
+            stop=STOP_SEQUENCES,
+            temperature=0.0,
+        )
+        return self._parse_response(state, response)
+
+    async def astep(self, state: State) -> Action:
+        """
+        Performs one step like step, awaiting the LLM instead of blocking.
+
+        When the LLM streams, the response is passed on to partial_response_callback
+        as it comes, and the action is returned as soon as its block is complete.
+        """
+        messages = self._get_messages(state)
+        if messages is None:
+            return AgentFinishAction()
+        if not self.llm.stream:
+            response = await self.llm.acompletion(
+                messages=messages,
+                stop=STOP_SEQUENCES,
+                temperature=0.0,
+            )
+            return self._parse_response(state, response)
+
+        parser = CodeActStreamParser(self.action_parser)
+        stream = self.llm.astream(
+            messages=messages,
+            stop=STOP_SEQUENCES,
+            temperature=0.0,
+        )
+        try:
+            async for delta in stream:
+                length = len(parser.text)
+                action = parser.feed(delta)
+                if self.partial_response_callback and len(parser.text) > length:
+                    await self.partial_response_callback(parser.text[length:])
+                if action is not None:
+                    # stops the generation of what would be dropped anyway
+                    break
+        finally:
+            await stream.aclose()
+        self._count_tokens(state, parser.text)
+        return parser.finish()
+
+    def _get_messages(self, state: State) -> list[dict[str, str]] | None:
+        """
+        Returns the messages to prompt the model with, or None if the user asked to exit.
+
+        The oldest steps after the task are left out, and summarized, when the
+        history doesn't fit in the context window of the model anymore.
+        """
+        pinned: list[dict[str, str]] = [
             {'role': 'system', 'content': self.system_message},
             {'role': 'user', 'content': self.in_context_example},
         ]
 
+        turns: list[list[dict[str, str]]] = []
         for prev_action, obs in state.history:
+            turn = []
             action_message = get_action_message(prev_action)
             if action_message:
-                messages.append(action_message)
+                turn.append(action_message)
 
             obs_message = get_observation_message(obs)
             if obs_message:
-                messages.append(obs_message)
-
+                turn.append(obs_message)
+            if turn:
+                turns.append(turn)
+        if turns and turns[0][0]['role'] == 'user':
+            # the task is kept too
+            pinned += turns.pop(0)
+
+        messages = pinned + [message for turn in turns for message in turn]
         latest_user_message = [m for m in messages if m['role'] == 'user'][-1]
         if latest_user_message:
             if latest_user_message['content'].strip() == '/exit':
-                return AgentFinishAction()
+                return None
             latest_user_message['content'] += (
                 f'\n\nENVIRONMENT REMINDER: You have {state.max_iterations - state.iteration} turns left to complete the task.'
             )
+        return self.context_window.get_messages(pinned, turns)
 
-        response = self.llm.completion(
-            messages=messages,
-            stop=[
-                '</execute_ipython>',
-                '</execute_bash>',
-                '</execute_browse>',
-            ],
-            temperature=0.0,
-        )
-        state.num_of_chars += sum(
-            len(message['content']) for message in messages
-        ) + len(response.choices[0].message.content)
+    def _parse_response(self, state: State, response) -> Action:
+        self._count_tokens(state, response.choices[0].message.content)
         return self.action_parser.parse(response)
 
+    def _count_tokens(self, state: State, content: str) -> None:
+        # the context window already counted the tokens of the prompt
+        state.num_of_tokens += self.context_window.tokens
+        state.num_of_tokens += self.llm.get_response_token_count(content)
+
     def search_memory(self, query: str) -> list[str]:
         raise NotImplementedError('Implement this abstract method')
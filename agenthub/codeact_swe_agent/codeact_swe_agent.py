@@ -181,9 +181,10 @@ class CodeActSWEAgent(Agent):
             ],
             temperature=0.0,
         )
-        state.num_of_chars += sum(
-            len(message['content']) for message in messages
-        ) + len(response.choices[0].message.content)
+        state.num_of_tokens += self.llm.get_token_count(messages)
+        state.num_of_tokens += self.llm.get_response_token_count(
+            response.choices[0].message.content
+        )
 
         return self.response_parser.parse(response)
 
@@ -64,11 +64,15 @@ class MicroAgent(Agent):
             latest_user_message=state.get_current_user_intent(),
         )
         messages = [{'content': prompt, 'role': 'user'}]
-        resp = self.llm.completion(messages=messages)
-        action_resp = resp['choices'][0]['message']['content']
-        state.num_of_chars += len(prompt) + len(action_resp)
-        action = parse_response(action_resp)
-        return action
+
+        def delegate(llm: LLM) -> Action:
+            resp = llm.completion(messages=messages)
+            action_resp = resp['choices'][0]['message']['content']
+            state.num_of_tokens += llm.get_token_count(messages)
+            state.num_of_tokens += llm.get_response_token_count(action_resp)
+            return parse_response(action_resp)
+
+        return self.llm.cascade('delegate', delegate)
 
     def search_memory(self, query: str) -> list[str]:
         return []
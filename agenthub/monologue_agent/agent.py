@@ -1,3 +1,5 @@
+from typing import TYPE_CHECKING
+
 import agenthub.monologue_agent.utils.prompts as prompts
 from agenthub.monologue_agent.response_parser import MonologueResponseParser
 from agenthub.monologue_agent.utils.prompts import INITIAL_THOUGHTS
@@ -29,7 +31,7 @@ from opendevin.llm.llm import LLM
 from opendevin.memory.condenser import MemoryCondenser
 from opendevin.runtime.tools import RuntimeTool
 
-if config.agent.memory_enabled:
+if TYPE_CHECKING:
     from opendevin.memory.memory import LongTermMemory
 
 MAX_TOKEN_COUNT_PADDING = 512
@@ -82,6 +84,9 @@ class MonologueAgent(Agent):
 
         self.initial_thoughts = []
         if config.agent.memory_enabled:
+            # chromadb and llama_index are only imported with memory
+            from opendevin.memory.memory import LongTermMemory
+
             self.memory = LongTermMemory()
         else:
             self.memory = None
@@ -183,8 +188,8 @@ class MonologueAgent(Agent):
         # format all as a single message, a monologue
         resp = self.llm.completion(messages=messages)
 
-        # keep track of max_chars fallback option
-        state.num_of_chars += len(prompt) + len(
+        state.num_of_tokens += self.llm.get_token_count(messages)
+        state.num_of_tokens += self.llm.get_response_token_count(
             resp['choices'][0]['message']['content']
         )
 
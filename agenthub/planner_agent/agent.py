@@ -47,11 +47,17 @@ class PlannerAgent(Agent):
             return AgentFinishAction()
         prompt = get_prompt(state)
         messages = [{'content': prompt, 'role': 'user'}]
-        resp = self.llm.completion(messages=messages)
-        state.num_of_chars += len(prompt) + len(
-            resp['choices'][0]['message']['content']
-        )
-        return self.response_parser.parse(resp)
+
+        def plan(llm: LLM) -> Action:
+            resp = llm.completion(messages=messages)
+            state.num_of_tokens += llm.get_token_count(messages)
+            state.num_of_tokens += llm.get_response_token_count(
+                resp['choices'][0]['message']['content']
+            )
+            return self.response_parser.parse(resp)
+
+        # the plan model if there is one, the main one if it can't be parsed
+        return self.llm.cascade('plan', plan)
 
     def search_memory(self, query: str) -> list[str]:
         return []
@@ -1,5 +1,7 @@
+import asyncio
+import importlib
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Type
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Type
 
 if TYPE_CHECKING:
     from opendevin.controller.state.state import State
@@ -23,6 +25,10 @@ class Agent(ABC):
     """
 
     _registry: dict[str, Type['Agent']] = {}
+    # the modules that register agents when imported, by agent name
+    _lazy_registry: dict[str, str] = {}
+    # functions registering agents whose names are only known once loaded
+    _loaders: list[Callable[[], None]] = []
     sandbox_plugins: list[PluginRequirement] = []
     runtime_tools: list[RuntimeTool] = []
 
@@ -32,6 +38,8 @@ class Agent(ABC):
     ):
         self.llm = llm
         self._complete = False
+        # awaited with each piece of the response, by agents that stream it
+        self.partial_response_callback: Callable[[str], Awaitable[Any]] | None = None
 
     @property
     def complete(self) -> bool:
@@ -51,6 +59,14 @@ class Agent(ABC):
         """
         pass
 
+    async def astep(self, state: 'State') -> 'Action':
+        """
+        The async variant of step, which the agent controller awaits. Agents that
+        call the LLM with acompletion should override it; the default runs step in
+        a thread, so a synchronous agent doesn't block the event loop.
+        """
+        return await asyncio.to_thread(self.step, state)
+
     @abstractmethod
     def search_memory(self, query: str) -> list[str]:
         """
@@ -88,6 +104,36 @@ class Agent(ABC):
             raise AgentAlreadyRegisteredError(name)
         cls._registry[name] = agent_cls
 
+    @classmethod
+    def register_lazy(cls, name: str, module: str):
+        """
+        Registers an agent by the module that registers its class, which is only
+        imported when the agent is first used.
+
+        Parameters:
+        - name (str): The name of the agent.
+        - module (str): The module that registers the class under that name.
+
+        Raises:
+        - AgentAlreadyRegisteredError: If name already registered
+        """
+        if name in cls._registry or name in cls._lazy_registry:
+            raise AgentAlreadyRegisteredError(name)
+        cls._lazy_registry[name] = module
+
+    @classmethod
+    def register_loader(cls, loader: Callable[[], None]):
+        """
+        Registers a function that registers agents, called the first time an agent
+        that isn't registered otherwise is looked up, or the agents are listed.
+        """
+        cls._loaders.append(loader)
+
+    @classmethod
+    def _run_loaders(cls):
+        while cls._loaders:
+            cls._loaders.pop(0)()
+
     @classmethod
     def get_cls(cls, name: str) -> Type['Agent']:
         """
@@ -102,6 +148,10 @@ class Agent(ABC):
         Raises:
         - AgentNotRegisteredError: If name not registered
         """
+        if name not in cls._registry and name in cls._lazy_registry:
+            importlib.import_module(cls._lazy_registry[name])
+        if name not in cls._registry:
+            cls._run_loaders()
         if name not in cls._registry:
             raise AgentNotRegisteredError(name)
         return cls._registry[name]
@@ -114,6 +164,9 @@ class Agent(ABC):
         Raises:
         - AgentNotRegisteredError: If no agent is registered
         """
-        if not bool(cls._registry):
+        cls._run_loaders()
+        names = list(cls._registry.keys())
+        names += [name for name in cls._lazy_registry if name not in cls._registry]
+        if not names:
             raise AgentNotRegisteredError()
-        return list(cls._registry.keys())
+        return names
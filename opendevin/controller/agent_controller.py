@@ -3,6 +3,8 @@ import traceback
 from typing import Optional, Type
 
 from opendevin.controller.agent import Agent
+from opendevin.controller.state.checkpoint import StateCheckpointer
+from opendevin.controller.state.history import update_history
 from opendevin.controller.state.state import State
 from opendevin.core.config import config
 from opendevin.core.exceptions import (
@@ -10,19 +12,19 @@ from opendevin.core.exceptions import (
     LLMNoActionError,
     LLMResponseError,
     MaxCharsExceedError,
+    MaxTokensExceedError,
 )
 from opendevin.core.logger import opendevin_logger as logger
+from opendevin.core.logger import transcript_session, transcript_step
 from opendevin.core.schema import AgentState
 from opendevin.events import EventSource, EventStream, EventStreamSubscriber
 from opendevin.events.action import (
     Action,
-    AddTaskAction,
     AgentDelegateAction,
     AgentFinishAction,
     AgentRejectAction,
     ChangeAgentStateAction,
     MessageAction,
-    ModifyTaskAction,
     NullAction,
 )
 from opendevin.events.action.commands import CmdKillAction
@@ -32,13 +34,14 @@ from opendevin.events.observation import (
     AgentStateChangedObservation,
     CmdOutputObservation,
     ErrorObservation,
-    NullObservation,
     Observation,
 )
 
 MAX_ITERATIONS = config.max_iterations
 MAX_CHARS = config.llm.max_chars
 MAX_BUDGET_PER_TASK = config.max_budget_per_task
+MAX_TOKENS_PER_TASK = config.max_tokens_per_task
+CHECKPOINT_INTERVAL = config.checkpoint_interval
 
 
 class AgentController:
@@ -50,7 +53,10 @@ class AgentController:
     agent_task: Optional[asyncio.Task] = None
     parent: 'AgentController | None' = None
     delegate: 'AgentController | None' = None
-    _pending_action: Action | None = None
+    # the runnable actions of the agent waiting for their observation
+    _pending_actions: list[Action]
+    checkpointer: StateCheckpointer | None = None
+    _checkpoint_task: asyncio.Task | None = None
 
     def __init__(
         self,
@@ -60,8 +66,11 @@ class AgentController:
         max_iterations: int = MAX_ITERATIONS,
         max_chars: int = MAX_CHARS,
         max_budget_per_task: float | None = MAX_BUDGET_PER_TASK,
+        max_tokens_per_task: int | None = MAX_TOKENS_PER_TASK,
         initial_state: State | None = None,
         is_delegate: bool = False,
+        checkpointer: StateCheckpointer | None = None,
+        checkpoint_interval: int = CHECKPOINT_INTERVAL,
     ):
         """Initializes a new instance of the AgentController class.
 
@@ -72,13 +81,18 @@ class AgentController:
             max_iterations: The maximum number of iterations the agent can run.
             max_chars: The maximum number of characters the agent can output.
             max_budget_per_task: The maximum budget (in USD) allowed per task, beyond which the agent will stop.
+            max_tokens_per_task: The maximum number of tokens the agent can send and receive per task.
             initial_state: The initial state of the controller.
             is_delegate: Whether this controller is a delegate.
+            checkpointer: Saves the state every checkpoint_interval steps, if given.
+            checkpoint_interval: The number of steps between two checkpoints.
         """
         self._step_lock = asyncio.Lock()
         self.id = sid
         self.agent = agent
         self.max_chars = max_chars
+        self.max_tokens_per_task = max_tokens_per_task
+        self._pending_actions = []
         if initial_state is None:
             self.state = State(inputs={}, max_iterations=max_iterations)
         else:
@@ -88,12 +102,21 @@ class AgentController:
             EventStreamSubscriber.AGENT_CONTROLLER, self.on_event, append=is_delegate
         )
         self.max_budget_per_task = max_budget_per_task
+        self.checkpointer = checkpointer
+        self.checkpoint_interval = checkpoint_interval
         if not is_delegate:
             self.agent_task = asyncio.create_task(self._start_step_loop())
 
     async def close(self):
         if self.agent_task is not None:
             self.agent_task.cancel()
+        if self._checkpoint_task is not None:
+            # a checkpoint cut short would leave its slot torn
+            try:
+                await self._checkpoint_task
+            except Exception as e:
+                logger.error(f'Failed to save the checkpoint of {self.id}: {e}')
+            self._checkpoint_task = None
         await self.set_agent_state_to(AgentState.STOPPED)
         self.event_stream.unsubscribe(EventStreamSubscriber.AGENT_CONTROLLER)
 
@@ -111,6 +134,16 @@ class AgentController:
                     f'Task budget exceeded. Current cost: {current_cost}, Max budget: {self.max_budget_per_task}'
                 )
                 await self.set_agent_state_to(AgentState.ERROR)
+        if (
+            self.checkpointer is not None
+            and self.checkpoint_interval > 0
+            and self.state.iteration % self.checkpoint_interval == 0
+            and not self.checkpointer.saving
+        ):
+            # in the background, so that the step doesn't wait on storage
+            self._checkpoint_task = asyncio.create_task(
+                self.checkpointer.save(self.state)
+            )
 
     async def report_error(self, message: str, exception: Exception | None = None):
         """
@@ -125,12 +158,6 @@ class AgentController:
         self.state.error = message
         await self.event_stream.add_event(ErrorObservation(message), EventSource.AGENT)
 
-    async def add_history(self, action: Action, observation: Observation):
-        if isinstance(action, NullAction) and isinstance(observation, NullObservation):
-            return
-        self.state.history.append((action, observation))
-        self.state.updated_info.append((action, observation))
-
     async def _start_step_loop(self):
         logger.info(f'[Agent Controller {self.id}] Starting step loop...')
         while True:
@@ -151,41 +178,35 @@ class AgentController:
             await asyncio.sleep(0.1)
 
     async def on_event(self, event: Event):
+        if isinstance(event, Action) and event.source == EventSource.AGENT:
+            # the actions of the agent are handled by its step, right away
+            return
+        update_history(self.state, event, self._pending_actions)
         if isinstance(event, ChangeAgentStateAction):
             await self.set_agent_state_to(event.agent_state)  # type: ignore
         elif isinstance(event, MessageAction):
             if event.source == EventSource.USER:
                 logger.info(event, extra={'msg_type': 'OBSERVATION'})
-                await self.add_history(event, NullObservation(''))
                 if self.get_agent_state() != AgentState.RUNNING:
                     await self.set_agent_state_to(AgentState.RUNNING)
-            elif event.source == EventSource.AGENT and event.wait_for_response:
-                logger.info(event, extra={'msg_type': 'ACTION'})
-                await self.set_agent_state_to(AgentState.AWAITING_USER_INPUT)
-        elif isinstance(event, AgentDelegateAction):
-            await self.start_delegate(event)
-        elif isinstance(event, AddTaskAction):
-            self.state.root_task.add_subtask(event.parent, event.goal, event.subtasks)
-        elif isinstance(event, ModifyTaskAction):
-            self.state.root_task.set_subtask_state(event.task_id, event.state)
-        elif isinstance(event, AgentFinishAction):
-            self.state.outputs = event.outputs  # type: ignore[attr-defined]
-            await self.set_agent_state_to(AgentState.FINISHED)
-        elif isinstance(event, AgentRejectAction):
-            self.state.outputs = event.outputs  # type: ignore[attr-defined]
-            await self.set_agent_state_to(AgentState.REJECTED)
         elif isinstance(event, Observation):
-            if self._pending_action and self._pending_action.id == event.cause:
-                await self.add_history(self._pending_action, event)
-                self._pending_action = None
-                logger.info(event, extra={'msg_type': 'OBSERVATION'})
-            elif isinstance(event, CmdOutputObservation):
-                await self.add_history(NullAction(), event)
-                logger.info(event, extra={'msg_type': 'OBSERVATION'})
-            elif isinstance(event, AgentDelegateObservation):
-                await self.add_history(NullAction(), event)
+            if self.state.history and self.state.history[-1][1] is event:
                 logger.info(event, extra={'msg_type': 'OBSERVATION'})
 
+    async def handle_action(self, action: Action):
+        """
+        Changes the agent state for an action of the agent, as part of the step that
+        returned it, so the next step sees its effect.
+        """
+        if isinstance(action, MessageAction) and action.wait_for_response:
+            await self.set_agent_state_to(AgentState.AWAITING_USER_INPUT)
+        elif isinstance(action, AgentDelegateAction):
+            await self.start_delegate(action)
+        elif isinstance(action, AgentFinishAction):
+            await self.set_agent_state_to(AgentState.FINISHED)
+        elif isinstance(action, AgentRejectAction):
+            await self.set_agent_state_to(AgentState.REJECTED)
+
     def reset_task(self):
         self.agent.reset()
 
@@ -221,6 +242,7 @@ class AgentController:
             iteration=0,
             max_iterations=self.state.max_iterations,
             num_of_chars=self.state.num_of_chars,
+            num_of_tokens=self.state.num_of_tokens,
             delegate_level=self.state.delegate_level + 1,
         )
         logger.info(f'[Agent Controller {self.id}]: start delegate')
@@ -230,6 +252,7 @@ class AgentController:
             event_stream=self.event_stream,
             max_iterations=self.state.max_iterations,
             max_chars=self.max_chars,
+            max_tokens_per_task=self.max_tokens_per_task,
             initial_state=state,
             is_delegate=True,
         )
@@ -241,9 +264,9 @@ class AgentController:
             await asyncio.sleep(1)
             return
 
-        if self._pending_action:
+        if self._pending_actions:
             logger.info(
-                f'[Agent Controller {self.id}] waiting for pending action: {self._pending_action}'
+                f'[Agent Controller {self.id}] waiting for pending action: {self._pending_actions[-1]}'
             )
             await asyncio.sleep(1)
             return
@@ -269,6 +292,8 @@ class AgentController:
                 )
                 # retrieve delegate result
                 outputs = self.delegate.state.outputs if self.delegate.state else {}
+                # the tokens of the delegate count towards the task too
+                self.state.num_of_tokens = self.delegate.state.num_of_tokens
 
                 # close delegate controller: we must close the delegate controller before adding new events
                 await self.delegate.close()
@@ -284,6 +309,13 @@ class AgentController:
 
         if self.state.num_of_chars > self.max_chars:
             raise MaxCharsExceedError(self.state.num_of_chars, self.max_chars)
+        if (
+            self.max_tokens_per_task is not None
+            and self.state.num_of_tokens > self.max_tokens_per_task
+        ):
+            raise MaxTokensExceedError(
+                self.state.num_of_tokens, self.max_tokens_per_task
+            )
 
         logger.info(
             f'{type(self.agent).__name__} LEVEL {self.state.delegate_level} STEP {self.state.iteration}',
@@ -295,9 +327,11 @@ class AgentController:
             return
 
         self.update_state_before_step()
+        transcript_session.set(self.id)
+        transcript_step.set(self.state.iteration)
         action: Action = NullAction()
         try:
-            action = self.agent.step(self.state)
+            action = await self.agent.astep(self.state)
             if action is None:
                 raise LLMNoActionError('No action was returned')
         except (LLMMalformedActionError, LLMNoActionError, LLMResponseError) as e:
@@ -309,13 +343,11 @@ class AgentController:
         logger.info(action, extra={'msg_type': 'ACTION'})
 
         await self.update_state_after_step()
-        if action.runnable:
-            self._pending_action = action
-        else:
-            await self.add_history(action, NullObservation(''))
-
+        # before the action is sent, so that its observation finds it pending
+        update_history(self.state, action, self._pending_actions)
         if not isinstance(action, NullAction):
             await self.event_stream.add_event(action, EventSource.AGENT)
+        await self.handle_action(action)
 
         if self._is_stuck():
             await self.report_error('Agent got stuck in a loop')
@@ -410,7 +442,7 @@ class AgentController:
             f'AgentController(id={self.id}, agent={self.agent!r}, '
             f'event_stream={self.event_stream!r}, '
             f'state={self.state!r}, agent_task={self.agent_task!r}, '
-            f'delegate={self.delegate!r}, _pending_action={self._pending_action!r})'
+            f'delegate={self.delegate!r}, _pending_actions={self._pending_actions!r})'
         )
 
     def _eq_no_pid(self, obj1, obj2):
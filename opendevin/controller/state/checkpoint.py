@@ -0,0 +1,296 @@
+import asyncio
+import copy
+import json
+from typing import Callable, Iterable
+
+from opendevin.controller.state.history import update_history
+from opendevin.controller.state.state import RESUMABLE_STATES, State
+from opendevin.controller.state.task import RootTask, Task
+from opendevin.core.logger import opendevin_logger as logger
+from opendevin.core.metrics import Metrics
+from opendevin.core.schema import AgentState
+from opendevin.events import EventSource, EventStream
+from opendevin.events.action import Action, AgentDelegateAction
+from opendevin.events.event import Event
+from opendevin.events.observation import (
+    AgentDelegateObservation,
+    AgentStateChangedObservation,
+    CmdOutputObservation,
+    Observation,
+)
+from opendevin.events.serialization.event import event_from_dict, event_to_dict
+from opendevin.storage import FileStore, get_file_store
+from opendevin.storage.files import get_executor
+
+CHECKPOINT_VERSION = 1
+# checkpoints are written to alternating slots, so a torn write never loses the previous one
+CHECKPOINT_SLOTS = 2
+
+
+def _event_to_ref(event: Event) -> dict:
+    # events of the stream are stored by id, the others (like the NullObservations
+    # the controller pairs actions with) inline
+    if event.id is not None and event.id >= 0:
+        return {'id': event.id}
+    return {'event': event_to_dict(event)}
+
+
+def _event_from_ref(ref: dict, get_event: Callable[[int], Event]) -> Event:
+    if 'id' in ref:
+        return get_event(ref['id'])
+    return event_from_dict(ref['event'])
+
+
+def _max_ref_id(refs: Iterable[dict]) -> int:
+    return max((ref['id'] for ref in refs if 'id' in ref), default=-1)
+
+
+def _referenced_ids(data: dict) -> set[int]:
+    refs = [ref for entry in data['history'] for ref in entry]
+    refs += data['background_commands_obs']
+    return {ref['id'] for ref in refs if 'id' in ref}
+
+
+def _task_from_dict(parent: Task, data: dict) -> Task:
+    task = Task(parent, data['goal'])
+    task.state = data['state']
+    task.subtasks = [_task_from_dict(task, subtask) for subtask in data['subtasks']]
+    return task
+
+
+def state_to_dict(state: State, event_id: int) -> dict:
+    """
+    Serializes a state as of the given event id. Events are referenced by their id,
+    and history entries referencing later events are left out, to be replayed.
+    """
+    history = []
+    for action, observation in state.history:
+        refs = [_event_to_ref(action), _event_to_ref(observation)]
+        if _max_ref_id(refs) > event_id:
+            break
+        history.append(refs)
+    metrics = state.metrics.get()
+    return {
+        'root_task': state.root_task.to_dict(),
+        'iteration': state.iteration,
+        'max_iterations': state.max_iterations,
+        'num_of_chars': state.num_of_chars,
+        'num_of_tokens': state.num_of_tokens,
+        'background_commands_obs': [
+            _event_to_ref(obs) for obs in state.background_commands_obs
+        ],
+        'history': history,
+        'inputs': copy.deepcopy(state.inputs),
+        'outputs': copy.deepcopy(state.outputs),
+        'error': state.error,
+        'agent_state': state.agent_state.value,
+        'resume_state': state.resume_state.value if state.resume_state else None,
+        'metrics': {
+            'accumulated_cost': metrics['accumulated_cost'],
+            'costs': list(metrics['costs']),
+            'prompt_tokens': metrics['prompt_tokens'],
+            'completion_tokens': metrics['completion_tokens'],
+        },
+        'delegate_level': state.delegate_level,
+    }
+
+
+def state_from_dict(data: dict, get_event: Callable[[int], Event]) -> State:
+    root_task = RootTask()
+    root_task.subtasks = [
+        _task_from_dict(root_task, subtask) for subtask in data['root_task']['subtasks']
+    ]
+    root_task.state = data['root_task']['state']
+    metrics = Metrics()
+    for cost in data['metrics']['costs']:
+        metrics.add_cost(cost)
+    metrics.accumulated_cost = data['metrics']['accumulated_cost']
+    metrics.add_tokens(
+        data['metrics'].get('prompt_tokens', 0),
+        data['metrics'].get('completion_tokens', 0),
+    )
+    history = []
+    for action_ref, observation_ref in data['history']:
+        action = _event_from_ref(action_ref, get_event)
+        observation = _event_from_ref(observation_ref, get_event)
+        assert isinstance(action, Action) and isinstance(observation, Observation)
+        history.append((action, observation))
+    background_commands_obs = []
+    for ref in data['background_commands_obs']:
+        obs = _event_from_ref(ref, get_event)
+        assert isinstance(obs, CmdOutputObservation)
+        background_commands_obs.append(obs)
+    return State(
+        root_task=root_task,
+        iteration=data['iteration'],
+        max_iterations=data['max_iterations'],
+        num_of_chars=data['num_of_chars'],
+        num_of_tokens=data.get('num_of_tokens', 0),
+        background_commands_obs=background_commands_obs,
+        history=history,
+        inputs=data['inputs'],
+        outputs=data['outputs'],
+        error=data['error'],
+        agent_state=AgentState(data['agent_state']),
+        resume_state=AgentState(data['resume_state']) if data['resume_state'] else None,
+        metrics=metrics,
+        delegate_level=data['delegate_level'],
+    )
+
+
+def replay_events(
+    state: State, events: Iterable[Event], get_event: Callable[[int], Event]
+):
+    """
+    Applies events that came after a checkpoint to its state, like the agent
+    controller does as they come. Events of delegates are skipped, as the
+    controller doesn't see them.
+    """
+    pending: list[Action] = []
+    delegates = 0
+    for event in events:
+        if delegates:
+            if isinstance(event, AgentDelegateAction):
+                delegates += 1
+            elif isinstance(event, AgentDelegateObservation):
+                delegates -= 1
+            if delegates:
+                continue
+        if isinstance(event, Action) and event.source == EventSource.AGENT:
+            # the controller counts its steps, each of which has an action
+            state.iteration += 1
+            if isinstance(event, AgentDelegateAction):
+                delegates = 1
+        elif isinstance(event, AgentStateChangedObservation):
+            state.agent_state = AgentState(event.agent_state)
+        elif (
+            isinstance(event, Observation)
+            and event.cause is not None
+            and all(action.id != event.cause for action in pending)
+        ):
+            # the action may have been pending when the checkpoint was saved
+            try:
+                action = get_event(event.cause)
+            except FileNotFoundError:
+                action = None
+            if (
+                isinstance(action, Action)
+                and action.runnable
+                and action.source == EventSource.AGENT
+            ):
+                pending.append(action)
+        update_history(state, event, pending)
+
+
+class StateCheckpointer:
+    """
+    Saves and restores the state of a session's agent as versioned JSON checkpoints.
+
+    A checkpoint records the id of the last event it covers, and references the
+    events of the history by id, so it stays small. Restoring loads the latest
+    checkpoint and replays the events of the log that came after it.
+    Encoding and writing happen off the event loop.
+    """
+
+    sid: str
+    event_stream: EventStream
+    file_store: FileStore
+
+    def __init__(self, sid: str, event_stream: EventStream):
+        self.sid = sid
+        self.event_stream = event_stream
+        self.file_store = get_file_store()
+        # the sequence number of the latest checkpoint, once known
+        self._seq: int | None = None
+        self._lock = asyncio.Lock()
+
+    def _get_filename(self, slot: int) -> str:
+        return f'sessions/{self.sid}/checkpoint.{slot}.json'
+
+    @property
+    def saving(self) -> bool:
+        return self._lock.locked()
+
+    async def save(self, state: State):
+        async with self._lock:
+            if self._seq is None:
+                latest = await self._load()
+                self._seq = latest['seq'] if latest is not None else -1
+            # taken together, as events handled after the state was serialized
+            # are replayed on restore
+            event_id = self.event_stream.latest_id
+            data = state_to_dict(state, event_id)
+            # the checkpoint must not reference events that aren't persisted yet
+            await self.event_stream.flush()
+            seq = self._seq + 1
+            checkpoint = {
+                'version': CHECKPOINT_VERSION,
+                'seq': seq,
+                'event_id': event_id,
+                'state': data,
+            }
+            loop = asyncio.get_running_loop()
+            content = await loop.run_in_executor(get_executor(), json.dumps, checkpoint)
+            await self.file_store.awrite(
+                self._get_filename(seq % CHECKPOINT_SLOTS), content
+            )
+            self._seq = seq
+
+    async def _load(self) -> dict | None:
+        latest: dict | None = None
+        loop = asyncio.get_running_loop()
+        for slot in range(CHECKPOINT_SLOTS):
+            try:
+                content = await self.file_store.aread(self._get_filename(slot))
+                checkpoint = await loop.run_in_executor(
+                    get_executor(), json.loads, content
+                )
+            except FileNotFoundError:
+                continue
+            except ValueError as e:
+                logger.warning(f'Ignoring invalid checkpoint of {self.sid}: {e}')
+                continue
+            if checkpoint.get('version') != CHECKPOINT_VERSION:
+                logger.warning(
+                    f'Ignoring checkpoint of {self.sid} with unsupported version {checkpoint.get("version")}'
+                )
+                continue
+            if latest is None or checkpoint['seq'] > latest['seq']:
+                latest = checkpoint
+        return latest
+
+    async def restore(self) -> State | None:
+        """
+        Returns the state as of the latest event of the log, or None if the session
+        has no checkpoint.
+        """
+        checkpoint = await self._load()
+        if checkpoint is None:
+            self._seq = -1
+            return None
+        self._seq = checkpoint['seq']
+        # read the referenced events in one pass over the log, rather than one by one
+        ids = _referenced_ids(checkpoint['state'])
+        events: dict[int, Event] = {}
+        if ids:
+            async for event in self.event_stream.aget_events(min(ids), max(ids)):
+                if event.id in ids:
+                    events[event.id] = event
+
+        def get_event(id: int) -> Event:
+            return events[id] if id in events else self.event_stream.get_event(id)
+
+        state = state_from_dict(checkpoint['state'], get_event)
+        tail = [
+            event
+            async for event in self.event_stream.aget_events(
+                start_id=checkpoint['event_id'] + 1
+            )
+        ]
+        replay_events(state, tail, get_event)
+        if state.agent_state in RESUMABLE_STATES:
+            state.resume_state = state.agent_state
+        else:
+            state.resume_state = None
+        state.agent_state = AgentState.LOADING
+        return state
@@ -0,0 +1,66 @@
+from opendevin.controller.state.state import State
+from opendevin.core.logger import opendevin_logger as logger
+from opendevin.events import EventSource
+from opendevin.events.action import (
+    Action,
+    AddTaskAction,
+    AgentFinishAction,
+    AgentRejectAction,
+    MessageAction,
+    ModifyTaskAction,
+    NullAction,
+)
+from opendevin.events.event import Event
+from opendevin.events.observation import (
+    AgentDelegateObservation,
+    CmdOutputObservation,
+    NullObservation,
+    Observation,
+)
+
+
+def add_history(state: State, action: Action, observation: Observation):
+    if isinstance(action, NullAction) and isinstance(observation, NullObservation):
+        return
+    state.history.append((action, observation))
+    state.updated_info.append((action, observation))
+
+
+def update_history(state: State, event: Event, pending: list[Action]):
+    """
+    Updates the history, the tasks and the outputs of a state with an event of its
+    agent. The agent controller calls it with its events as they come, and a
+    restored checkpoint with the events of the log that came after it.
+
+    Parameters:
+    - state (State): The state to update
+    - event (Event): An action of the agent or the user, or an observation
+    - pending (list): The runnable actions of the agent waiting for their observation;
+      they are added to the history along with it
+    """
+    if isinstance(event, Action):
+        if event.source == EventSource.USER:
+            if isinstance(event, MessageAction):
+                add_history(state, event, NullObservation(''))
+            return
+        if event.runnable:
+            pending.append(event)
+        else:
+            add_history(state, event, NullObservation(''))
+        try:
+            if isinstance(event, AddTaskAction):
+                state.root_task.add_subtask(event.parent, event.goal, event.subtasks)
+            elif isinstance(event, ModifyTaskAction):
+                state.root_task.set_subtask_state(event.task_id, event.state)
+        except Exception as e:
+            logger.warning(f'Could not update the tasks with {event}: {e}')
+        if isinstance(event, (AgentFinishAction, AgentRejectAction)):
+            state.outputs = event.outputs  # type: ignore[attr-defined]
+    elif isinstance(event, Observation):
+        for action in pending:
+            if action.id == event.cause:
+                pending.remove(action)
+                add_history(state, action, event)
+                return
+        if isinstance(event, (CmdOutputObservation, AgentDelegateObservation)):
+            add_history(state, NullAction(), event)
@@ -31,6 +31,8 @@ class State:
     max_iterations: int = 100
     # number of characters we have sent to and received from LLM so far for current task
     num_of_chars: int = 0
+    # number of tokens we have sent to and received from LLM so far for current task
+    num_of_tokens: int = 0
     background_commands_obs: list[CmdOutputObservation] = field(default_factory=list)
     history: list[tuple[Action, Observation]] = field(default_factory=list)
     updated_info: list[tuple[Action, Observation]] = field(default_factory=list)
@@ -43,21 +45,21 @@ class State:
     # root agent has level 0, and every delegate increases the level by one
     delegate_level: int = 0
 
-    def save_to_session(self, sid: str):
+    async def save_to_session(self, sid: str):
         fs = get_file_store()
         pickled = pickle.dumps(self)
         encoded = base64.b64encode(pickled).decode('utf-8')
         try:
-            fs.write(f'sessions/{sid}/agent_state.pkl', encoded)
+            await fs.awrite(f'sessions/{sid}/agent_state.pkl', encoded)
         except Exception as e:
             logger.error(f'Failed to save state to session: {e}')
             raise e
 
     @staticmethod
-    def restore_from_session(sid: str) -> 'State':
+    async def restore_from_session(sid: str) -> 'State':
         fs = get_file_store()
         try:
-            encoded = fs.read(f'sessions/{sid}/agent_state.pkl')
+            encoded = await fs.aread(f'sessions/{sid}/agent_state.pkl')
             pickled = base64.b64decode(encoded)
             state = pickle.loads(pickled)
         except Exception as e:
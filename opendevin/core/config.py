@@ -28,6 +28,8 @@ class LLMConfig(metaclass=Singleton):
         model: The model to use.
         api_key: The API key to use.
         base_url: The base URL for the API. This is necessary for local LLMs. It is also used for Azure embeddings.
+        base_urls: Comma-separated base URLs of several endpoints serving the model, like replicas of a local server. Calls go to the fastest and least busy one, and fail over to the others when it is unreachable.
+        api_keys: Comma-separated API keys of the endpoints in base_urls, in the same order. Endpoints without one use api_key.
         api_version: The version of the API.
         embedding_model: The embedding model to use.
         embedding_base_url: The base URL for the embedding API.
@@ -47,11 +49,28 @@ class LLMConfig(metaclass=Singleton):
         max_output_tokens: The maximum number of output tokens. This is sent to the LLM.
         input_cost_per_token: The cost per input token. This will available in logs for the user to check.
         output_cost_per_token: The cost per output token. This will available in logs for the user to check.
+        rate_limit_requests_per_minute: The maximum number of calls per minute to the provider and model, across the sessions of the machine. 0 is unlimited.
+        rate_limit_tokens_per_minute: The maximum number of prompt tokens per minute sent to the provider and model. 0 is unlimited.
+        rate_limit_max_concurrency: The maximum number of concurrent calls to the provider and model. It is halved on rate limit errors and grows back on successes. 0 is unlimited.
+        rate_limit_state_dir: A directory where processes share their rate limits. Empty keeps them per process.
+        response_cache: Whether LLM responses are cached on disk, and identical calls answered from the cache. Only calls with temperature 0 are cached, unless response_cache_force is set.
+        response_cache_path: The path of the SQLite database of the response cache. It can be shared by several processes.
+        response_cache_max_bytes: The maximum size, in bytes of compressed responses, of the response cache.
+        response_cache_ttl: How long, in seconds, cached responses are used.
+        response_cache_force: Whether to cache responses even for calls with a non-zero temperature.
+        hedge_percentile: The percentile of the latency of recent calls after which a call still without a response is sent again, to the same or another endpoint, and the first response used. For streams, the latency is that of the first chunk. 0 disables hedging, and 95 sends about 1 call in 20 twice.
+        hedge_min_delay: The minimum time to wait for a call before sending it again, in seconds.
+        tier_models: Comma-separated tier=model pairs, to send the calls of a tier to a smaller or local model, like condense=gpt-4o-mini,delegate=ollama/llama3. The tiers are condense (summaries of the memory), plan (the steps of the PlannerAgent) and delegate (the steps of micro agents). Responses of a tier model that can't be parsed are asked again to the main model.
+        tier_base_urls: Comma-separated tier=url pairs, the base URLs of the models in tier_models that need one.
+        tier_api_keys: Comma-separated tier=key pairs, the API keys of the models in tier_models. Models without one use api_key.
+        stream: Whether agents that support it stream the responses, so the UI shows them as they are generated and the action runs as soon as it is complete.
     """
 
     model: str = 'gpt-4o'
     api_key: str | None = None
     base_url: str | None = None
+    base_urls: str = ''
+    api_keys: str = ''
     api_version: str | None = None
     embedding_model: str = 'local'
     embedding_base_url: str | None = None
@@ -71,6 +90,21 @@ class LLMConfig(metaclass=Singleton):
     max_output_tokens: int | None = None
     input_cost_per_token: float | None = None
     output_cost_per_token: float | None = None
+    rate_limit_requests_per_minute: int = 0
+    rate_limit_tokens_per_minute: int = 0
+    rate_limit_max_concurrency: int = 0
+    rate_limit_state_dir: str = ''
+    response_cache: bool = False
+    response_cache_path: str = '/tmp/cache/llm_responses.sqlite'
+    response_cache_max_bytes: int = 1024 * 1024 * 1024
+    response_cache_ttl: int = 7 * 24 * 60 * 60
+    response_cache_force: bool = False
+    hedge_percentile: float = 0
+    hedge_min_delay: float = 1.0
+    tier_models: str = ''
+    tier_base_urls: str = ''
+    tier_api_keys: str = ''
+    stream: bool = False
 
     def defaults_to_dict(self) -> dict:
         """
@@ -87,7 +121,13 @@ class LLMConfig(metaclass=Singleton):
             attr_name = f.name
             attr_value = getattr(self, f.name)
 
-            if attr_name in ['api_key', 'aws_access_key_id', 'aws_secret_access_key']:
+            if attr_name in [
+                'api_key',
+                'api_keys',
+                'tier_api_keys',
+                'aws_access_key_id',
+                'aws_secret_access_key',
+            ]:
                 attr_value = '******' if attr_value else None
 
             attr_str.append(f'{attr_name}={repr(attr_value)}')
@@ -138,6 +178,17 @@ class AppConfig(metaclass=Singleton):
         runtime: The runtime environment.
         file_store: The file store to use.
         file_store_path: The path to the file store.
+        file_store_cache_dir: A local directory where the s3 file store caches the files it reads. Empty disables the cache.
+        file_store_cache_size: The maximum size, in bytes, of the s3 file store cache.
+        event_stream_flush_interval: How often, in seconds, buffered events are written to the file store. 0 writes every event immediately.
+        event_stream_max_batch_size: The number of buffered events that triggers a write before the flush interval is up.
+        event_stream_fsync: When to fsync the event log. Options are: none, batch (once per write), always (every event, before notifying subscribers).
+        event_stream_queue_size: The number of events that can wait for each event stream subscriber.
+        event_stream_overflow_policy: What happens when a subscriber's queue is full. Options are: block, drop_oldest, coalesce.
+        event_cache_max_entries: The number of decoded events kept in memory across all sessions. 0 disables the cache.
+        event_cache_max_bytes: The approximate size, in bytes of serialized events, of the decoded events kept in memory.
+        checkpoint_interval: The number of agent steps between two checkpoints of the agent state. 0 only checkpoints when the session closes.
+        event_blob_threshold: Event values longer than this many characters once serialized (like long command outputs or screenshots) are stored compressed and deduplicated, apart from the event log. 0 keeps everything in the log.
         workspace_base: The base path for the workspace. Defaults to ./workspace as an absolute path.
         workspace_mount_path: The path to mount the workspace. This is set to the workspace base by default.
         workspace_mount_path_in_sandbox: The path to mount the workspace in the sandbox. Defaults to /workspace.
@@ -147,6 +198,7 @@ class AppConfig(metaclass=Singleton):
         run_as_devin: Whether to run as devin.
         max_iterations: The maximum number of iterations.
         max_budget_per_task: The maximum budget allowed per task, beyond which the agent will stop.
+        max_tokens_per_task: The maximum number of tokens sent to and received from the LLM per task, beyond which the agent will stop.
         e2b_api_key: The E2B API key.
         sandbox_type: The type of sandbox to use. Options are: ssh, exec, e2b, local.
         use_host_network: Whether to use the host network.
@@ -163,6 +215,19 @@ class AppConfig(metaclass=Singleton):
     runtime: str = 'server'
     file_store: str = 'memory'
     file_store_path: str = '/tmp/file_store'
+    file_store_cache_dir: str = ''
+    file_store_cache_size: int = 1024 * 1024 * 1024
+    event_stream_flush_interval: float = 0.1
+    event_stream_max_batch_size: int = 100
+    event_stream_fsync: str = 'none'  # Can be 'none', 'batch', or 'always'
+    event_stream_queue_size: int = 1000
+    event_stream_overflow_policy: str = (
+        'block'  # Can be 'block', 'drop_oldest', or 'coalesce'
+    )
+    event_cache_max_entries: int = 10000
+    event_cache_max_bytes: int = 64 * 1024 * 1024
+    event_blob_threshold: int = 16 * 1024
+    checkpoint_interval: int = 10
     workspace_base: str = os.path.join(os.getcwd(), 'workspace')
     workspace_mount_path: str = (
         UndefinedString.UNDEFINED  # this path should always be set when config is fully loaded
@@ -178,6 +243,7 @@ class AppConfig(metaclass=Singleton):
     run_as_devin: bool = True
     max_iterations: int = 100
     max_budget_per_task: float | None = None
+    max_tokens_per_task: int | None = None
     e2b_api_key: str = ''
     sandbox_type: str = 'ssh'  # Can be 'ssh', 'exec', or 'e2b'
     use_host_network: bool = False
@@ -7,6 +7,15 @@ class MaxCharsExceedError(Exception):
         super().__init__(message)
 
 
+class MaxTokensExceedError(Exception):
+    def __init__(self, num_of_tokens=None, max_tokens_limit=None):
+        if num_of_tokens is not None and max_tokens_limit is not None:
+            message = f'Number of tokens {num_of_tokens} exceeds the limit of the task: {max_tokens_limit}'
+        else:
+            message = 'Number of tokens exceeds the limit of the task'
+        super().__init__(message)
+
+
 class AgentNoInstructionError(Exception):
     def __init__(self, message='Instruction must be provided'):
         super().__init__(message)
@@ -1,9 +1,16 @@
+import atexit
+import gzip
+import json
 import logging
 import os
+import queue
 import re
+import shutil
 import sys
 import traceback
+from contextvars import ContextVar
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from typing import Literal, Mapping
 
 from termcolor import colored
@@ -12,6 +19,10 @@ from opendevin.core.config import config
 
 DISABLE_COLOR_PRINTING = config.disable_color
 
+# the LLM transcript is rotated at this size, keeping that many compressed files
+TRANSCRIPT_MAX_BYTES = 100 * 1024 * 1024
+TRANSCRIPT_BACKUP_COUNT = 10
+
 ColorType = Literal[
     'red',
     'green',
@@ -69,13 +80,13 @@ file_formatter = logging.Formatter(
     '%(asctime)s - %(name)s:%(levelname)s: %(filename)s:%(lineno)s - %(message)s',
     datefmt='%H:%M:%S',
 )
-llm_formatter = logging.Formatter('%(message)s')
 
 
 class SensitiveDataFilter(logging.Filter):
     def filter(self, record):
         # start with attributes
         sensitive_patterns = [
+            'api_keys',
             'api_key',
             'aws_access_key_id',
             'aws_secret_access_key',
@@ -100,7 +111,8 @@ class SensitiveDataFilter(logging.Filter):
         record.args = ()
 
         for attr in sensitive_patterns:
-            pattern = rf"{attr}='?([\w-]+)'?"
+            # lists of values are comma-separated, maybe as name=value pairs
+            pattern = rf"{attr}='?([\w=-]+(,[\w=-]+)*)'?"
             msg = re.sub(pattern, f"{attr}='******'", msg)
 
         # passed with msg
@@ -172,85 +184,71 @@ logging.getLogger('LiteLLM Router').disabled = True
 logging.getLogger('LiteLLM Proxy').disabled = True
 
 
-class LlmFileHandler(logging.FileHandler):
+class JsonFormatter(logging.Formatter):
     """
-    # LLM prompt and response logging
+    Formats the transcript of a record as a line of JSON.
     """
 
-    def __init__(self, filename, mode='a', encoding='utf-8', delay=False):
-        """
-        Initializes an instance of LlmFileHandler.
-
-        Args:
-            filename (str): The name of the log file.
-            mode (str, optional): The file mode. Defaults to 'a'.
-            encoding (str, optional): The file encoding. Defaults to None.
-            delay (bool, optional): Whether to delay file opening. Defaults to False.
-        """
-        self.filename = filename
-        self.message_counter = 1
-        if config.debug:
-            self.session = datetime.now().strftime('%y-%m-%d_%H-%M')
-        else:
-            self.session = 'default'
-        self.log_directory = os.path.join(os.getcwd(), 'logs', 'llm', self.session)
-        os.makedirs(self.log_directory, exist_ok=True)
-        if not config.debug:
-            # Clear the log directory if not in debug mode
-            for file in os.listdir(self.log_directory):
-                file_path = os.path.join(self.log_directory, file)
-                try:
-                    os.unlink(file_path)
-                except Exception as e:
-                    opendevin_logger.error(
-                        'Failed to delete %s. Reason: %s', file_path, e
-                    )
-        filename = f'{self.filename}_{self.message_counter:03}.log'
-        self.baseFilename = os.path.join(self.log_directory, filename)
-        super().__init__(self.baseFilename, mode, encoding, delay)
-
-    def emit(self, record):
-        """
-        Emits a log record.
-
-        Args:
-            record (logging.LogRecord): The log record to emit.
-        """
-        filename = f'{self.filename}_{self.message_counter:03}.log'
-        self.baseFilename = os.path.join(self.log_directory, filename)
-        self.stream = self._open()
-        super().emit(record)
-        self.stream.close()
-        opendevin_logger.debug('Logging to %s', self.baseFilename)
-        self.message_counter += 1
-
-
-def get_llm_prompt_file_handler():
-    """
-    Returns a file handler for LLM prompt logging.
-    """
-    llm_prompt_file_handler = LlmFileHandler('prompt', delay=True)
-    llm_prompt_file_handler.setFormatter(llm_formatter)
-    llm_prompt_file_handler.setLevel(logging.DEBUG)
-    return llm_prompt_file_handler
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(),
+            **getattr(record, 'transcript', {'message': record.getMessage()}),
+        }
+        return json.dumps(entry, ensure_ascii=False, default=str)
 
 
-def get_llm_response_file_handler():
+class CompressedRotatingFileHandler(RotatingFileHandler):
     """
-    Returns a file handler for LLM response logging.
+    Rotates files like RotatingFileHandler, and compresses the rotated ones.
     """
-    llm_response_file_handler = LlmFileHandler('response', delay=True)
-    llm_response_file_handler.setFormatter(llm_formatter)
-    llm_response_file_handler.setLevel(logging.DEBUG)
-    return llm_response_file_handler
-
 
-llm_prompt_logger = logging.getLogger('prompt')
-llm_prompt_logger.propagate = False
-llm_prompt_logger.setLevel(logging.DEBUG)
-llm_prompt_logger.addHandler(get_llm_prompt_file_handler())
-
-llm_response_logger = logging.getLogger('response')
-llm_response_logger.propagate = False
-llm_response_logger.setLevel(logging.DEBUG)
-llm_response_logger.addHandler(get_llm_response_file_handler())
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(
+            filename,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding='utf-8',
+            delay=True,
+        )
+        self.namer = lambda name: f'{name}.gz'
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+def get_llm_transcript_handler(log_dir=None):
+    """
+    Returns a file handler for the LLM transcript.
+    """
+    log_dir = os.path.join(os.getcwd(), 'logs', 'llm') if log_dir is None else log_dir
+    os.makedirs(log_dir, exist_ok=True)
+    transcript_handler = CompressedRotatingFileHandler(
+        os.path.join(log_dir, 'transcript.jsonl'),
+        TRANSCRIPT_MAX_BYTES,
+        TRANSCRIPT_BACKUP_COUNT,
+    )
+    transcript_handler.setFormatter(JsonFormatter())
+    return transcript_handler
+
+
+# the session and step of the LLM calls made in the current context
+transcript_session: ContextVar[str] = ContextVar('transcript_session', default='')
+transcript_step: ContextVar[int] = ContextVar('transcript_step', default=0)
+
+# LLM prompt and response logging, in debug mode. The records are written to the
+# file by a thread, so the calls don't wait for the disk
+llm_transcript_logger = logging.getLogger('llm_transcript')
+llm_transcript_logger.propagate = False
+llm_transcript_logger.setLevel(logging.DEBUG if config.debug else logging.WARNING)
+if config.debug:
+    _transcript_queue: queue.SimpleQueue = queue.SimpleQueue()
+    llm_transcript_logger.addHandler(QueueHandler(_transcript_queue))
+    _transcript_listener = QueueListener(
+        _transcript_queue, get_llm_transcript_handler()
+    )
+    _transcript_listener.start()
+    atexit.register(_transcript_listener.stop)
@@ -10,7 +10,12 @@ from opendevin.controller.state.state import State
 from opendevin.core.config import args, get_llm_config_arg
 from opendevin.core.logger import opendevin_logger as logger
 from opendevin.core.schema import AgentState
-from opendevin.events import EventSource, EventStream, EventStreamSubscriber
+from opendevin.events import (
+    EventFilter,
+    EventSource,
+    EventStream,
+    EventStreamSubscriber,
+)
 from opendevin.events.action import MessageAction
 from opendevin.events.event import Event
 from opendevin.events.observation import AgentStateChangedObservation
@@ -124,7 +129,11 @@ async def main(
                 action = MessageAction(content=message)
                 await event_stream.add_event(action, EventSource.USER)
 
-    event_stream.subscribe(EventStreamSubscriber.MAIN, on_event)
+    event_stream.subscribe(
+        EventStreamSubscriber.MAIN,
+        on_event,
+        event_filter=EventFilter(include_types=(AgentStateChangedObservation,)),
+    )
     while controller.get_agent_state() not in [
         AgentState.FINISHED,
         AgentState.REJECTED,
@@ -136,6 +145,7 @@ async def main(
 
     await controller.close()
     runtime.close()
+    await event_stream.close()
     return controller.get_state()
 
 
@@ -3,11 +3,28 @@ class Metrics:
     Metrics class can record various metrics during running and evaluation.
     Currently we define the following metrics:
         accumulated_cost: the total cost (USD $) of the current LLM.
+        prompt_tokens, completion_tokens: the tokens sent to and generated by the LLM, as it reported them.
+        queue_wait_time: the time (in seconds) LLM calls waited for the rate limits.
+        cache_hits, cache_misses: the LLM calls answered by the response cache, or not.
+        cache_bytes_saved: the size of the responses answered by the cache.
+        hedged_requests: the LLM calls sent again because they were slow, and hedge_wins those the second call answered first.
+        hedge_cost: the cost (USD $) of the calls that lost to their duplicate, included in accumulated_cost.
+        escalations: the calls of a cheaper tier made again with the main LLM, because their response couldn't be parsed.
     """
 
     def __init__(self) -> None:
         self._accumulated_cost: float = 0.0
         self._costs: list[float] = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.queue_wait_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_bytes_saved = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self.hedge_cost = 0.0
+        self.escalations = 0
 
     @property
     def accumulated_cost(self) -> float:
@@ -29,11 +46,52 @@ class Metrics:
         self._accumulated_cost += value
         self._costs.append(value)
 
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int) -> None:
+        if prompt_tokens < 0 or completion_tokens < 0:
+            raise ValueError('Added tokens cannot be negative.')
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    def add_queue_wait(self, seconds: float) -> None:
+        self.queue_wait_time += seconds
+
+    def add_cache_hit(self, size: int) -> None:
+        self.cache_hits += 1
+        self.cache_bytes_saved += size
+
+    def add_cache_miss(self) -> None:
+        self.cache_misses += 1
+
+    def add_hedge(self) -> None:
+        self.hedged_requests += 1
+
+    def add_hedge_win(self) -> None:
+        self.hedge_wins += 1
+
+    def add_hedge_cost(self, value: float) -> None:
+        self.hedge_cost += value
+
+    def add_escalation(self) -> None:
+        self.escalations += 1
+
     def get(self):
         """
         Return the metrics in a dictionary.
         """
-        return {'accumulated_cost': self._accumulated_cost, 'costs': self._costs}
+        return {
+            'accumulated_cost': self._accumulated_cost,
+            'costs': self._costs,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'queue_wait_time': self.queue_wait_time,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_bytes_saved': self.cache_bytes_saved,
+            'hedged_requests': self.hedged_requests,
+            'hedge_wins': self.hedge_wins,
+            'hedge_cost': self.hedge_cost,
+            'escalations': self.escalations,
+        }
 
     def log(self):
         """
@@ -1,8 +1,10 @@
 from .event import Event, EventSource
+from .filter import EventFilter
 from .stream import EventStream, EventStreamSubscriber
 
 __all__ = [
     'Event',
+    'EventFilter',
     'EventSource',
     'EventStream',
     'EventStreamSubscriber',
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+from opendevin.core.config import config
+
+from .event import Event
+
+
+class EventCache:
+    """
+    Least recently used cache of decoded events, keyed by session id and event id.
+
+    It is bounded both by its number of entries and by the approximate size of the
+    cached events, measured as the length of their serialized form. A limit of 0
+    disables the cache.
+    """
+
+    max_entries: int
+    max_bytes: int
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, int], tuple[Event, int]] = OrderedDict()
+        # the cached event ids of each session, so that a session can be invalidated
+        # without going through the whole cache
+        self._sessions: dict[str, set[int]] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, sid: str, id: int) -> Event | None:
+        key = (sid, id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, sid: str, id: int, event: Event, size: int):
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        key = (sid, id)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (event, size)
+        self._sessions.setdefault(sid, set()).add(id)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: tuple[str, int]):
+        _, size = self._entries.pop(key)
+        self.size -= size
+        sid, id = key
+        ids = self._sessions[sid]
+        ids.discard(id)
+        if not ids:
+            del self._sessions[sid]
+
+    def invalidate(self, sid: str):
+        """
+        Drops the cached events of a session.
+        """
+        for id in self._sessions.pop(sid, ()):
+            _, size = self._entries.pop((sid, id))
+            self.size -= size
+
+    def clear(self):
+        self._entries.clear()
+        self._sessions.clear()
+        self.size = 0
+
+    def get_metrics(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+_event_cache: EventCache | None = None
+
+
+def get_event_cache() -> EventCache:
+    global _event_cache
+    if _event_cache is None:
+        _event_cache = EventCache(
+            config.event_cache_max_entries, config.event_cache_max_bytes
+        )
+    return _event_cache
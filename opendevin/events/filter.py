@@ -0,0 +1,39 @@
+from dataclasses import dataclass
+
+from .event import Event, EventSource
+
+
+@dataclass(frozen=True)
+class EventFilter:
+    """
+    Selects the events delivered to an event stream subscriber.
+
+    An event matches if it is an instance of one of include_types (when set), none of
+    exclude_types, comes from one of sources (when set), and its `action` or
+    `observation` type string is in action_types or observation_types (when either is set).
+
+    Matching only depends on the event class and source, so the event stream can
+    precompute where each kind of event goes.
+    """
+
+    include_types: tuple[type[Event], ...] = ()
+    exclude_types: tuple[type[Event], ...] = ()
+    sources: tuple[EventSource, ...] = ()
+    action_types: tuple[str, ...] = ()
+    observation_types: tuple[str, ...] = ()
+
+    def matches(self, event_cls: type[Event], source: EventSource | None) -> bool:
+        if self.include_types and not issubclass(event_cls, self.include_types):
+            return False
+        if self.exclude_types and issubclass(event_cls, self.exclude_types):
+            return False
+        if self.sources and source not in self.sources:
+            return False
+        if self.action_types or self.observation_types:
+            action = getattr(event_cls, 'action', None)
+            observation = getattr(event_cls, 'observation', None)
+            if action not in self.action_types and (
+                observation not in self.observation_types
+            ):
+                return False
+        return True
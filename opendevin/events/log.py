@@ -0,0 +1,608 @@
+import asyncio
+import bisect
+import json
+import zlib
+from functools import partial
+from typing import AsyncIterator, Iterator
+
+from opendevin.core.logger import opendevin_logger as logger
+from opendevin.storage import FileStore
+from opendevin.storage.files import get_executor
+
+# each record is a fixed-width hex header with the length of the payload in bytes,
+# the payload, and a newline
+HEADER_SIZE = 8
+RECORD_TERMINATOR = '\n'
+
+MAX_SEGMENT_EVENTS = 1000
+MAX_SEGMENT_BYTES = 4 * 1024 * 1024
+# stores that can't append, like S3, rewrite the active segment on every append
+OBJECT_STORE_SEGMENT_BYTES = 64 * 1024
+INDEX_INTERVAL = 64
+
+# version 1 had character offsets
+MANIFEST_VERSION = 2
+# the manifest is written to alternating slots, so a torn write never loses the previous one
+MANIFEST_SLOTS = 2
+
+
+class TruncatedRecordError(Exception):
+    """Raised when a segment ends in the middle of a record."""
+
+    pass
+
+
+def _to_bytes(content: str) -> bytes:
+    # like the file stores, which keep invalid UTF-8 as surrogates
+    return content.encode('utf-8', 'surrogateescape')
+
+
+def _to_str(data: bytes) -> str:
+    return data.decode('utf-8', 'surrogateescape')
+
+
+def encode_record(payload: str) -> str:
+    length = len(_to_bytes(payload))
+    return f'{length:0{HEADER_SIZE}x}{payload}{RECORD_TERMINATOR}'
+
+
+def decode_records(content: bytes, offset: int = 0) -> Iterator[tuple[int, str]]:
+    """
+    Decode the records of a segment, starting at the given byte offset.
+
+    Yields (offset, payload) tuples, and raises TruncatedRecordError if the
+    segment ends with a partially written record.
+    """
+    terminator = RECORD_TERMINATOR.encode()
+    while offset < len(content):
+        header = content[offset : offset + HEADER_SIZE]
+        try:
+            if len(header) < HEADER_SIZE:
+                raise ValueError(header)
+            length = int(header, 16)
+        except ValueError:
+            raise TruncatedRecordError(offset)
+        start = offset + HEADER_SIZE
+        end = start + length
+        if content[end : end + len(terminator)] != terminator:
+            raise TruncatedRecordError(offset)
+        yield offset, _to_str(content[start:end])
+        offset = end + len(terminator)
+
+
+class Segment:
+    """
+    A contiguous run of records in the log, named after the id of its first record.
+
+    The sparse index maps every INDEX_INTERVAL-th event id to the byte offset of
+    its record, so a read only fetches the records between two indexed ones.
+    """
+
+    first_id: int
+    num_events: int
+    size: int
+    # None until the index of a segment restored from the manifest is first needed
+    index: list[tuple[int, int]] | None
+
+    def __init__(self, first_id: int, num_events: int = 0, size: int = 0):
+        self.first_id = first_id
+        self.num_events = num_events
+        self.size = size
+        self.index = [] if num_events == 0 else None
+
+    @property
+    def end_id(self) -> int:
+        return self.first_id + self.num_events
+
+    def copy(self) -> 'Segment':
+        segment = Segment(self.first_id, self.num_events, self.size)
+        segment.index = list(self.index) if self.index is not None else None
+        return segment
+
+    def add(self, record_size: int):
+        assert self.index is not None
+        if self.num_events % INDEX_INTERVAL == 0:
+            self.index.append((self.end_id, self.size))
+        self.num_events += 1
+        self.size += record_size
+
+    def seek(self, id: int) -> tuple[int, int]:
+        """
+        Returns the closest indexed (id, offset) at or before the given id.
+        """
+        if not self.index:
+            return self.first_id, 0
+        pos = bisect.bisect_right(self.index, (id, float('inf'))) - 1
+        if pos < 0:
+            return self.first_id, 0
+        return self.index[pos]
+
+    def span(self, start_id: int, end_id: int) -> tuple[int, int, int]:
+        """
+        Returns the first id, and the start and end byte offsets, of the smallest
+        indexed span of records holding the ids from start_id to end_id.
+        """
+        assert self.index is not None
+        id, start = self.seek(start_id)
+        pos = bisect.bisect_right(self.index, (end_id, float('inf')))
+        end = self.index[pos][1] if pos < len(self.index) else self.size
+        return id, start, end
+
+
+class EventLog:
+    """
+    Append-only, segmented log of serialized events for a single session.
+
+    Events are written as length-prefixed records to rolling segment files under
+    `sessions/{sid}/event_log/`. An append is a single write to the active
+    segment (or one per batch, see aappend_many), and a read fetches the byte
+    range of the records it needs from each segment, using its sparse index.
+    On stores that can't append, the segments are kept small, as each append
+    rewrites the active one.
+
+    A checksummed manifest holding the latest id and the segment table is rewritten
+    after every append, so reopening a session only reads the manifest and the
+    active segment. Listing the segment files is a fallback for repairing a
+    missing or corrupt manifest.
+
+    Sessions written with the older one-file-per-event layout
+    (`sessions/{sid}/events/{id}.json`) are migrated into the log when it is first opened.
+    """
+
+    sid: str
+    _file_store: FileStore
+    _segments: list[Segment]
+
+    def __init__(
+        self,
+        sid: str,
+        file_store: FileStore,
+        max_segment_events: int = MAX_SEGMENT_EVENTS,
+        max_segment_bytes: int | None = None,
+    ):
+        self.sid = sid
+        self._file_store = file_store
+        self._max_segment_events = max_segment_events
+        if max_segment_bytes is None:
+            max_segment_bytes = (
+                MAX_SEGMENT_BYTES
+                if file_store.appends_natively
+                else OBJECT_STORE_SEGMENT_BYTES
+            )
+        self._max_segment_bytes = max_segment_bytes
+        self._segments = []
+        self._manifest_seq = 0
+        self._load()
+
+    @classmethod
+    async def aopen(
+        cls,
+        sid: str,
+        file_store: FileStore,
+        max_segment_events: int = MAX_SEGMENT_EVENTS,
+        max_segment_bytes: int | None = None,
+    ) -> 'EventLog':
+        """
+        Opens the log of a session like the constructor, reading its manifest and
+        active segment (or repairing and migrating it) without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_executor(),
+            partial(cls, sid, file_store, max_segment_events, max_segment_bytes),
+        )
+
+    @property
+    def next_id(self) -> int:
+        if not self._segments:
+            return 0
+        return self._segments[-1].end_id
+
+    def _get_dirname(self) -> str:
+        return f'sessions/{self.sid}/event_log'
+
+    def _get_segment_filename(self, first_id: int) -> str:
+        return f'{self._get_dirname()}/{first_id:010d}.log'
+
+    def _get_index_filename(self, first_id: int) -> str:
+        return f'{self._get_dirname()}/{first_id:010d}.idx'
+
+    def _get_manifest_filename(self, slot: int) -> str:
+        return f'{self._get_dirname()}/manifest.{slot}.json'
+
+    def _get_legacy_dirname(self) -> str:
+        return f'sessions/{self.sid}/events'
+
+    def _get_legacy_filename(self, id: int) -> str:
+        return f'{self._get_legacy_dirname()}/{id}.json'
+
+    def _load(self):
+        manifest = self._read_manifest()
+        if manifest is not None:
+            try:
+                self._load_from_manifest(manifest)
+                return
+            except FileNotFoundError:
+                logger.warning(f'Event log manifest of session {self.sid} is stale')
+                self._segments = []
+        self._repair()
+        if self._segments:
+            self._write_manifest()
+
+    def _read_manifest(self) -> dict | None:
+        latest: dict | None = None
+        for slot in range(MANIFEST_SLOTS):
+            try:
+                data = json.loads(
+                    self._file_store.read(self._get_manifest_filename(slot))
+                )
+                manifest = data['manifest']
+                checksum = zlib.crc32(json.dumps(manifest, sort_keys=True).encode())
+                if checksum != data['checksum']:
+                    raise ValueError(f'checksum mismatch in slot {slot}')
+                if manifest['version'] != MANIFEST_VERSION:
+                    raise ValueError(f'unknown version {manifest["version"]}')
+            except FileNotFoundError:
+                continue
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(
+                    f'Ignoring event log manifest of session {self.sid}: {e}'
+                )
+                continue
+            if latest is None or manifest['seq'] > latest['seq']:
+                latest = manifest
+        return latest
+
+    def _encode_manifest(
+        self, segments: list[Segment] | None = None
+    ) -> tuple[str, str]:
+        """
+        Returns the filename and contents of the next manifest write, for the
+        given segment table, by default the current one.
+        """
+        if segments is None:
+            segments = self._segments
+        self._manifest_seq += 1
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'seq': self._manifest_seq,
+            'next_id': segments[-1].end_id if segments else 0,
+            'segments': [
+                [segment.first_id, segment.num_events, segment.size]
+                for segment in segments
+            ],
+        }
+        checksum = zlib.crc32(json.dumps(manifest, sort_keys=True).encode())
+        return (
+            self._get_manifest_filename(self._manifest_seq % MANIFEST_SLOTS),
+            json.dumps({'checksum': checksum, 'manifest': manifest}),
+        )
+
+    def _write_manifest(self):
+        self._file_store.write(*self._encode_manifest())
+
+    def _load_from_manifest(self, manifest: dict):
+        self._manifest_seq = manifest['seq']
+        segments = manifest['segments']
+        if not segments:
+            return
+        for first_id, num_events, size in segments[:-1]:
+            self._segments.append(Segment(first_id, num_events, size))
+        # records appended after the last manifest write are picked up by the scan
+        self._segments.append(self._load_active_segment(segments[-1][0]))
+        # as is a segment that was rolled over to right before the last write
+        try:
+            segment = self._load_active_segment(self.next_id)
+        except FileNotFoundError:
+            return
+        if segment.num_events > 0:
+            self._segments.append(segment)
+
+    def _repair(self):
+        try:
+            filenames = self._file_store.list(self._get_dirname())
+        except FileNotFoundError:
+            filenames = []
+        first_ids = []
+        for filename in filenames:
+            name = filename.rstrip('/').split('/')[-1]
+            if not name.endswith('.log'):
+                continue
+            try:
+                first_ids.append(int(name.removesuffix('.log')))
+            except ValueError:
+                logger.warning(f'Ignoring unexpected file in event log: {filename}')
+        if not first_ids:
+            self._migrate_legacy_events()
+            return
+        logger.info(f'Rebuilding event log manifest of session {self.sid}')
+        first_ids.sort()
+        for first_id in first_ids[:-1]:
+            self._segments.append(self._load_sealed_segment(first_id))
+        self._segments.append(self._load_active_segment(first_ids[-1]))
+
+    def _load_sealed_segment(self, first_id: int) -> Segment:
+        segment = Segment(first_id)
+        try:
+            data = json.loads(self._file_store.read(self._get_index_filename(first_id)))
+            segment.num_events = data['num_events']
+            segment.size = data['size']
+            segment.index = [(id, offset) for id, offset in data['index']]
+        except (FileNotFoundError, KeyError, ValueError):
+            logger.warning(f'Rebuilding index for event log segment {first_id}')
+            segment = Segment(first_id)
+            self._scan_segment(segment)
+        return segment
+
+    @staticmethod
+    def _load_index(segment: Segment, index_content: str | None) -> bool:
+        """
+        Loads the index of a sealed segment from its index file, and returns whether
+        it could.
+        """
+        try:
+            if index_content is None:
+                raise ValueError('missing index')
+            data = json.loads(index_content)
+            segment.index = [(id, offset) for id, offset in data['index']]
+            return True
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _build_index(segment: Segment, content: bytes):
+        index = []
+        for i, (offset, _) in enumerate(decode_records(content)):
+            if i % INDEX_INTERVAL == 0:
+                index.append((segment.first_id + i, offset))
+        segment.index = index
+
+    def _load_active_segment(self, first_id: int) -> Segment:
+        segment = Segment(first_id)
+        self._scan_segment(segment)
+        return segment
+
+    def _scan_segment(self, segment: Segment):
+        filename = self._get_segment_filename(segment.first_id)
+        content = _to_bytes(self._file_store.read(filename))
+        try:
+            for offset, payload in decode_records(content):
+                segment.add(len(_to_bytes(encode_record(payload))))
+        except TruncatedRecordError:
+            # a crash in the middle of an append leaves a partial record at the tail
+            logger.warning(
+                f'Truncating partial record at offset {segment.size} of {filename}'
+            )
+            self._file_store.write(filename, _to_str(content[: segment.size]))
+
+    def _encode_index(self, segment: Segment) -> tuple[str, str]:
+        data = {
+            'num_events': segment.num_events,
+            'size': segment.size,
+            'index': segment.index,
+        }
+        return self._get_index_filename(segment.first_id), json.dumps(data)
+
+    def _migrate_legacy_events(self):
+        try:
+            filenames = self._file_store.list(self._get_legacy_dirname())
+        except FileNotFoundError:
+            return
+        if not filenames:
+            return
+        logger.info(f'Migrating {len(filenames)} events of session {self.sid}')
+        id = 0
+        while True:
+            try:
+                payload = self._file_store.read(self._get_legacy_filename(id))
+            except FileNotFoundError:
+                break
+            self._append_record(id, payload)
+            id += 1
+        if id < len(filenames):
+            logger.warning(
+                f'Migrated {id} of {len(filenames)} legacy events of session {self.sid}'
+            )
+
+    def append(self, id: int, payload: str):
+        """
+        Appends a serialized event to the log.
+
+        Parameters:
+        - id (int): The id of the event, which must be the next id in the log
+        - payload (str): The serialized event
+        """
+        self._append_record(id, payload)
+        self._write_manifest()
+
+    async def aappend(self, id: int, payload: str, fsync: bool = False):
+        """
+        Appends a serialized event to the log without blocking the event loop.
+
+        Callers must not interleave appends to the same log.
+        """
+        await self.aappend_many([(id, payload)], fsync=fsync)
+
+    async def aappend_many(self, records: list[tuple[int, str]], fsync: bool = False):
+        """
+        Appends a batch of serialized events as a group commit: one write per
+        segment touched, an optional fsync, and a single manifest update.
+
+        Parameters:
+        - records (list[tuple[int, str]]): (id, payload) tuples, in id order
+        - fsync (bool): Whether to flush the written segments to durable storage
+        """
+        if not records:
+            return
+        # readers plan their byte ranges from the segment table, so the new sizes
+        # are only applied once the records are written
+        segments = list(self._segments)
+        if segments:
+            segments[-1] = segments[-1].copy()
+        writes: list[tuple[str, list[str]]] = []
+        sealed_segments = []
+        for id, payload in records:
+            sealed, segment = self._roll_segment(id, segments)
+            if sealed is not None:
+                sealed_segments.append(sealed)
+            filename = self._get_segment_filename(segment.first_id)
+            if not writes or writes[-1][0] != filename:
+                writes.append((filename, []))
+            record = encode_record(payload)
+            writes[-1][1].append(record)
+            segment.add(len(_to_bytes(record)))
+        try:
+            for sealed in sealed_segments:
+                await self._file_store.awrite(*self._encode_index(sealed))
+            for filename, chunks in writes:
+                await self._file_store.aappend(filename, ''.join(chunks))
+                if fsync:
+                    await self._file_store.afsync(filename)
+            await self._file_store.awrite(*self._encode_manifest(segments))
+        except Exception:
+            # resync the in-memory segment table with what actually made it to storage
+            log = await EventLog.aopen(
+                self.sid,
+                self._file_store,
+                self._max_segment_events,
+                self._max_segment_bytes,
+            )
+            self._segments = log._segments
+            self._manifest_seq = log._manifest_seq
+            raise
+        self._segments = segments
+
+    def _append_record(self, id: int, payload: str):
+        sealed, segment = self._roll_segment(id, self._segments)
+        if sealed is not None:
+            self._file_store.write(*self._encode_index(sealed))
+        record = encode_record(payload)
+        self._file_store.append(self._get_segment_filename(segment.first_id), record)
+        segment.add(len(_to_bytes(record)))
+
+    def _roll_segment(
+        self, id: int, segments: list[Segment]
+    ) -> tuple[Segment | None, Segment]:
+        """
+        Returns the segment of the given table that was sealed, if any, and the
+        segment to append the given id to, adding it to the table if new.
+        """
+        next_id = segments[-1].end_id if segments else 0
+        if id != next_id:
+            raise ValueError(f'Expected event id {next_id}, got {id}')
+        segment = segments[-1] if segments else None
+        if segment is not None and (
+            segment.num_events < self._max_segment_events
+            and segment.size < self._max_segment_bytes
+        ):
+            return None, segment
+        new_segment = Segment(id)
+        segments.append(new_segment)
+        return segment, new_segment
+
+    def read(self, id: int) -> str:
+        """
+        Returns the serialized event with the given id.
+
+        Raises FileNotFoundError if the event is not in the log.
+        """
+        for _, payload in self.read_range(id, id):
+            return payload
+        raise FileNotFoundError(f'Event {id} not found in session {self.sid}')
+
+    def read_range(
+        self, start_id: int = 0, end_id: int | None = None
+    ) -> Iterator[tuple[int, str]]:
+        """
+        Yields (id, payload) tuples for the events from start_id to end_id, inclusive.
+        """
+        for segment, start, end in self._plan_range(start_id, end_id):
+            filename = self._get_segment_filename(segment.first_id)
+            if segment.index is None:
+                try:
+                    index = self._file_store.read(
+                        self._get_index_filename(segment.first_id)
+                    )
+                except FileNotFoundError:
+                    index = None
+                if not self._load_index(segment, index):
+                    content = _to_bytes(self._file_store.read(filename))
+                    self._build_index(segment, content)
+                    yield from self._decode_range(content, segment.first_id, start, end)
+                    continue
+            first, offset, end_offset = segment.span(start, end)
+            content = self._file_store.read_range(filename, offset, end_offset - offset)
+            yield from self._decode_range(content, first, start, end)
+
+    async def aread_range(
+        self, start_id: int = 0, end_id: int | None = None
+    ) -> AsyncIterator[tuple[int, str]]:
+        """
+        Like read_range, but reads the segments without blocking the event loop.
+        """
+        for segment, start, end in self._plan_range(start_id, end_id):
+            filename = self._get_segment_filename(segment.first_id)
+            if segment.index is None:
+                try:
+                    index = await self._file_store.aread(
+                        self._get_index_filename(segment.first_id)
+                    )
+                except FileNotFoundError:
+                    index = None
+                if not self._load_index(segment, index):
+                    content = _to_bytes(await self._file_store.aread(filename))
+                    self._build_index(segment, content)
+                    for id, payload in self._decode_range(
+                        content, segment.first_id, start, end
+                    ):
+                        yield id, payload
+                    continue
+            first, offset, end_offset = segment.span(start, end)
+            content = await self._file_store.aread_range(
+                filename, offset, end_offset - offset
+            )
+            for id, payload in self._decode_range(content, first, start, end):
+                yield id, payload
+
+    def _plan_range(
+        self, start_id: int, end_id: int | None
+    ) -> list[tuple[Segment, int, int]]:
+        """
+        Returns the segments covering the given range, each with the ids to read from it.
+        """
+        if end_id is None or end_id >= self.next_id:
+            end_id = self.next_id - 1
+        if start_id > end_id:
+            return []
+        first_ids = [segment.first_id for segment in self._segments]
+        pos = max(bisect.bisect_right(first_ids, start_id) - 1, 0)
+        plan = []
+        for segment in self._segments[pos:]:
+            if segment.first_id > end_id:
+                break
+            if segment.end_id <= start_id:
+                continue
+            plan.append(
+                (
+                    segment,
+                    max(start_id, segment.first_id),
+                    min(end_id, segment.end_id - 1),
+                )
+            )
+        return plan
+
+    @staticmethod
+    def _decode_range(
+        content: bytes, first_id: int, start_id: int, end_id: int
+    ) -> Iterator[tuple[int, str]]:
+        """
+        Decodes the records from start_id to end_id out of content, which starts
+        with the record of first_id.
+        """
+        id = first_id
+        for _, payload in decode_records(content):
+            if id > end_id:
+                return
+            if id >= start_id:
+                yield id, payload
+            id += 1
@@ -0,0 +1,142 @@
+"""
+Compares the event codecs and serializers on recorded sessions.
+
+Usage: python -m opendevin.events.serialization.benchmark [sid ...]
+
+Reads the event logs of the given sessions (all sessions in the configured file
+store by default), and reports the encode/decode throughput and encoded size of
+each available codec, and how long event_to_dict and event_to_memory take
+compared to their former dataclasses.asdict based implementation.
+"""
+
+import sys
+import time
+from dataclasses import asdict
+
+from opendevin.events.event import Event
+from opendevin.events.stream import EventStream
+from opendevin.storage import get_file_store
+
+from .codec import available_codecs, get_codec
+from .event import (
+    DELETE_FROM_MEMORY_EXTRAS,
+    TOP_KEYS,
+    event_to_dict,
+    event_to_memory,
+)
+from .utils import remove_fields
+
+
+def asdict_event_to_dict(event: Event) -> dict:
+    """
+    The dataclasses.asdict based implementation event_to_dict replaced, kept as a
+    baseline and a reference for its output.
+    """
+    props = asdict(event)
+    d = {}
+    for key in TOP_KEYS:
+        if hasattr(event, key) and getattr(event, key) is not None:
+            d[key] = getattr(event, key)
+        elif hasattr(event, f'_{key}') and getattr(event, f'_{key}') is not None:
+            d[key] = getattr(event, f'_{key}')
+        if key == 'id' and d.get('id') == -1:
+            d.pop('id', None)
+        if key == 'timestamp' and 'timestamp' in d:
+            d['timestamp'] = d['timestamp'].isoformat()
+        if key == 'source' and 'source' in d:
+            d['source'] = d['source'].value
+        props.pop(key, None)
+    if 'action' in d:
+        d['args'] = props
+    elif 'observation' in d:
+        d['content'] = props.pop('content', '')
+        d['extras'] = props
+    else:
+        raise ValueError('Event must be either action or observation')
+    return d
+
+
+def asdict_event_to_memory(event: Event) -> dict:
+    d = asdict_event_to_dict(event)
+    d.pop('id', None)
+    d.pop('cause', None)
+    d.pop('timestamp', None)
+    d.pop('message', None)
+    if 'extras' in d:
+        remove_fields(d['extras'], DELETE_FROM_MEMORY_EXTRAS)
+    return d
+
+
+def load_sessions(sids: list[str]) -> list[Event]:
+    file_store = get_file_store()
+    if not sids:
+        sids = [path.rstrip('/').split('/')[-1] for path in file_store.list('sessions')]
+    events: list[Event] = []
+    for sid in sids:
+        events.extend(EventStream(sid).get_events())
+    return events
+
+
+def benchmark(events: list[dict], rounds: int = 5) -> dict[str, dict[str, float]]:
+    results = {}
+    for name in available_codecs():
+        codec = get_codec(name)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            encoded = [codec.encode(event) for event in events]
+        encode_time = (time.perf_counter() - start) / rounds
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for data in encoded:
+                codec.decode(data)
+        decode_time = (time.perf_counter() - start) / rounds
+        size = sum(len(data) for data in encoded)
+        results[name] = {
+            'bytes': size,
+            'encode_mb_s': size / encode_time / 1e6 if encode_time else 0.0,
+            'decode_mb_s': size / decode_time / 1e6 if decode_time else 0.0,
+        }
+    return results
+
+
+def benchmark_serializers(
+    events: list[Event], rounds: int = 5
+) -> dict[str, dict[str, float]]:
+    """
+    Returns the microseconds per event of each serializer and of its asdict baseline.
+    """
+    pairs = {
+        'event_to_dict': (event_to_dict, asdict_event_to_dict),
+        'event_to_memory': (event_to_memory, asdict_event_to_memory),
+    }
+    results = {}
+    for name, (serializer, baseline) in pairs.items():
+        timings = []
+        for func in (serializer, baseline):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for event in events:
+                    func(event)
+            timings.append((time.perf_counter() - start) / rounds / len(events) * 1e6)
+        results[name] = {'us': timings[0], 'asdict_us': timings[1]}
+    return results
+
+
+def main():
+    events = load_sessions(sys.argv[1:])
+    print(f'{len(events)} events')
+    if not events:
+        return
+    print(f'{"serializer":<18}{"us/event":>10}{"asdict us/event":>18}')
+    for name, result in benchmark_serializers(events).items():
+        print(f'{name:<18}{result["us"]:>10.2f}{result["asdict_us"]:>18.2f}')
+    print(f'{"codec":<10}{"bytes":>14}{"encode MB/s":>14}{"decode MB/s":>14}')
+    for name, result in benchmark([event_to_dict(e) for e in events]).items():
+        print(
+            f'{name:<10}{result["bytes"]:>14}'
+            f'{result["encode_mb_s"]:>14.1f}{result["decode_mb_s"]:>14.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
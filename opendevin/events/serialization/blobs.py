@@ -0,0 +1,71 @@
+import json
+from typing import Callable, Iterator
+
+# a spilled value is replaced by {BLOB_KEY: <key of its JSON encoding>}
+BLOB_KEY = '$blob'
+
+
+def _fields(data: dict) -> Iterator[tuple[dict, str]]:
+    if 'content' in data:
+        yield data, 'content'
+    for section in ('args', 'extras'):
+        if isinstance(data.get(section), dict):
+            for key in data[section]:
+                yield data[section], key
+
+
+def _is_ref(value) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and BLOB_KEY in value
+
+
+def spill_event(
+    data: dict, threshold: int, hash_fn: Callable[[str], str]
+) -> tuple[dict, dict[str, str]]:
+    """
+    Replaces the content, args and extras of a serialized event whose JSON encoding
+    is longer than threshold by references to blobs.
+
+    Returns the new event dict and the blobs to store, by key. The original dict is
+    not modified.
+    """
+    blobs: dict[str, str] = {}
+    if threshold <= 0:
+        return data, blobs
+    spilled = {**data}
+    for section in ('args', 'extras'):
+        if isinstance(spilled.get(section), dict):
+            spilled[section] = {**spilled[section]}
+    for container, key in _fields(spilled):
+        value = container[key]
+        # cheap lower bound, to skip encoding the many small values
+        if isinstance(value, (str, int, float, bool)) or value is None:
+            if not isinstance(value, str) or len(value) < threshold:
+                continue
+        encoded = json.dumps(value)
+        if len(encoded) < threshold:
+            continue
+        blob_key = hash_fn(encoded)
+        blobs[blob_key] = encoded
+        container[key] = {BLOB_KEY: blob_key}
+    return spilled, blobs
+
+
+def blob_refs(data: dict) -> list[str]:
+    """
+    Returns the keys of the blobs referenced by a serialized event.
+    """
+    return [
+        container[key][BLOB_KEY]
+        for container, key in _fields(data)
+        if _is_ref(container[key])
+    ]
+
+
+def hydrate_event(data: dict, blobs: dict[str, str]) -> dict:
+    """
+    Puts the values of the blobs referenced by a serialized event back in place.
+    """
+    for container, key in _fields(data):
+        if _is_ref(container[key]):
+            container[key] = json.loads(blobs[container[key][BLOB_KEY]])
+    return data
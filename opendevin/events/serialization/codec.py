@@ -0,0 +1,123 @@
+import json
+from abc import abstractmethod
+from typing import Any
+
+SUBPROTOCOL_PREFIX = 'opendevin.'
+
+
+class EventCodec:
+    """
+    Turns serialized events (the dicts made by event_to_dict) into bytes and back.
+
+    Codecs also move events over a websocket, in binary frames unless the codec says
+    otherwise. A client picks a codec by offering its subprotocol.
+    """
+
+    name: str
+
+    @property
+    def subprotocol(self) -> str:
+        return SUBPROTOCOL_PREFIX + self.name
+
+    @abstractmethod
+    def encode(self, data: dict) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> dict:
+        """
+        Decodes an encoded event. Raises ValueError if the data is malformed.
+        """
+        pass
+
+    async def send(self, websocket: Any, data: dict):
+        await websocket.send_bytes(self.encode(data))
+
+    async def receive(self, websocket: Any) -> dict:
+        return self.decode(await websocket.receive_bytes())
+
+
+class JsonCodec(EventCodec):
+    name = 'json'
+
+    def encode(self, data: dict) -> bytes:
+        return json.dumps(data).encode('utf-8')
+
+    def decode(self, data: bytes) -> dict:
+        return json.loads(data)
+
+    # text frames, as existing clients expect
+    async def send(self, websocket: Any, data: dict):
+        await websocket.send_json(data)
+
+    async def receive(self, websocket: Any) -> dict:
+        return await websocket.receive_json()
+
+
+class MsgpackCodec(EventCodec):
+    """
+    MessagePack codec. Requires the optional msgpack package.
+    """
+
+    name = 'msgpack'
+
+    def __init__(self):
+        import msgpack
+
+        self._msgpack = msgpack
+
+    def encode(self, data: dict) -> bytes:
+        return self._msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, data: bytes) -> dict:
+        try:
+            return self._msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise ValueError(f'Invalid MessagePack data: {e}') from e
+
+
+CODECS: dict[str, type[EventCodec]] = {
+    JsonCodec.name: JsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+
+_codecs: dict[str, EventCodec] = {}
+
+
+def get_codec(name: str) -> EventCodec:
+    """
+    Returns the codec of the given name. Raises ValueError for unknown codecs and
+    ImportError when the codec's package is not installed.
+    """
+    if name not in _codecs:
+        if name not in CODECS:
+            raise ValueError(f'Unknown event codec: {name}')
+        _codecs[name] = CODECS[name]()
+    return _codecs[name]
+
+
+def available_codecs() -> list[str]:
+    names = []
+    for name in CODECS:
+        try:
+            get_codec(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def negotiate_codec(subprotocols: list[str]) -> tuple[EventCodec, str | None]:
+    """
+    Picks the codec for a websocket from the subprotocols offered by the client, in
+    the client's order of preference.
+
+    Returns the codec and the subprotocol to accept. Clients that offer none of ours
+    get JSON, with no subprotocol, as before.
+    """
+    supported = available_codecs()
+    for subprotocol in subprotocols:
+        name = subprotocol.removeprefix(SUBPROTOCOL_PREFIX)
+        if subprotocol.startswith(SUBPROTOCOL_PREFIX) and name in supported:
+            return get_codec(name), subprotocol
+    return get_codec(JsonCodec.name), None
@@ -1,15 +1,19 @@
-from dataclasses import asdict
+import copy
+from dataclasses import asdict, fields, is_dataclass
 from datetime import datetime
+from typing import Callable
 
 from opendevin.events import Event, EventSource
 
-from .action import action_from_dict
-from .observation import observation_from_dict
+from .action import ACTION_TYPE_TO_CLASS, action_from_dict
+from .observation import OBSERVATION_TYPE_TO_CLASS, observation_from_dict
 from .utils import remove_fields
 
 # TODO: move `content` into `extras`
 TOP_KEYS = ['id', 'timestamp', 'source', 'message', 'cause', 'action', 'observation']
 UNDERSCORE_KEYS = ['id', 'timestamp', 'source', 'cause']
+# what event_to_memory keeps of the top keys
+MEMORY_TOP_KEYS = ['source', 'action', 'observation']
 
 DELETE_FROM_MEMORY_EXTRAS = {
     'screenshot',
@@ -43,37 +47,91 @@ def event_from_dict(data) -> 'Event':
     return evt
 
 
-def event_to_dict(event: 'Event') -> dict:
-    props = asdict(event)
+def _copy(value):
+    # what dataclasses.asdict does to a field value, without deep copying
+    # immutable values
+    cls = value.__class__
+    if cls in _ATOMIC_TYPES:
+        return value
+    if cls is dict:
+        return {_copy(k): _copy(v) for k, v in value.items()}
+    if cls is list or cls is tuple:
+        return cls(_copy(v) for v in value)
+    if is_dataclass(value) and not isinstance(value, type):
+        return asdict(value)
+    return copy.deepcopy(value)
+
+
+_ATOMIC_TYPES = {str, int, float, bool, type(None)}
+
+
+def _get_top_keys(event: 'Event', memory: bool) -> dict:
     d = {}
-    for key in TOP_KEYS:
-        if hasattr(event, key) and getattr(event, key) is not None:
-            d[key] = getattr(event, key)
-        elif hasattr(event, f'_{key}') and getattr(event, f'_{key}') is not None:
-            d[key] = getattr(event, f'_{key}')
-        if key == 'id' and d.get('id') == -1:
-            d.pop('id', None)
-        if key == 'timestamp' and 'timestamp' in d:
-            d['timestamp'] = d['timestamp'].isoformat()
-        if key == 'source' and 'source' in d:
-            d['source'] = d['source'].value
-        props.pop(key, None)
-    if 'action' in d:
-        d['args'] = props
-    elif 'observation' in d:
-        d['content'] = props.pop('content', '')
-        d['extras'] = props
-    else:
-        raise ValueError('Event must be either action or observation')
+    for key in MEMORY_TOP_KEYS if memory else TOP_KEYS:
+        value = getattr(event, key, None)
+        if value is None:
+            value = getattr(event, f'_{key}', None)
+        if value is None:
+            continue
+        if key == 'id' and value == -1:
+            continue
+        if key == 'timestamp':
+            value = value.isoformat()
+        elif key == 'source':
+            value = value.value
+        d[key] = value
     return d
 
 
+def _make_serializer(cls: type) -> Callable[['Event', bool], dict]:
+    """
+    Builds the serializer of an event class. It copies the fields listed once
+    from the class, instead of having dataclasses.asdict discover and deep copy
+    all of them on every call.
+    """
+    names = [f.name for f in fields(cls) if f.name not in TOP_KEYS]
+    extras = [name for name in names if name != 'content']
+    memory_extras = [name for name in extras if name not in DELETE_FROM_MEMORY_EXTRAS]
+    has_content = 'content' in names
+
+    def serialize(event: 'Event', memory: bool = False) -> dict:
+        d = _get_top_keys(event, memory)
+        if 'action' in d:
+            d['args'] = {name: _copy(getattr(event, name)) for name in names}
+        elif 'observation' in d:
+            d['content'] = _copy(event.content) if has_content else ''  # type: ignore[attr-defined]
+            d['extras'] = {
+                name: _copy(getattr(event, name))
+                for name in (memory_extras if memory else extras)
+            }
+        else:
+            raise ValueError('Event must be either action or observation')
+        return d
+
+    return serialize
+
+
+# built once for every registered event class, and on first use for others
+_SERIALIZERS: dict[type, Callable[['Event', bool], dict]] = {
+    cls: _make_serializer(cls)
+    for cls in (*ACTION_TYPE_TO_CLASS.values(), *OBSERVATION_TYPE_TO_CLASS.values())
+}
+
+
+def _get_serializer(cls: type) -> Callable[['Event', bool], dict]:
+    serializer = _SERIALIZERS.get(cls)
+    if serializer is None:
+        serializer = _SERIALIZERS[cls] = _make_serializer(cls)
+    return serializer
+
+
+def event_to_dict(event: 'Event') -> dict:
+    return _get_serializer(type(event))(event, False)
+
+
 def event_to_memory(event: 'Event') -> dict:
-    d = event_to_dict(event)
-    d.pop('id', None)
-    d.pop('cause', None)
-    d.pop('timestamp', None)
-    d.pop('message', None)
+    d = _get_serializer(type(event))(event, True)
     if 'extras' in d:
+        # the fields themselves are already left out, but nested values may have them too
         remove_fields(d['extras'], DELETE_FROM_MEMORY_EXTRAS)
     return d
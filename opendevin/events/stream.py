@@ -2,13 +2,27 @@ import asyncio
 import json
 from datetime import datetime
 from enum import Enum
-from typing import Callable, Iterable
+from typing import AsyncIterator, Callable, Iterable
 
+from opendevin.core.config import config
 from opendevin.core.logger import opendevin_logger as logger
+from opendevin.events.serialization.blobs import (
+    blob_refs,
+    hydrate_event,
+    spill_event,
+)
 from opendevin.events.serialization.event import event_from_dict, event_to_dict
 from opendevin.storage import FileStore, get_file_store
+from opendevin.storage.blob import BlobStore
 
+from .cache import EventCache, get_event_cache
 from .event import Event, EventSource
+from .filter import EventFilter
+from .log import EventLog
+from .subscriber_queue import OverflowPolicy, SubscriberQueue
+
+# seconds closing a stream waits for its subscribers to handle the queued events
+CLOSE_TIMEOUT = 5.0
 
 
 class EventStreamSubscriber(str, Enum):
@@ -19,64 +33,218 @@ class EventStreamSubscriber(str, Enum):
     TEST = 'test'
 
 
+class FsyncPolicy(str, Enum):
+    NONE = 'none'
+    """Never fsync; durability is up to the file store."""
+
+    BATCH = 'batch'
+    """Fsync once per group commit."""
+
+    ALWAYS = 'always'
+    """Write and fsync every event before its subscribers are notified."""
+
+
 class EventStream:
+    """
+    Ordered stream of the events of a session, persisted to an EventLog.
+
+    Events are handed to subscribers as soon as they are added, while their
+    persistence goes through a write-behind buffer: a background task group-commits
+    the buffered events every flush_interval seconds, or as soon as
+    max_batch_size events are waiting. Reads see buffered events too.
+    Call flush() to wait until everything added so far is stored.
+
+    Each subscriber gets its own bounded queue and delivery task, so a slow
+    subscriber only delays itself. Events reach every subscriber in the order
+    they were added; what happens when a queue is full is up to its OverflowPolicy.
+
+    Values larger than event_blob_threshold are stored apart, in a content-addressed
+    BlobStore, so the log only holds references to them and identical outputs are
+    stored once per session. They are read back when an event is decoded.
+
+    Decoded events are kept in the shared EventCache while the stream is open, so
+    the events returned by reads are shared and must not be modified.
+    """
+
     sid: str
     # For each subscriber ID, there is a stack of callback functions - useful
     # when there are agent delegates
     _subscribers: dict[str, list[Callable]]
+    _queues: dict[str, SubscriberQueue]
+    _filters: dict[str, EventFilter | None]
+    # the subscribers of each (event class, source) pair, filled in as events arrive
+    _routes: dict[tuple[type[Event], EventSource | None], list[str]]
     _cur_id: int
     _lock: asyncio.Lock
     _file_store: FileStore
+    _log: EventLog
+    _cache: EventCache
+    # large values of events, stored once per session and referenced from the log
+    _blobs: BlobStore
+    # serialized events that have been added but not yet written to the log
+    _pending: dict[int, str]
+    # the blobs of the pending events, by key
+    _pending_blobs: dict[str, str]
 
-    def __init__(self, sid: str):
+    def __init__(
+        self,
+        sid: str,
+        flush_interval: float | None = None,
+        max_batch_size: int | None = None,
+        fsync: str | None = None,
+        log: EventLog | None = None,
+    ):
+        """
+        Parameters:
+        - sid: The session id
+        - flush_interval, max_batch_size, fsync: The write-behind settings, by default from the config
+        - log: The event log of the session, already opened; see aopen
+        """
         self.sid = sid
         self._file_store = get_file_store()
         self._subscribers = {}
-        self._cur_id = 0
+        self._queues = {}
+        self._filters = {}
+        self._routes = {}
         self._lock = asyncio.Lock()
-        self._reinitialize_from_file_store()
+        self._log = log if log is not None else EventLog(sid, self._file_store)
+        self._blobs = BlobStore(self._file_store, f'sessions/{sid}/blobs')
+        self._blob_threshold = config.event_blob_threshold
+        self._cache = get_event_cache()
+        # a previous stream of this session may have left events behind
+        self._cache.invalidate(sid)
+        self._cur_id = self._log.next_id
+        self._flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else config.event_stream_flush_interval
+        )
+        self._max_batch_size = (
+            max_batch_size
+            if max_batch_size is not None
+            else config.event_stream_max_batch_size
+        )
+        self._fsync = FsyncPolicy(
+            fsync if fsync is not None else config.event_stream_fsync
+        )
+        self._pending = {}
+        self._pending_blobs = {}
+        self._flush_lock = asyncio.Lock()
+        self._has_pending = asyncio.Event()
+        self._flush_requested = asyncio.Event()
+        self._flush_task: asyncio.Task | None = None
+        self._closed = False
 
-    def _reinitialize_from_file_store(self):
-        try:
-            events = self._file_store.list(f'sessions/{self.sid}/events')
-        except FileNotFoundError:
-            logger.warning(f'No events found for session {self.sid}')
-            return
-        for event_str in events:
-            id = self._get_id_from_filename(event_str)
-            if id >= self._cur_id:
-                self._cur_id = id + 1
-
-    def _get_filename_for_id(self, id: int) -> str:
-        return f'sessions/{self.sid}/events/{id}.json'
-
-    @staticmethod
-    def _get_id_from_filename(filename: str) -> int:
-        try:
-            return int(filename.split('/')[-1].split('.')[0])
-        except ValueError:
-            logger.warning(f'get id from filename ({filename}) failed.')
-            return -1
+    @classmethod
+    async def aopen(cls, sid: str, **kwargs) -> 'EventStream':
+        """
+        Opens the stream of a session, reading its log without blocking the event loop.
+        """
+        log = await EventLog.aopen(sid, get_file_store())
+        return cls(sid, log=log, **kwargs)
+
+    @property
+    def persisted_id(self) -> int:
+        """
+        The id of the last event written to the log, or -1 if there is none.
+        """
+        return self._log.next_id - 1
+
+    @property
+    def latest_id(self) -> int:
+        """
+        The id of the last event added, persisted or not, or -1 if there is none.
+        """
+        return self._cur_id - 1
 
     def get_events(self, start_id=0, end_id=None) -> Iterable[Event]:
-        event_id = start_id
-        while True:
-            if end_id is not None and event_id > end_id:
+        next_id = start_id
+        for id, payload in self._log.read_range(start_id, end_id):
+            event = self._cache.get(self.sid, id)
+            yield event if event is not None else self._decode(id, payload)
+            next_id = id + 1
+        # the tail may still be buffered, or have been flushed while we were reading
+        while end_id is None or next_id <= end_id:
+            try:
+                yield self.get_event(next_id)
+            except FileNotFoundError:
                 break
+            next_id += 1
+
+    async def aget_events(self, start_id=0, end_id=None) -> AsyncIterator[Event]:
+        next_id = start_id
+        async for id, payload in self._log.aread_range(start_id, end_id):
+            event = self._cache.get(self.sid, id)
+            yield event if event is not None else await self._adecode(id, payload)
+            next_id = id + 1
+        while end_id is None or next_id <= end_id:
             try:
-                event = self.get_event(event_id)
+                yield self.get_event(next_id)
             except FileNotFoundError:
                 break
-            yield event
-            event_id += 1
+            next_id += 1
 
     def get_event(self, id: int) -> Event:
-        filename = self._get_filename_for_id(id)
-        content = self._file_store.read(filename)
-        data = json.loads(content)
-        return event_from_dict(data)
+        event = self._cache.get(self.sid, id)
+        if event is not None:
+            return event
+        payload = self._pending.get(id)
+        if payload is None:
+            payload = self._log.read(id)
+        return self._decode(id, payload)
+
+    def _decode(self, id: int, payload: str) -> Event:
+        data = json.loads(payload)
+        blobs = {}
+        for key in blob_refs(data):
+            blob = self._pending_blobs.get(key)
+            blobs[key] = blob if blob is not None else self._blobs.read(key)
+        return self._hydrate(id, payload, data, blobs)
+
+    async def _adecode(self, id: int, payload: str) -> Event:
+        data = json.loads(payload)
+        blobs = {}
+        for key in blob_refs(data):
+            blob = self._pending_blobs.get(key)
+            blobs[key] = blob if blob is not None else await self._blobs.aread(key)
+        return self._hydrate(id, payload, data, blobs)
 
-    def subscribe(self, id: EventStreamSubscriber, callback: Callable, append=False):
+    def _hydrate(
+        self, id: int, payload: str, data: dict, blobs: dict[str, str]
+    ) -> Event:
+        event = event_from_dict(hydrate_event(data, blobs))
+        size = len(payload) + sum(len(blob) for blob in blobs.values())
+        self._cache.put(self.sid, id, event, size)
+        return event
+
+    def get_cache_metrics(self) -> dict:
+        """
+        Returns the entry count, size and hit/miss counters of the decoded event cache.
+        """
+        return self._cache.get_metrics()
+
+    def subscribe(
+        self,
+        id: EventStreamSubscriber,
+        callback: Callable,
+        append=False,
+        overflow_policy: OverflowPolicy | None = None,
+        queue_size: int | None = None,
+        event_filter: EventFilter | None = None,
+    ):
+        """
+        Subscribes a callback to the stream.
+
+        Parameters:
+        - id: The subscriber id. Callbacks of the same id form a stack, and only the top one is notified
+        - callback: The coroutine function called with each event
+        - append: Whether to push the callback onto an existing stack
+        - overflow_policy: What to do when the subscriber's queue is full
+        - queue_size: The number of events that can wait for this subscriber
+        - event_filter: Which events the subscriber receives; all of them if not set
+
+        The queue and filter options only apply when the subscriber id is first subscribed.
+        """
         if id in self._subscribers:
             if append:
                 self._subscribers[id].append(callback)
@@ -84,6 +252,19 @@ class EventStream:
                 raise ValueError('Subscriber already exists: ' + id)
         else:
             self._subscribers[id] = [callback]
+            self._queues[id] = SubscriberQueue(
+                id,
+                queue_size
+                if queue_size is not None
+                else config.event_stream_queue_size,
+                OverflowPolicy(
+                    overflow_policy
+                    if overflow_policy is not None
+                    else config.event_stream_overflow_policy
+                ),
+            )
+            self._filters[id] = event_filter
+            self._routes.clear()
 
     def unsubscribe(self, id: EventStreamSubscriber):
         if id not in self._subscribers:
@@ -92,6 +273,22 @@ class EventStream:
             self._subscribers[id].pop()
             if len(self._subscribers[id]) == 0:
                 del self._subscribers[id]
+                del self._filters[id]
+                self._routes.clear()
+                self._queues.pop(id).close()
+
+    def get_subscriber_metrics(self) -> dict[str, dict]:
+        """
+        Returns the queue depth, lag (in seconds) and delivery counters of each subscriber.
+        """
+        return {id: queue.get_metrics() for id, queue in self._queues.items()}
+
+    async def join_subscribers(self):
+        """
+        Waits until every event added so far has been handled by its subscribers.
+        """
+        for queue in list(self._queues.values()):
+            await queue.join()
 
     # TODO: make this not async
     async def add_event(self, event: Event, source: EventSource):
@@ -99,14 +296,118 @@ class EventStream:
         async with self._lock:
             event._id = self._cur_id  # type: ignore [attr-defined]
             self._cur_id += 1
-        event._timestamp = datetime.now()  # type: ignore [attr-defined]
-        event._source = source  # type: ignore [attr-defined]
-        data = event_to_dict(event)
-        if event.id is not None:
-            self._file_store.write(
-                self._get_filename_for_id(event.id), json.dumps(data)
+            event._timestamp = datetime.now()  # type: ignore [attr-defined]
+            event._source = source  # type: ignore [attr-defined]
+            data, blobs = spill_event(
+                event_to_dict(event), self._blob_threshold, BlobStore.hash
             )
-        for stack in self._subscribers.values():
-            callback = stack[-1]
-            logger.debug(f'Notifying subscriber {callback} of event {event}')
-            await callback(event)
+            if event.id is not None:
+                payload = json.dumps(data)
+                self._pending_blobs.update(blobs)
+                self._pending[event.id] = payload
+                if not self._closed:
+                    size = len(payload) + sum(len(blob) for blob in blobs.values())
+                    self._cache.put(self.sid, event.id, event, size)
+        if (
+            self._closed
+            or self._fsync == FsyncPolicy.ALWAYS
+            or self._flush_interval <= 0
+        ):
+            await self.flush()
+        else:
+            self._start_flusher()
+            self._has_pending.set()
+            if len(self._pending) >= self._max_batch_size:
+                self._flush_requested.set()
+        if self._closed:
+            return
+        for id in self._get_route(type(event), source):
+            if id in self._subscribers:
+                await self._queues[id].put(self._subscribers[id][-1], event)
+
+    def _get_route(
+        self, event_cls: type[Event], source: EventSource | None
+    ) -> list[str]:
+        key = (event_cls, source)
+        if key not in self._routes:
+            self._routes[key] = [
+                id
+                for id, event_filter in self._filters.items()
+                if event_filter is None or event_filter.matches(event_cls, source)
+            ]
+        return self._routes[key]
+
+    def _start_flusher(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while not self._closed:
+            await self._has_pending.wait()
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(), timeout=self._flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            self._has_pending.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # the events stay buffered, and the next flush retries them
+                logger.error(f'Failed to persist events of session {self.sid}: {e}')
+                self._has_pending.set()
+
+    async def flush(self):
+        """
+        Writes all buffered events to the log, as a single group commit.
+        """
+        # a caller being cancelled must not abandon a half-done commit
+        await asyncio.shield(self._flush())
+
+    async def _flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch = sorted(self._pending.items())
+            blobs = list(self._pending_blobs.items())
+            # the log must never reference a blob that isn't stored yet
+            for _, blob in blobs:
+                await self._blobs.awrite(blob)
+            try:
+                await self._log.aappend_many(
+                    batch, fsync=self._fsync != FsyncPolicy.NONE
+                )
+            finally:
+                # a failed commit may still have written part of the batch, which
+                # the log picks up again, so it must not be appended twice
+                for id, _ in batch:
+                    if id < self._log.next_id:
+                        del self._pending[id]
+                for key, _ in blobs:
+                    del self._pending_blobs[key]
+
+    async def close(self, timeout: float = CLOSE_TIMEOUT):
+        """
+        Stops the background flusher after a final flush, and stops delivering
+        events to subscribers, once they have handled the queued events or timeout
+        seconds have passed. Events added after closing are written through, and
+        not delivered.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for id, queue in list(self._queues.items()):
+            if not await queue.drain(max(deadline - loop.time(), 0)):
+                logger.warning(
+                    f'Dropping {queue.depth} undelivered events of subscriber {id}'
+                )
+            queue.cancel()
+        self._closed = True
+        if self._flush_task is not None:
+            self._has_pending.set()
+            self._flush_requested.set()
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
+        self._cache.invalidate(self.sid)
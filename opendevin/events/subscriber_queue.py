@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import deque
+from contextvars import ContextVar
+from enum import Enum
+from typing import Callable
+
+from opendevin.core.logger import opendevin_logger as logger
+
+from .event import Event
+
+# set in the tasks that deliver events, so that events added from inside a
+# callback never wait on a full queue: two subscribers feeding each other could
+# otherwise block forever
+in_subscriber_callback: ContextVar[bool] = ContextVar(
+    'in_subscriber_callback', default=False
+)
+
+
+class OverflowPolicy(str, Enum):
+    BLOCK = 'block'
+    """The producer waits until the subscriber has caught up."""
+
+    DROP_OLDEST = 'drop_oldest'
+    """The oldest queued event is dropped to make room."""
+
+    COALESCE = 'coalesce'
+    """A queued event of the same type is replaced by the newer one, for subscribers
+    that only care about the latest state. Falls back to blocking if there is none."""
+
+
+class SubscriberQueue:
+    """
+    Bounded queue of events for one subscriber, delivered in order by a dedicated task.
+
+    Each queued event is paired with the callback that was on top of the
+    subscriber's stack when the event was added.
+    """
+
+    subscriber_id: str
+    maxsize: int
+    policy: OverflowPolicy
+
+    def __init__(self, subscriber_id: str, maxsize: int, policy: OverflowPolicy):
+        self.subscriber_id = subscriber_id
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items: deque[tuple[Callable, Event, float]] = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    async def put(self, callback: Callable, event: Event):
+        may_block = not in_subscriber_callback.get()
+        while len(self._items) >= self.maxsize and not self._closing:
+            if self.policy == OverflowPolicy.DROP_OLDEST:
+                self._items.popleft()
+                self.dropped += 1
+            elif self.policy == OverflowPolicy.COALESCE and self._remove_superseded(
+                event
+            ):
+                self.coalesced += 1
+            elif may_block:
+                self._not_full.clear()
+                await self._not_full.wait()
+            else:
+                break
+        if self._closing:
+            return
+        self._items.append((callback, event, time.monotonic()))
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._idle.clear()
+        self._not_empty.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._consume())
+
+    def _remove_superseded(self, event: Event) -> bool:
+        for i in range(len(self._items) - 1, -1, -1):
+            if type(self._items[i][1]) is type(event):
+                del self._items[i]
+                return True
+        return False
+
+    async def _consume(self):
+        in_subscriber_callback.set(True)
+        while True:
+            if not self._items:
+                self._idle.set()
+                if self._closing:
+                    return
+                self._not_empty.clear()
+                await self._not_empty.wait()
+                continue
+            callback, event, enqueued_at = self._items.popleft()
+            self._not_full.set()
+            self.last_lag = time.monotonic() - enqueued_at
+            self.max_lag = max(self.max_lag, self.last_lag)
+            logger.debug(f'Notifying subscriber {callback} of event {event}')
+            try:
+                await callback(event)
+            except Exception as e:
+                logger.exception(
+                    f'Subscriber {self.subscriber_id} failed to handle event {event}: {e}'
+                )
+            self.delivered += 1
+
+    async def join(self):
+        """
+        Waits until every queued event has been delivered.
+        """
+        await self._idle.wait()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Waits up to timeout seconds for the queued events to be delivered, and
+        returns whether they were.
+        """
+        if self._idle.is_set():
+            return True
+        if self._task is asyncio.current_task():
+            # called from one of our callbacks, which can't wait for itself
+            return False
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def close(self):
+        """
+        Lets the queued events drain, then stops the delivery task.
+        """
+        self._closing = True
+        self._not_empty.set()
+
+    def cancel(self):
+        """
+        Stops the delivery task right away, discarding queued events.
+        """
+        self._closing = True
+        self._items.clear()
+        self._idle.set()
+        # producers waiting for room give up
+        self._not_full.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def get_metrics(self) -> dict:
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+        }
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# parameters that don't change the response, left out of the key
+IGNORED_PARAMS = (
+    'api_key',
+    'api_version',
+    'timeout',
+    'aws_access_key_id',
+    'aws_secret_access_key',
+)
+
+_caches: dict[str, 'LLMCache'] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache_key(params: dict) -> str:
+    """
+    Returns the SHA-256 of the canonical JSON of the parameters of a completion,
+    like the model, the messages, the stop sequences and the sampling parameters.
+    """
+    canonical = json.dumps(
+        {key: value for key, value in params.items() if key not in IGNORED_PARAMS},
+        sort_keys=True,
+        separators=(',', ':'),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """
+    Cache of LLM responses in a local SQLite database, keyed by the hash of the
+    completion parameters.
+
+    Entries expire after ttl seconds, and the least recently used ones are evicted
+    beyond max_bytes (of compressed responses). The database can be shared by
+    several processes, like the workers of the evaluation scripts: each process
+    opens its own connection, and writes wait for each other.
+
+    The total size of the entries is kept up to date by each process as it writes,
+    and only read back from the database when it gets over max_bytes, as other
+    processes may have changed it.
+    """
+
+    path: str
+    max_bytes: int
+    ttl: int
+
+    def __init__(self, path: str, max_bytes: int, ttl: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pid = -1
+        self._size = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection inherited from the parent process can't be used after a fork
+        if self._conn is None or self._pid != os.getpid():
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, response BLOB NOT NULL, size INTEGER NOT NULL, '
+                'created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS responses_created ON responses (created)'
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+            self._size = self._get_size(conn)
+        return self._conn
+
+    @staticmethod
+    def _get_size(conn: sqlite3.Connection) -> int:
+        return int(conn.execute('SELECT TOTAL(size) FROM responses').fetchone()[0])
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns the cached response, or None if there is none or it expired.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT response FROM responses WHERE key = ? AND created >= ?',
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            conn.commit()
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, key: str, response: str):
+        data = zlib.compress(response.encode('utf-8'))
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                row = conn.execute(
+                    'SELECT size FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                    (key, data, len(data), now, now),
+                )
+                size = self._size + len(data) - (row[0] if row is not None else 0)
+                expired = conn.execute(
+                    'SELECT TOTAL(size) FROM responses WHERE created < ?',
+                    (now - self.ttl,),
+                ).fetchone()[0]
+                if expired:
+                    conn.execute(
+                        'DELETE FROM responses WHERE created < ?', (now - self.ttl,)
+                    )
+                    size -= int(expired)
+                if size > self.max_bytes:
+                    size = self._evict(conn)
+            self._size = size
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """
+        Deletes the least recently used entries until the rest fit, and returns
+        their size.
+        """
+        size = self._get_size(conn)
+        if size <= self.max_bytes:
+            return size
+        keys = []
+        for key, entry_size in conn.execute(
+            'SELECT key, size FROM responses ORDER BY accessed'
+        ):
+            if size <= self.max_bytes:
+                break
+            keys.append((key,))
+            size -= entry_size
+        conn.executemany('DELETE FROM responses WHERE key = ?', keys)
+        return size
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+def get_llm_cache(path: str, max_bytes: int, ttl: int) -> LLMCache:
+    """
+    Returns the cache of the process at that path, so LLMs share its connection.
+    """
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = LLMCache(path, max_bytes, ttl)
+        cache.max_bytes, cache.ttl = max_bytes, ttl
+        return cache
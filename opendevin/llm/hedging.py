@@ -0,0 +1,174 @@
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, TypeVar
+
+T = TypeVar('T')
+
+# latencies needed before hedging, so the percentile means something
+MIN_SAMPLES = 20
+MAX_SAMPLES = 200
+
+_trackers: dict[str, 'LatencyTracker'] = {}
+_trackers_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the recent calls to a model, to tell when a call is
+    slower than usual.
+
+    Calls cancelled before they answered, like the losers of hedged calls, are
+    kept as censored samples: their latency is only known to be longer. Leaving
+    them out would leave out the slow calls, and lower the percentiles.
+    """
+
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        # (latency, censored) pairs
+        self._latencies: deque[tuple[float, bool]] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, censored: bool = False):
+        """
+        Records the latency of a call, or, if censored, how long a call that was
+        cancelled before it answered had been running.
+        """
+        with self._lock:
+            self._latencies.append((latency, censored))
+
+    def percentile(self, percentile: float) -> float | None:
+        """
+        Returns the latency under which that percentage of the recent calls answered,
+        or None while there are too few of them. The share of calls that answered
+        by each latency is a Kaplan-Meier estimate, which counts the censored ones
+        as not having answered until their latency, and unknown after.
+        """
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES:
+                return None
+            # at equal latencies, the calls that answered come first
+            samples = sorted(self._latencies)
+        at_risk = len(samples)
+        pending = 1.0
+        for latency, censored in samples:
+            if not censored:
+                pending *= 1 - 1 / at_risk
+                if 1 - pending > percentile / 100:
+                    return latency
+            at_risk -= 1
+        return samples[-1][0]
+
+
+def get_latency_tracker(key: str) -> LatencyTracker:
+    """
+    Returns the latency tracker of a model, shared by the LLMs of the process.
+    """
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = _trackers[key] = LatencyTracker()
+        return tracker
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _trackers_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix='llm-hedge')
+        return _executor
+
+
+def hedge(
+    call: Callable[[], T],
+    delay: float | None,
+    on_hedge: Callable[[], bool],
+    on_loser: Callable[[T], Any],
+    duplicate: Callable[[], T] | None = None,
+) -> tuple[T, bool]:
+    """
+    Makes a call, and makes it again if it didn't return after delay seconds, and
+    on_hedge returns True then. The first to return wins. The other is cancelled if
+    it didn't start yet; otherwise it can't be interrupted, so it is left to finish
+    and on_loser gets its result. The call is made again with duplicate, if given.
+
+    Returns the result and whether the second call won. Fails only if both failed,
+    with the error of the first.
+    """
+    if delay is None:
+        return call(), False
+    executor = _get_executor()
+    first = executor.submit(call)
+    done, _ = wait([first], timeout=delay)
+    if done or not on_hedge():
+        return first.result(), False
+    second = executor.submit(duplicate or call)
+    futures = [first, second]
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in futures:
+            if future in done and future.exception() is None:
+                for loser in pending:
+                    if not loser.cancel():
+                        loser.add_done_callback(_call_on_loser(on_loser))
+                return future.result(), future is second
+    return first.result(), False
+
+
+def _call_on_loser(on_loser: Callable[[Any], Any]) -> Callable[[Future], None]:
+    def done(future: Future):
+        if not future.cancelled() and future.exception() is None:
+            on_loser(future.result())
+
+    return done
+
+
+async def ahedge(
+    call: Callable[[], Awaitable[T]],
+    delay: float | None,
+    on_hedge: Callable[[], Awaitable[bool]],
+    on_loser: Callable[[T | None], Awaitable[Any]],
+    duplicate: Callable[[], Awaitable[T]] | None = None,
+) -> tuple[T, bool]:
+    """
+    Like hedge, but the call that loses is cancelled, and on_loser gets None then,
+    or its result if it returned at the same time. A call that failed doesn't get
+    to on_loser.
+    """
+    if delay is None:
+        return await call(), False
+    first = asyncio.ensure_future(call())
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not await on_hedge():
+            return await first, False
+        second = asyncio.ensure_future((duplicate or call)())
+        tasks.append(second)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in tasks:
+                if task in done and task.exception() is None:
+                    for loser in tasks:
+                        if loser is not task:
+                            await _cancel_loser(loser, on_loser)
+                    return task.result(), task is second
+        return first.result(), False
+    finally:
+        # when the caller is cancelled
+        for task in tasks:
+            task.cancel()
+
+
+async def _cancel_loser(task: asyncio.Task, on_loser: Callable[[Any], Awaitable[Any]]):
+    task.cancel()
+    await asyncio.wait([task])
+    if task.cancelled():
+        await on_loser(None)
+    elif task.exception() is None:
+        await on_loser(task.result())
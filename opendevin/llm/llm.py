@@ -1,17 +1,12 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
 import warnings
 from functools import partial
+from typing import TYPE_CHECKING, AsyncGenerator, Callable, TypeVar
 
-with warnings.catch_warnings():
-    warnings.simplefilter('ignore')
-    import litellm
-from litellm import completion as litellm_completion
-from litellm import completion_cost as litellm_completion_cost
-from litellm.exceptions import (
-    APIConnectionError,
-    RateLimitError,
-    ServiceUnavailableError,
-)
-from litellm.types.utils import CostPerToken
 from tenacity import (
     retry,
     retry_if_exception_type,
@@ -20,14 +15,80 @@ from tenacity import (
 )
 
 from opendevin.core.config import config
-from opendevin.core.logger import llm_prompt_logger, llm_response_logger
+from opendevin.core.exceptions import LLMMalformedActionError, LLMResponseError
+from opendevin.core.logger import (
+    llm_transcript_logger,
+    transcript_session,
+    transcript_step,
+)
 from opendevin.core.logger import opendevin_logger as logger
 from opendevin.core.metrics import Metrics
+from opendevin.llm.cache import LLMCache, get_cache_key, get_llm_cache
+from opendevin.llm.hedging import LatencyTracker, ahedge, get_latency_tracker, hedge
+from opendevin.llm.rate_limit import RateLimiter, get_rate_limiter, get_retry_after
+from opendevin.llm.router import Endpoint, EndpointRouter
+from opendevin.llm.tokens import get_token_counter
+
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
 
 __all__ = ['LLM']
 
 message_separator = '\n\n----------\n\n'
 
+T = TypeVar('T')
+
+
+def _import_litellm() -> None:
+    # litellm takes seconds to import, so it is imported with the first LLM rather
+    # than with this module; the functions below import it from sys.modules then
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        import litellm  # noqa: F401
+
+
+def litellm_completion(*args, **kwargs):
+    import litellm
+
+    return litellm.completion(*args, **kwargs)
+
+
+async def litellm_acompletion(*args, **kwargs):
+    import litellm
+
+    return await litellm.acompletion(*args, **kwargs)
+
+
+def litellm_completion_cost(*args, **kwargs) -> float:
+    import litellm
+
+    return litellm.completion_cost(*args, **kwargs)
+
+
+def _retry_errors() -> tuple[type[Exception], ...]:
+    from litellm.exceptions import (
+        APIConnectionError,
+        RateLimitError,
+        ServiceUnavailableError,
+    )
+
+    return (RateLimitError, APIConnectionError, ServiceUnavailableError)
+
+
+def _endpoint_errors() -> tuple[type[Exception], ...]:
+    """
+    Returns the errors of an endpoint rather than of the call, that fail over to
+    another endpoint.
+    """
+    from litellm.exceptions import (
+        APIConnectionError,
+        InternalServerError,
+        ServiceUnavailableError,
+        Timeout,
+    )
+
+    return (APIConnectionError, InternalServerError, ServiceUnavailableError, Timeout)
+
 
 class LLM:
     """
@@ -37,6 +98,8 @@ class LLM:
         model_name (str): The name of the language model.
         api_key (str): The API key for accessing the language model.
         base_url (str): The base URL for the language model API.
+        router (EndpointRouter): Routes the calls between the endpoints of the model, if it has several.
+        tier_models (dict): The models of the tiers of calls that don't use this one, by tier.
         api_version (str): The version of the API to use.
         max_input_tokens (int): The maximum number of tokens to send to the LLM per task.
         max_output_tokens (int): The maximum number of tokens to receive from the LLM per task.
@@ -49,6 +112,8 @@ class LLM:
         model=None,
         api_key=None,
         base_url=None,
+        base_urls=None,
+        api_keys=None,
         api_version=None,
         num_retries=None,
         retry_min_wait=None,
@@ -72,6 +137,8 @@ class LLM:
             model (str, optional): The name of the language model. Defaults to LLM_MODEL.
             api_key (str, optional): The API key for accessing the language model. Defaults to LLM_API_KEY.
             base_url (str, optional): The base URL for the language model API. Defaults to LLM_BASE_URL. Not necessary for OpenAI.
+            base_urls (list, optional): The base URLs of several endpoints serving the model, to route the calls between. Defaults to LLM_BASE_URLS.
+            api_keys (list, optional): The API keys of the endpoints in base_urls. Endpoints without one use api_key. Defaults to LLM_API_KEYS.
             api_version (str, optional): The version of the API to use. Defaults to LLM_API_VERSION. Not necessary for OpenAI.
             num_retries (int, optional): The number of retries for API calls. Defaults to LLM_NUM_RETRIES.
             retry_min_wait (int, optional): The minimum time to wait between retries in seconds. Defaults to LLM_RETRY_MIN_TIME.
@@ -84,11 +151,16 @@ class LLM:
             metrics (Metrics, optional): The metrics object to use. Defaults to None.
             cost_metric_supported (bool, optional): Whether the cost metric is supported. Defaults to True.
         """
+        _import_litellm()
         if llm_config is None:
             llm_config = config.llm
         model = model if model is not None else llm_config.model
         api_key = api_key if api_key is not None else llm_config.api_key
         base_url = base_url if base_url is not None else llm_config.base_url
+        if base_urls is None:
+            base_urls = [url.strip() for url in llm_config.base_urls.split(',')]
+        if api_keys is None:
+            api_keys = [key.strip() for key in llm_config.api_keys.split(',')]
         api_version = api_version if api_version is not None else llm_config.api_version
         num_retries = num_retries if num_retries is not None else llm_config.num_retries
         retry_min_wait = (
@@ -122,7 +194,17 @@ class LLM:
         logger.info(f'Initializing LLM with model: {model}')
         self.model_name = model
         self.api_key = api_key
-        self.base_url = base_url
+        self.router: EndpointRouter | None = None
+        endpoints = [
+            Endpoint(url, (api_keys[i] if i < len(api_keys) else '') or api_key)
+            for i, url in enumerate(base_urls)
+            if url
+        ]
+        if endpoints:
+            self.router = EndpointRouter(endpoints)
+            if base_url is None:
+                base_url = endpoints[0].base_url
+        self.base_url = base_url or None
         self.api_version = api_version
         self.max_input_tokens = max_input_tokens
         self.max_output_tokens = max_output_tokens
@@ -130,6 +212,47 @@ class LLM:
         self.custom_llm_provider = custom_llm_provider
         self.metrics = metrics
         self.cost_metric_supported = cost_metric_supported
+        self.stream = llm_config.stream
+        self.cache: LLMCache | None = None
+        if llm_config.response_cache:
+            self.cache = get_llm_cache(
+                llm_config.response_cache_path,
+                llm_config.response_cache_max_bytes,
+                llm_config.response_cache_ttl,
+            )
+        self.cache_force = llm_config.response_cache_force
+        self.tier_models = _parse_pairs(llm_config.tier_models)
+        self.tier_base_urls = _parse_pairs(llm_config.tier_base_urls)
+        self.tier_api_keys = _parse_pairs(llm_config.tier_api_keys)
+        self._tier_llms: dict[str, LLM] = {}
+        self.token_counter = get_token_counter(self.model_name)
+        import litellm
+
+        try:
+            provider = litellm.get_llm_provider(self.model_name, custom_llm_provider)[1]
+        except Exception:
+            provider = custom_llm_provider or ''
+        # without limits, the calls don't go through a rate limiter at all
+        self.rate_limiter: RateLimiter | None = None
+        if (
+            llm_config.rate_limit_requests_per_minute
+            or llm_config.rate_limit_tokens_per_minute
+            or llm_config.rate_limit_max_concurrency
+        ):
+            self.rate_limiter = get_rate_limiter(
+                f'{provider}/{self.model_name}',
+                llm_config.rate_limit_requests_per_minute,
+                llm_config.rate_limit_tokens_per_minute,
+                llm_config.rate_limit_max_concurrency,
+                llm_config.rate_limit_state_dir,
+            )
+        self.hedge_percentile = llm_config.hedge_percentile
+        self.hedge_min_delay = llm_config.hedge_min_delay
+        # the latencies of whole responses and of the first chunk of streams
+        self.latencies = get_latency_tracker(f'{provider}/{self.model_name}')
+        self.stream_latencies = get_latency_tracker(
+            f'{provider}/{self.model_name}/stream'
+        )
 
         # litellm actually uses base Exception here for unknown model
         self.model_info = None
@@ -157,8 +280,7 @@ class LLM:
                 # with thousands of unwanted tokens
                 self.max_output_tokens = 1024
 
-        self._completion = partial(
-            litellm_completion,
+        completion_kwargs = dict(
             model=self.model_name,
             api_key=self.api_key,
             base_url=self.base_url,
@@ -169,8 +291,8 @@ class LLM:
             temperature=llm_temperature,
             top_p=llm_top_p,
         )
-
-        completion_unwrapped = self._completion
+        completion_unwrapped = partial(litellm_completion, **completion_kwargs)
+        acompletion_unwrapped = partial(litellm_acompletion, **completion_kwargs)
 
         def attempt_on_error(retry_state):
             logger.error(
@@ -179,44 +301,96 @@ class LLM:
             )
             return True
 
-        @retry(
+        # tenacity waits with asyncio.sleep when retrying a coroutine function
+        retry_on_error = retry(
             reraise=True,
             stop=stop_after_attempt(num_retries),
             wait=wait_random_exponential(min=retry_min_wait, max=retry_max_wait),
-            retry=retry_if_exception_type(
-                (RateLimitError, APIConnectionError, ServiceUnavailableError)
-            ),
+            retry=retry_if_exception_type(_retry_errors()),
             after=attempt_on_error,
         )
+
+        @retry_on_error
         def wrapper(*args, **kwargs):
             """
             Wrapper for the litellm completion function. Logs the input and output of the completion function.
             """
+            start = time.monotonic()
+            cache_key = self._get_cache_key(completion_kwargs, *args, **kwargs)
+            if cache_key is not None:
+                cached = self._get_cached(cache_key)
+                if cached is not None:
+                    self._log_call(start, args, kwargs, cached, cached=True)
+                    return cached
+
+            # call the completion function, once the rate limits allow
+            self._acquire(*args, **kwargs)
+            try:
+                resp = self._hedged(
+                    partial(self._route, completion_unwrapped, *args, **kwargs),
+                    self._get_messages(*args, **kwargs),
+                )
+            except Exception as e:
+                self._release(e)
+                self._log_call(start, args, kwargs, error=e)
+                raise
+            self._release()
 
-            # some callers might just send the messages directly
-            if 'messages' in kwargs:
-                messages = kwargs['messages']
-            else:
-                messages = args[1]
-
-            # log the prompt
-            debug_message = ''
-            for message in messages:
-                debug_message += message_separator + message['content']
-            llm_prompt_logger.debug(debug_message)
-
-            # call the completion function
-            resp = completion_unwrapped(*args, **kwargs)
-
-            # log the response
-            message_back = resp['choices'][0]['message']['content']
-            llm_response_logger.debug(message_back)
+            self._log_call(start, args, kwargs, resp)
 
             # post-process to log costs
             self._post_completion(resp)
+            if cache_key is not None:
+                self._put_cached(cache_key, resp)
+            return resp
+
+        @retry_on_error
+        async def async_wrapper(*args, **kwargs):
+            """
+            Wrapper for the litellm acompletion function, like the one of completion.
+            """
+            start = time.monotonic()
+            cache_key = self._get_cache_key(completion_kwargs, *args, **kwargs)
+            if cache_key is not None:
+                # sqlite blocks, for up to its busy timeout
+                cached = await asyncio.to_thread(self._get_cached, cache_key)
+                if cached is not None:
+                    self._log_call(start, args, kwargs, cached, cached=True)
+                    return cached
+            await self._aacquire(*args, **kwargs)
+            try:
+                resp = await self._ahedged(
+                    partial(self._aroute, acompletion_unwrapped, *args, **kwargs),
+                    self.latencies,
+                    self._get_messages(*args, **kwargs),
+                )
+            except Exception as e:
+                await self._arelease(e)
+                self._log_call(start, args, kwargs, error=e)
+                raise
+            await self._arelease()
+            self._log_call(start, args, kwargs, resp)
+            self._post_completion(resp)
+            if cache_key is not None:
+                await asyncio.to_thread(self._put_cached, cache_key, resp)
             return resp
 
-        self._completion = wrapper  # type: ignore
+        @retry_on_error
+        async def open_stream(*args, **kwargs):
+            await self._aacquire(*args, **kwargs)
+            try:
+                return await self._ahedged(
+                    partial(self._aopen_stream, acompletion_unwrapped, *args, **kwargs),
+                    self.stream_latencies,
+                    self._get_messages(*args, **kwargs),
+                )
+            except Exception as e:
+                await self._arelease(e)
+                raise
+
+        self._completion = wrapper
+        self._acompletion = async_wrapper
+        self._open_stream = open_stream
 
     @property
     def completion(self):
@@ -227,7 +401,424 @@ class LLM:
         """
         return self._completion
 
-    def _post_completion(self, response: str) -> None:
+    @property
+    def acompletion(self):
+        """
+        Decorator for the litellm acompletion function, that awaits the response
+        instead of blocking. Retries, logging and costs work like for completion.
+        """
+        return self._acompletion
+
+    async def astream(self, *args, **kwargs) -> AsyncGenerator[str, None]:
+        """
+        Streams the content of a completion as it is generated.
+
+        Failures are retried like for acompletion until the first chunk arrives.
+        Closing the iterator early, or cancelling the task consuming it, stops the
+        generation; the cost of what was generated is still accounted for.
+        """
+        start = time.monotonic()
+        try:
+            stream, first_chunk = await self._open_stream(*args, **kwargs)
+        except Exception as e:
+            self._log_call(start, args, kwargs, error=e)
+            raise
+        chunks = []
+        error: Exception | None = None
+        try:
+            if first_chunk is not None:
+                chunks.append(first_chunk)
+                if first_chunk.choices and first_chunk.choices[0].delta.content:
+                    yield first_chunk.choices[0].delta.content
+            async for chunk in stream:
+                chunks.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            await stream.aclose()
+            # the call holds its rate limiter slot until the stream ends
+            await self._arelease(error)
+            resp = None
+            if chunks:
+                import litellm
+
+                resp = litellm.stream_chunk_builder(
+                    chunks, messages=kwargs.get('messages')
+                )
+                if resp is not None:
+                    self._post_completion(resp)
+            self._log_call(start, args, kwargs, resp, error=error)
+
+    def _route(self, call, *args, **kwargs):
+        """
+        Makes a call on the best endpoint of the model, failing over to the next ones
+        while they are unreachable.
+        """
+        if self.router is None:
+            return call(*args, **kwargs)
+        endpoint_errors = _endpoint_errors()
+        error: Exception | None = None
+        for endpoint in self.router.ranked():
+            self.router.start(endpoint)
+            start = time.monotonic()
+            try:
+                resp = call(*args, **{**kwargs, **endpoint.kwargs})
+            except endpoint_errors as e:
+                self._fail(endpoint, e)
+                error = e
+                continue
+            except BaseException:
+                self.router.abandon(endpoint)
+                raise
+            self.router.succeed(endpoint, time.monotonic() - start)
+            return resp
+        assert error is not None
+        raise error
+
+    async def _aroute(self, call, *args, **kwargs):
+        if self.router is None:
+            return await call(*args, **kwargs)
+        endpoint_errors = _endpoint_errors()
+        error: Exception | None = None
+        for endpoint in self.router.ranked():
+            self.router.start(endpoint)
+            start = time.monotonic()
+            try:
+                resp = await call(*args, **{**kwargs, **endpoint.kwargs})
+            except endpoint_errors as e:
+                self._fail(endpoint, e)
+                error = e
+                continue
+            except BaseException:
+                # like a cancellation
+                self.router.abandon(endpoint)
+                raise
+            self.router.succeed(endpoint, time.monotonic() - start)
+            return resp
+        assert error is not None
+        raise error
+
+    async def _aopen_stream(self, call, *args, **kwargs):
+        """
+        Starts a stream, and returns it with its first chunk, or None if it is empty.
+        """
+        stream = await self._aroute(call, *args, stream=True, **kwargs)
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
+        except BaseException:
+            await stream.aclose()
+            raise
+
+    def _get_hedge_delay(self, latencies: LatencyTracker) -> float | None:
+        """
+        Returns how long to wait for a call before sending it again, or None to not
+        hedge it.
+        """
+        if not self.hedge_percentile:
+            return None
+        delay = latencies.percentile(self.hedge_percentile)
+        if delay is None:
+            return None
+        return max(delay, self.hedge_min_delay)
+
+    def _hedged(self, call, messages: list[dict]):
+        """
+        Makes a call, and sends it again if it is slower than most recent calls, and
+        the rate limits leave room for it; the first response wins.
+        """
+        start = time.monotonic()
+        hedged_at: list[float] = []
+
+        def on_hedge() -> bool:
+            if self.rate_limiter is not None and self.rate_limiter.try_acquire(
+                self._get_prompt_tokens(messages=messages)
+            ):
+                return False
+            hedged_at.append(time.monotonic())
+            self.metrics.add_hedge()
+            return True
+
+        def duplicate():
+            # frees the slot it was given by on_hedge
+            try:
+                resp = call()
+            except Exception as e:
+                self._release(e)
+                raise
+            self._release()
+            return resp
+
+        resp, hedge_won = hedge(
+            call,
+            self._get_hedge_delay(self.latencies),
+            on_hedge,
+            lambda loser: self._add_hedge_cost(messages, loser),
+            duplicate,
+        )
+        self._record_latency(self.latencies, start, hedged_at, hedge_won)
+        if hedge_won:
+            self.metrics.add_hedge_win()
+        return resp
+
+    async def _ahedged(self, call, latencies: LatencyTracker, messages: list[dict]):
+        start = time.monotonic()
+        hedged_at: list[float] = []
+
+        async def on_hedge() -> bool:
+            if self.rate_limiter is not None and await self.rate_limiter.atry_acquire(
+                self._get_prompt_tokens(messages=messages)
+            ):
+                return False
+            hedged_at.append(time.monotonic())
+            self.metrics.add_hedge()
+            return True
+
+        async def duplicate():
+            error: BaseException | None = None
+            try:
+                return await call()
+            except BaseException as e:
+                # like being cancelled for losing
+                error = e
+                raise
+            finally:
+                await self._arelease(error)
+
+        async def discard(loser):
+            if isinstance(loser, tuple):
+                # a stream, of which only the prompt is paid for
+                await loser[0].aclose()
+                loser = None
+            self._add_hedge_cost(messages, loser)
+
+        result, hedge_won = await ahedge(
+            call, self._get_hedge_delay(latencies), on_hedge, discard, duplicate
+        )
+        self._record_latency(latencies, start, hedged_at, hedge_won)
+        if hedge_won:
+            self.metrics.add_hedge_win()
+        return result
+
+    @staticmethod
+    def _record_latency(
+        latencies: LatencyTracker, start: float, hedged_at: list[float], hedge_won: bool
+    ) -> None:
+        """
+        Records how long the caller waited for the response, from the start of the
+        first call, and, if the call was hedged, a lower bound of the latency of the
+        call that lost, which is cancelled or ignored.
+        """
+        end = time.monotonic()
+        latencies.record(end - start)
+        if hedged_at:
+            loser_start = start if hedge_won else hedged_at[0]
+            latencies.record(end - loser_start, censored=True)
+
+    def _add_hedge_cost(self, messages: list[dict], resp=None) -> None:
+        """
+        Accounts for the cost of a call that lost to its duplicate: of its response,
+        or, if it was cancelled before, an estimate of the cost of its prompt.
+        """
+        if resp is not None:
+            cost = self.completion_cost(resp)
+        else:
+            cost = self._get_prompt_cost(messages)
+            if cost:
+                self.metrics.add_cost(cost)
+        self.metrics.add_hedge_cost(cost)
+
+    def _get_prompt_cost(self, messages: list[dict]) -> float:
+        if not self.cost_metric_supported or self.is_local():
+            return 0.0
+        import litellm
+
+        try:
+            tokens = self.token_counter.count_messages(messages)
+            if config.llm.input_cost_per_token is not None:
+                return tokens * config.llm.input_cost_per_token
+            return litellm.cost_per_token(model=self.model_name, prompt_tokens=tokens)[
+                0
+            ]
+        except Exception:
+            return 0.0
+
+    def _fail(self, endpoint: Endpoint, error: Exception) -> None:
+        assert self.router is not None
+        self.router.fail(endpoint)
+        logger.warning(f'LLM endpoint {endpoint.base_url} failed, skipping it: {error}')
+
+    def for_tier(self, tier: str) -> 'LLM':
+        """
+        Returns the LLM for the calls of a tier, or this one if the tier has no model
+        of its own. The LLMs of the tiers share the metrics of this one.
+        """
+        if tier not in self.tier_models:
+            return self
+        llm = self._tier_llms.get(tier)
+        if llm is None:
+            model = self.tier_models[tier]
+            base_url = self.tier_base_urls.get(tier)
+            if base_url is None:
+                # the base URL of the config is the one of the main model, and an
+                # empty one keeps the LLM from falling back to it
+                base_url = self.base_url if model == self.model_name else ''
+            llm = LLM(
+                model=model,
+                api_key=self.tier_api_keys.get(tier, self.api_key),
+                base_url=base_url,
+                base_urls=[],
+                api_keys=[],
+                metrics=self.metrics,
+            )
+            llm.tier_models = {}
+            self._tier_llms[tier] = llm
+        return llm
+
+    def cascade(self, tier: str, call: Callable[['LLM'], T]) -> T:
+        """
+        Makes a call, like a completion and the parsing of its response, with the LLM
+        of a tier. If the response can't be parsed, escalates to this LLM.
+
+        Args:
+            tier (str): The tier of the call, like condense, plan or delegate.
+            call (Callable): Makes the call with the LLM it is given.
+        """
+        llm = self.for_tier(tier)
+        if llm is self:
+            return call(self)
+        try:
+            return call(llm)
+        except (LLMMalformedActionError, LLMResponseError) as e:
+            logger.warning(
+                f'Could not parse the response of {llm.model_name}, escalating to {self.model_name}: {e}'
+            )
+            self.metrics.add_escalation()
+            return call(self)
+
+    def _get_cache_key(self, defaults: dict, *args, **kwargs) -> str | None:
+        """
+        Returns the key of a call in the response cache, or None if it isn't cached:
+        calls with a non-zero temperature have different responses each time.
+        """
+        if self.cache is None:
+            return None
+        params = {**defaults, **kwargs}
+        if args:
+            params['args'] = args
+        if not self.cache_force and params.get('temperature') != 0:
+            return None
+        return get_cache_key(params)
+
+    def _get_cached(self, cache_key: str) -> 'ModelResponse | None':
+        assert self.cache is not None
+        try:
+            cached = self.cache.get(cache_key)
+        except sqlite3.Error as e:
+            logger.warning(f'Could not read the LLM response cache: {e}')
+            return None
+        if cached is None:
+            self.metrics.add_cache_miss()
+            return None
+        self.metrics.add_cache_hit(len(cached))
+        from litellm.types.utils import ModelResponse
+
+        return ModelResponse(**json.loads(cached))
+
+    def _put_cached(self, cache_key: str, resp) -> None:
+        from litellm.types.utils import ModelResponse
+
+        assert self.cache is not None
+        data = resp.model_dump() if isinstance(resp, ModelResponse) else dict(resp)
+        try:
+            self.cache.put(cache_key, json.dumps(data))
+        except (sqlite3.Error, TypeError) as e:
+            logger.warning(f'Could not write to the LLM response cache: {e}')
+
+    def _get_prompt_tokens(self, *args, **kwargs) -> int:
+        # only counted when the rate limiter needs them
+        assert self.rate_limiter is not None
+        if not self.rate_limiter.tokens_per_minute:
+            return 0
+        return self.token_counter.count_messages(self._get_messages(*args, **kwargs))
+
+    def _acquire(self, *args, **kwargs) -> None:
+        if self.rate_limiter is not None:
+            self.metrics.add_queue_wait(
+                self.rate_limiter.acquire(self._get_prompt_tokens(*args, **kwargs))
+            )
+
+    async def _aacquire(self, *args, **kwargs) -> None:
+        if self.rate_limiter is not None:
+            self.metrics.add_queue_wait(
+                await self.rate_limiter.aacquire(
+                    self._get_prompt_tokens(*args, **kwargs)
+                )
+            )
+
+    def _get_release_args(self, error: BaseException | None) -> dict:
+        from litellm.exceptions import RateLimitError
+
+        if isinstance(error, RateLimitError):
+            return {
+                'succeeded': False,
+                'rate_limited': True,
+                'retry_after': get_retry_after(error),
+            }
+        return {'succeeded': error is None}
+
+    def _release(self, error: Exception | None = None) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.release(**self._get_release_args(error))
+
+    async def _arelease(self, error: BaseException | None = None) -> None:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.arelease(**self._get_release_args(error))
+
+    def _get_messages(self, *args, **kwargs) -> list[dict]:
+        # some callers might just send the messages directly
+        if 'messages' in kwargs:
+            return kwargs['messages']
+        return args[1]
+
+    def _log_call(
+        self,
+        start: float,
+        args: tuple,
+        kwargs: dict,
+        resp=None,
+        error: Exception | None = None,
+        cached: bool = False,
+    ) -> None:
+        """
+        Logs a call to the transcript, if it is enabled. The record is written as JSON
+        by the thread of the transcript.
+        """
+        if not llm_transcript_logger.isEnabledFor(logging.DEBUG):
+            return
+        transcript: dict = {
+            'session': transcript_session.get(),
+            'step': transcript_step.get(),
+            'model': self.model_name,
+            'latency': time.monotonic() - start,
+            'cached': cached,
+            # a copy, as the agent may add to the list before it is written
+            'messages': list(self._get_messages(*args, **kwargs)),
+        }
+        if resp is not None:
+            usage = resp.get('usage') or {}
+            transcript['prompt_tokens'] = usage.get('prompt_tokens')
+            transcript['completion_tokens'] = usage.get('completion_tokens')
+            transcript['response'] = resp['choices'][0]['message']['content']
+        if error is not None:
+            transcript['error'] = f'{type(error).__name__}: {error}'
+        llm_transcript_logger.debug('LLM call', extra={'transcript': transcript})
+
+    def _post_completion(self, response) -> None:
         """
         Post-process the completion response.
         """
@@ -235,6 +826,11 @@ class LLM:
             cur_cost = self.completion_cost(response)
         except Exception:
             cur_cost = 0
+        usage = response.get('usage')
+        if usage:
+            self.metrics.add_tokens(
+                usage.get('prompt_tokens') or 0, usage.get('completion_tokens') or 0
+            )
         if self.cost_metric_supported:
             logger.info(
                 'Cost: %.2f USD | Accumulated Cost: %.2f USD',
@@ -252,7 +848,21 @@ class LLM:
         Returns:
             int: The number of tokens.
         """
-        return litellm.token_counter(model=self.model_name, messages=messages)
+        return self.token_counter.count_messages(messages)
+
+    def get_response_token_count(self, content: str) -> int:
+        """
+        Get the number of tokens of the content of a response.
+
+        Args:
+            content (str): The content of the response.
+
+        Returns:
+            int: The number of tokens.
+        """
+        return self.token_counter.count_message(
+            {'role': 'assistant', 'content': content}
+        )
 
     def is_local(self):
         """
@@ -289,6 +899,8 @@ class LLM:
             config.llm.input_cost_per_token is not None
             and config.llm.output_cost_per_token is not None
         ):
+            from litellm.types.utils import CostPerToken
+
             cost_per_token = CostPerToken(
                 input_cost_per_token=config.llm.input_cost_per_token,
                 output_cost_per_token=config.llm.output_cost_per_token,
@@ -317,3 +929,15 @@ class LLM:
 
     def __repr__(self):
         return str(self)
+
+
+def _parse_pairs(value: str) -> dict[str, str]:
+    """
+    Parses comma-separated name=value pairs, like the ones of the tiers in LLMConfig.
+    """
+    pairs = {}
+    for pair in value.split(','):
+        name, sep, pair_value = pair.partition('=')
+        if sep and name.strip() and pair_value.strip():
+            pairs[name.strip()] = pair_value.strip()
+    return pairs
@@ -0,0 +1,252 @@
+import asyncio
+import email.utils
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: limits are only shared within the process
+    fcntl = None  # type: ignore
+
+# how long to wait before checking again for a free slot, in seconds
+POLL_INTERVAL = 0.05
+
+_limiters: dict[str, 'RateLimiter'] = {}
+_limiters_lock = threading.Lock()
+
+
+@dataclass
+class _LimiterState:
+    # tokens left in the buckets, refilled continuously
+    requests: float
+    tokens: float
+    updated: float
+    # no calls before this time, as asked by the provider
+    blocked_until: float
+    # the adaptive limit of concurrent calls
+    concurrency: float
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """
+    Returns the seconds to wait from the Retry-After header of a rate limit error's
+    response, if any.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            date = email.utils.parsedate_to_datetime(value)
+            return max(date.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Limits the calls to a provider and model: requests and tokens per minute with
+    token buckets, and concurrent calls with a limit that adapts to rate limit
+    errors, halving on each and growing back by one per round of successes (AIMD).
+    A Retry-After from the provider holds all calls until then. A limit of 0 is
+    unlimited.
+
+    With a state_dir, the buckets, the limit and the hold are shared by the
+    processes on the machine through a locked file; calls in flight are counted
+    per process. The async methods read and write the file in a thread, not to
+    block the event loop.
+    """
+
+    key: str
+    requests_per_minute: int
+    tokens_per_minute: int
+    max_concurrency: int
+
+    def __init__(
+        self,
+        key: str,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrency: int = 0,
+        state_dir: str = '',
+    ):
+        self.key = key
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(max_concurrency, 0)
+        self.state_path = ''
+        if state_dir and fcntl is not None:
+            os.makedirs(state_dir, exist_ok=True)
+            name = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+            self.state_path = os.path.join(state_dir, f'{name}.json')
+        self._lock = threading.Lock()
+        self._state = self._initial_state()
+        self.in_flight = 0
+
+    def _initial_state(self) -> _LimiterState:
+        return _LimiterState(
+            requests=self.requests_per_minute,
+            tokens=self.tokens_per_minute,
+            updated=time.time(),
+            blocked_until=0.0,
+            concurrency=self.max_concurrency,
+        )
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[_LimiterState]:
+        with self._lock:
+            if not self.state_path:
+                yield self._state
+                return
+            with open(self.state_path, 'a+') as f:
+                assert fcntl is not None
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = _LimiterState(**json.loads(f.read()))
+                    except (ValueError, TypeError):
+                        state = self._initial_state()
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(asdict(state)))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state: _LimiterState, now: float):
+        elapsed = max(now - state.updated, 0.0)
+        state.requests = min(
+            state.requests + elapsed * self.requests_per_minute / 60,
+            self.requests_per_minute,
+        )
+        state.tokens = min(
+            state.tokens + elapsed * self.tokens_per_minute / 60,
+            self.tokens_per_minute,
+        )
+        state.updated = now
+
+    def try_acquire(self, tokens: int = 0) -> float:
+        """
+        Takes a slot for a call of about that many tokens if one is free, and returns
+        0. Otherwise returns how long to wait before trying again, in seconds.
+        """
+        now = time.time()
+        with self._locked_state() as state:
+            self._refill(state, now)
+            if state.blocked_until > now:
+                return state.blocked_until - now
+            if self.max_concurrency and self.in_flight >= int(state.concurrency):
+                return POLL_INTERVAL
+            if self.requests_per_minute and state.requests < 1:
+                return (1 - state.requests) * 60 / self.requests_per_minute
+            # a call larger than the bucket waits for the full bucket
+            tokens = min(tokens, self.tokens_per_minute)
+            if self.tokens_per_minute and state.tokens < tokens:
+                return (tokens - state.tokens) * 60 / self.tokens_per_minute
+            if self.requests_per_minute:
+                state.requests -= 1
+            if self.tokens_per_minute:
+                state.tokens -= tokens
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Waits for a slot for a call, and returns how long it waited, in seconds.
+        """
+        start = time.monotonic()
+        while (wait := self.try_acquire(tokens)) > 0:
+            time.sleep(wait)
+        return time.monotonic() - start
+
+    async def atry_acquire(self, tokens: int = 0) -> float:
+        return await self._run(self.try_acquire, tokens)
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        start = time.monotonic()
+        while (wait := await self.atry_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+        return time.monotonic() - start
+
+    async def _run(self, func, *args, **kwargs):
+        if not self.state_path:
+            return func(*args, **kwargs)
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def release(
+        self,
+        succeeded: bool = True,
+        rate_limited: bool = False,
+        retry_after: float | None = None,
+    ):
+        """
+        Frees the slot of a call once it is done. A success lets more calls run at
+        once, and a refusal for exceeding the provider's rate limits fewer.
+        """
+        now = time.time()
+        with self._locked_state() as state:
+            self.in_flight = max(self.in_flight - 1, 0)
+            if rate_limited and retry_after is not None:
+                state.blocked_until = max(state.blocked_until, now + retry_after)
+            if not self.max_concurrency:
+                return
+            if rate_limited:
+                state.concurrency = max(state.concurrency / 2, 1.0)
+            elif succeeded:
+                state.concurrency = min(
+                    state.concurrency + 1 / state.concurrency, self.max_concurrency
+                )
+
+    async def arelease(
+        self,
+        succeeded: bool = True,
+        rate_limited: bool = False,
+        retry_after: float | None = None,
+    ):
+        await self._run(self.release, succeeded, rate_limited, retry_after)
+
+    @property
+    def limited(self) -> bool:
+        return bool(
+            self.requests_per_minute or self.tokens_per_minute or self.max_concurrency
+        )
+
+    @property
+    def concurrency(self) -> int:
+        with self._locked_state() as state:
+            return int(state.concurrency)
+
+
+def get_rate_limiter(
+    key: str,
+    requests_per_minute: int = 0,
+    tokens_per_minute: int = 0,
+    max_concurrency: int = 0,
+    state_dir: str = '',
+) -> RateLimiter:
+    """
+    Returns the rate limiter of a provider and model, shared by the whole process.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(
+                key, requests_per_minute, tokens_per_minute, max_concurrency, state_dir
+            )
+        return limiter
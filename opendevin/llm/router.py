@@ -0,0 +1,122 @@
+import threading
+import time
+from dataclasses import dataclass
+
+# weight of the latest call in the moving average of an endpoint's latency
+LATENCY_ALPHA = 0.3
+# an endpoint that failed is skipped for this long, doubling with each failure in a row
+COOLDOWN = 5.0
+MAX_COOLDOWN = 300.0
+
+
+@dataclass
+class Endpoint:
+    base_url: str
+    api_key: str | None = None
+    # exponentially weighted moving average, in seconds, once a call succeeded
+    latency: float | None = None
+    in_flight: int = 0
+    failures: int = 0
+    down_until: float = 0.0
+    requests: int = 0
+    errors: int = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+    @property
+    def kwargs(self) -> dict:
+        """
+        The arguments of a completion call to this endpoint.
+        """
+        return {'base_url': self.base_url, 'api_key': self.api_key}
+
+
+class EndpointRouter:
+    """
+    Spreads the calls for a model across several endpoints serving it, like
+    replicas of a local server.
+
+    Calls go to the healthy endpoint with the lowest expected latency, which is
+    its moving average latency scaled by the calls it is already serving. An
+    endpoint that fails to answer is taken out for a cooldown, and the call fails
+    over to the next one; when all are down, the one back the soonest is tried.
+    """
+
+    endpoints: list[Endpoint]
+
+    def __init__(self, endpoints: list[Endpoint]):
+        self.endpoints = endpoints
+        self._lock = threading.Lock()
+
+    def _score(self, endpoint: Endpoint, default_latency: float) -> float:
+        latency = endpoint.latency if endpoint.latency is not None else default_latency
+        return latency * (endpoint.in_flight + 1)
+
+    def ranked(self) -> list[Endpoint]:
+        """
+        Returns the endpoints in the order to try them.
+        """
+        with self._lock:
+            latencies = [e.latency for e in self.endpoints if e.latency is not None]
+            # endpoints never timed are assumed as fast as the fastest, and tried first
+            default_latency = min(latencies, default=0.0)
+            healthy = [e for e in self.endpoints if e.healthy]
+            down = [e for e in self.endpoints if not e.healthy]
+            healthy.sort(
+                key=lambda e: (
+                    self._score(e, default_latency),
+                    e.in_flight,
+                    e.latency is not None,
+                )
+            )
+            down.sort(key=lambda e: e.down_until)
+            return healthy + down
+
+    def start(self, endpoint: Endpoint):
+        with self._lock:
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+
+    def succeed(self, endpoint: Endpoint, latency: float):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += LATENCY_ALPHA * (latency - endpoint.latency)
+            endpoint.failures = 0
+            endpoint.down_until = 0.0
+
+    def fail(self, endpoint: Endpoint):
+        """
+        Records that an endpoint couldn't serve a call, and takes it out for a while.
+        """
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.errors += 1
+            endpoint.failures += 1
+            cooldown = min(COOLDOWN * 2 ** (endpoint.failures - 1), MAX_COOLDOWN)
+            endpoint.down_until = time.monotonic() + cooldown
+
+    def abandon(self, endpoint: Endpoint):
+        """
+        Records the end of a call that failed for reasons other than the endpoint.
+        """
+        with self._lock:
+            endpoint.in_flight -= 1
+
+    def get_metrics(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    'base_url': e.base_url,
+                    'latency': e.latency,
+                    'in_flight': e.in_flight,
+                    'healthy': e.healthy,
+                    'requests': e.requests,
+                    'errors': e.errors,
+                }
+                for e in self.endpoints
+            ]
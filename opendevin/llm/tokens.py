@@ -0,0 +1,83 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# litellm counts this many tokens once per list of messages, to prime the reply
+REPLY_TOKENS = 3
+
+_counters: dict[str, 'TokenCounter'] = {}
+_counters_lock = threading.Lock()
+
+
+class TokenCounter:
+    """
+    Counts the tokens of messages with the tokenizer of a model, like
+    litellm.token_counter, but memoized per message.
+
+    Counts are cached by the hash of the role and content of each message, so
+    counting a conversation that grew only tokenizes its new messages.
+    """
+
+    model: str
+    max_entries: int
+
+    def __init__(self, model: str, max_entries: int = 10000):
+        self.model = model
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counts: OrderedDict[bytes, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def count_message(self, message: dict) -> int:
+        """
+        Returns the tokens of a message, with the tokens that frame it.
+        """
+        # imported with the first LLM already
+        import litellm
+
+        content = message.get('content') or ''
+        if not isinstance(content, str):
+            # content parts, like images, are counted as they are
+            return litellm.token_counter(model=self.model, messages=[message])
+        digest = hashlib.blake2b(
+            f'{message.get("role")}\0{content}'.encode('utf-8', 'surrogatepass'),
+            digest_size=16,
+        ).digest()
+        with self._lock:
+            count = self._counts.get(digest)
+            if count is not None:
+                self._counts.move_to_end(digest)
+                self.hits += 1
+                return count
+            self.misses += 1
+        count = (
+            litellm.token_counter(model=self.model, messages=[message]) - REPLY_TOKENS
+        )
+        with self._lock:
+            self._counts[digest] = count
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return count
+
+    def count_messages(self, messages: list[dict]) -> int:
+        """
+        Returns the tokens of a list of messages, as sent to the model.
+        """
+        if not messages:
+            return 0
+        return sum(self.count_message(message) for message in messages) + REPLY_TOKENS
+
+    def get_metrics(self) -> dict:
+        return {'entries': len(self._counts), 'hits': self.hits, 'misses': self.misses}
+
+
+def get_token_counter(model: str) -> TokenCounter:
+    """
+    Returns the token counter of a model, shared by the LLMs of the process.
+    """
+    with _counters_lock:
+        counter = _counters.get(model)
+        if counter is None:
+            counter = _counters[model] = TokenCounter(model)
+        return counter
@@ -1,5 +1,18 @@
+from typing import TYPE_CHECKING
+
 from .condenser import MemoryCondenser
 from .history import ShortTermHistory
-from .memory import LongTermMemory
+
+if TYPE_CHECKING:
+    from .memory import LongTermMemory
 
 __all__ = ['LongTermMemory', 'ShortTermHistory', 'MemoryCondenser']
+
+
+def __getattr__(name: str):
+    # chromadb and llama_index take long to import, and only long-term memory uses them
+    if name == 'LongTermMemory':
+        from .memory import LongTermMemory
+
+        return LongTermMemory
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,235 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from opendevin.core.logger import opendevin_logger as logger
+from opendevin.llm.llm import LLM
+from opendevin.memory.condenser import MemoryCondenser
+
+# once over budget, turns are dropped down to this share of it, so the prompt
+# keeps the same start for a while instead of changing at every step
+LOW_WATER = 0.75
+# characters of each message of a dropped span shown to the summarizer
+SUMMARY_MESSAGE_CHARS = 2000
+
+SUMMARY_PROMPT = """
+Below is the start of a conversation between an agent and its environment,
+which no longer fits in the agent's context window.{previous}
+
+Summarize it for the agent, in a few short paragraphs: what it did, what it
+learned about the task and the environment (like file names, commands that
+work and errors it hit), and what was left to do. Be specific, and don't
+add anything that isn't in the conversation.
+
+CONVERSATION:
+{conversation}
+"""
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix='context-summary')
+        return _executor
+
+
+def _truncate(content: str, max_chars: int) -> str:
+    if len(content) <= max_chars:
+        return content
+    half = max_chars // 2
+    return content[:half] + '\n[... truncated due to length ...]\n' + content[-half:]
+
+
+class ContextWindow:
+    """
+    Fits the history of an agent in the context window of its LLM.
+
+    The history is a list of turns, each the messages of an action and its
+    observation. The pinned messages, like the system prompt and the examples, are
+    always sent. When the prompt gets over the max input tokens of the LLM, the
+    oldest turns are dropped, and summarized in the background by the condense
+    tier of the LLM; the summary takes their place once ready, and a note that
+    they were left out until then.
+
+    The tokens of each turn are kept as the history grows, with a running total of
+    the turns sent, so a step only counts the turns that are new since the last.
+    """
+
+    llm: LLM
+    max_input_tokens: int | None
+
+    def __init__(self, llm: LLM, max_input_tokens: int | None = None):
+        """
+        Parameters:
+        - llm (LLM): The LLM the prompts are for, and the summaries are made with
+        - max_input_tokens (int, optional): The budget of a prompt, by default the
+          max input tokens of the LLM
+        """
+        self.llm = llm
+        self.max_input_tokens = max_input_tokens
+        self.condenser = MemoryCondenser()
+        self.reset()
+
+    def reset(self) -> None:
+        # turns before start are dropped, and those before summarized are summarized
+        self.start = 0
+        self.summarized = 0
+        self.summary: str | None = None
+        self._pending: Future | None = None
+        self._pending_end = 0
+        self._failed_end = 0
+        self.dropped_turns = 0
+        self.summaries = 0
+        # the tokens of each turn counted so far, and of those from start on
+        self._turn_tokens: list[int] = []
+        self._kept_tokens = 0
+        # the tokens of the latest prompt
+        self.tokens = 0
+
+    @property
+    def budget(self) -> int:
+        if self.max_input_tokens is not None:
+            return self.max_input_tokens
+        return self.llm.max_input_tokens or 4096
+
+    def get_messages(self, pinned: list[dict], turns: list[list[dict]]) -> list[dict]:
+        """
+        Returns the messages to prompt the LLM with: the pinned messages, the
+        summary of the dropped turns, if any, and the latest turns that fit.
+
+        Parameters:
+        - pinned (list): The messages always sent, first
+        - turns (list): The messages of each turn of the history, oldest first
+        """
+        if len(turns) < self.start:
+            # another history, like after the state was restored
+            self.reset()
+        self._collect_summary()
+
+        count = self.llm.token_counter.count_message
+        pinned_tokens = sum(count(m) for m in pinned)
+        self._count_turns(turns)
+
+        def total() -> int:
+            tokens = pinned_tokens + self._kept_tokens
+            if self.start > 0:
+                tokens += count(self._get_summary_message(self.start))
+            return tokens
+
+        if total() > self.budget:
+            # the latest turn is always kept
+            while self.start < len(turns) - 1 and total() > self.budget * LOW_WATER:
+                self._kept_tokens -= self._turn_tokens[self.start]
+                self.start += 1
+                self.dropped_turns += 1
+            logger.info(
+                f'Context window: dropped the turns before {self.start} of {len(turns)}'
+            )
+        self._start_summary(turns)
+
+        kept = [m for turn in turns[self.start :] for m in turn]
+        self.tokens = total()
+        over = self.tokens - self.budget
+        if over > 0 and kept:
+            kept = self._shrink(kept, over)
+            self.tokens = self.budget
+        messages = list(pinned)
+        if self.start > 0:
+            messages.append(self._get_summary_message(self.start))
+        return messages + kept
+
+    def _count_turns(self, turns: list[list[dict]]) -> None:
+        """
+        Updates the tokens of the turns with those added since the last call. The
+        latest turn counted is counted again, since its messages can change, like
+        the reminder of the turns left added to the last one.
+        """
+        count = self.llm.token_counter.count_message
+        counted = min(max(len(self._turn_tokens) - 1, 0), len(turns))
+        for index in range(counted, len(self._turn_tokens)):
+            if index >= self.start:
+                self._kept_tokens -= self._turn_tokens[index]
+        del self._turn_tokens[counted:]
+        for index in range(counted, len(turns)):
+            tokens = sum(count(m) for m in turns[index])
+            self._turn_tokens.append(tokens)
+            if index >= self.start:
+                self._kept_tokens += tokens
+
+    def _get_summary_message(self, start: int) -> dict:
+        if self.summary is not None and self.summarized == start:
+            content = f'SUMMARY OF THE EARLIER STEPS:\n{self.summary}'
+        elif self.summary is not None:
+            content = (
+                f'SUMMARY OF THE EARLIER STEPS:\n{self.summary}\n'
+                f'[... {start - self.summarized} more steps left out ...]'
+            )
+        else:
+            content = f'[... {start} earlier steps left out due to length ...]'
+        return {'role': 'user', 'content': content}
+
+    def _shrink(self, messages: list[dict], over: int) -> list[dict]:
+        """
+        Truncates the largest message by about that many tokens, when the latest
+        turn alone doesn't fit.
+        """
+        count = self.llm.token_counter.count_message
+        index = max(range(len(messages)), key=lambda i: len(messages[i]['content']))
+        message = messages[index]
+        tokens = count(message)
+        content = message['content']
+        max_chars = int(len(content) * max(tokens - over, 0) / max(tokens, 1) * 0.9)
+        messages = list(messages)
+        messages[index] = {**message, 'content': _truncate(content, max_chars)}
+        return messages
+
+    def _start_summary(self, turns: list[list[dict]]) -> None:
+        if self._pending is not None or self.summarized >= self.start:
+            return
+        if self.start <= self._failed_end:
+            # tried already, until more turns are dropped
+            return
+        previous = self.summary
+        dropped = [m for turn in turns[self.summarized : self.start] for m in turn]
+        conversation = '\n\n'.join(
+            f"{m['role'].upper()}:\n{_truncate(m['content'], SUMMARY_MESSAGE_CHARS)}"
+            for m in dropped
+        )
+        prompt = SUMMARY_PROMPT.format(
+            previous=(
+                f'\nThe start of the conversation was already summarized:\n{previous}'
+                if previous
+                else ''
+            ),
+            conversation=conversation,
+        )
+        self._pending_end = self.start
+        self._pending = _get_executor().submit(
+            self.condenser.condense, prompt, self.llm
+        )
+
+    def _collect_summary(self) -> None:
+        if self._pending is None or not self._pending.done():
+            return
+        future, self._pending = self._pending, None
+        try:
+            summary = future.result()
+        except Exception as e:
+            # the dropped turns stay left out, and are summarized again with the next
+            logger.warning(f'Could not summarize the dropped turns: {e}')
+            self._failed_end = self._pending_end
+            return
+        if summary:
+            self.summary = summary
+            self.summarized = self._pending_end
+            self.summaries += 1
+
+    def get_metrics(self) -> dict:
+        return {
+            'dropped_turns': self.dropped_turns,
+            'summarized_turns': self.summarized,
+            'summaries': self.summaries,
+        }
@@ -16,6 +16,7 @@ from tenacity import (
 from opendevin.core.config import config
 from opendevin.core.logger import opendevin_logger as logger
 from opendevin.core.utils import json
+from opendevin.llm.rate_limit import get_rate_limiter, get_retry_after
 
 num_retries = config.llm.num_retries
 retry_min_wait = config.llm.retry_min_wait
@@ -52,7 +53,26 @@ def attempt_on_error(retry_state):
     after=attempt_on_error,
 )
 def wrapper_get_embeddings(*args, **kwargs):
-    return original_get_embeddings(*args, **kwargs)
+    # embeddings share the rate limits of the other processes and sessions
+    rate_limiter = get_rate_limiter(
+        f'embeddings/{config.llm.embedding_model}',
+        config.llm.rate_limit_requests_per_minute,
+        max_concurrency=config.llm.rate_limit_max_concurrency,
+        state_dir=config.llm.rate_limit_state_dir,
+    )
+    rate_limiter.acquire()
+    try:
+        embeddings = original_get_embeddings(*args, **kwargs)
+    except RateLimitError as e:
+        rate_limiter.release(
+            succeeded=False, rate_limited=True, retry_after=get_retry_after(e)
+        )
+        raise
+    except Exception:
+        rate_limiter.release(succeeded=False)
+        raise
+    rate_limiter.release()
+    return embeddings
 
 
 llama_openai.get_embeddings = wrapper_get_embeddings
@@ -1,7 +1,20 @@
+from typing import TYPE_CHECKING
+
 from .docker.exec_box import DockerExecBox
 from .docker.local_box import LocalBox
 from .docker.ssh_box import DockerSSHBox
-from .e2b.sandbox import E2BBox
 from .sandbox import Sandbox
 
+if TYPE_CHECKING:
+    from .e2b.sandbox import E2BBox
+
 __all__ = ['Sandbox', 'DockerSSHBox', 'DockerExecBox', 'E2BBox', 'LocalBox']
+
+
+def __getattr__(name: str):
+    # the e2b client takes long to import, and only the e2b sandbox uses it
+    if name == 'E2BBox':
+        from .e2b.sandbox import E2BBox
+
+        return E2BBox
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
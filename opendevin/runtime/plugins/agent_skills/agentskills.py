@@ -25,12 +25,6 @@ import tempfile
 from inspect import signature
 from typing import Optional
 
-import docx
-import PyPDF2
-from openai import OpenAI
-from pptx import Presentation
-from pylatexenc.latex2text import LatexNodes2Text
-
 CURRENT_FILE: str | None = None
 CURRENT_LINE = 1
 WINDOW = 100
@@ -50,7 +44,13 @@ MAX_TOKEN = os.getenv('MAX_TOKEN', 500)
 
 OPENAI_PROXY = f'{OPENAI_BASE_URL}/chat/completions'
 
-client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+
+# the readers import their libraries when used, as the host imports this module too
+@functools.lru_cache(maxsize=None)
+def _get_openai_client():
+    from openai import OpenAI
+
+    return OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
 
 # Define the decorator using the functionality of UpdatePwd
@@ -644,6 +644,8 @@ def parse_pdf(file_path: str) -> None:
     Args:
         file_path: str: The path to the file to open.
     """
+    import PyPDF2
+
     print(f'[Reading PDF file from {file_path}]')
     content = PyPDF2.PdfReader(file_path)
     text = ''
@@ -664,6 +666,8 @@ def parse_docx(file_path: str) -> None:
     Args:
         file_path: str: The path to the file to open.
     """
+    import docx
+
     print(f'[Reading DOCX file from {file_path}]')
     content = docx.Document(file_path)
     text = ''
@@ -680,6 +684,8 @@ def parse_latex(file_path: str) -> None:
     Args:
         file_path: str: The path to the file to open.
     """
+    from pylatexenc.latex2text import LatexNodes2Text
+
     print(f'[Reading LaTex file from {file_path}]')
     with open(file_path) as f:
         data = f.read()
@@ -739,7 +745,9 @@ def parse_audio(file_path: str, model: str = 'whisper-1') -> None:
     try:
         # TODO: record the COST of the API call
         with open(file_path, 'rb') as audio_file:
-            transcript = client.audio.translations.create(model=model, file=audio_file)
+            transcript = _get_openai_client().audio.translations.create(
+                model=model, file=audio_file
+            )
         print(transcript.text)
 
     except Exception as e:
@@ -761,7 +769,7 @@ def parse_image(
     # TODO: record the COST of the API call
     try:
         base64_image = _base64_img(file_path)
-        response = client.chat.completions.create(
+        response = _get_openai_client().chat.completions.create(
             model=OPENAI_MODEL,
             messages=_prepare_image_messages(task, base64_image),
             max_tokens=MAX_TOKEN,
@@ -808,7 +816,7 @@ def parse_video(
         print(f'Process the {file_path}, current No. {idx * frame_interval} frame...')
         # TODO: record the COST of the API call
         try:
-            response = client.chat.completions.create(
+            response = _get_openai_client().chat.completions.create(
                 model=OPENAI_MODEL,
                 messages=_prepare_image_messages(task, base64_frame),
                 max_tokens=MAX_TOKEN,
@@ -830,6 +838,8 @@ def parse_pptx(file_path: str) -> None:
     Args:
         file_path: str: The path to the file to open.
     """
+    from pptx import Presentation
+
     print(f'[Reading PowerPoint file from {file_path}]')
     try:
         pres = Presentation(str(file_path))
@@ -1,11 +1,16 @@
 import asyncio
 from abc import abstractmethod
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional
 
 from opendevin.core.config import config
 from opendevin.core.exceptions import BrowserInitException
 from opendevin.core.logger import opendevin_logger as logger
-from opendevin.events import EventSource, EventStream, EventStreamSubscriber
+from opendevin.events import (
+    EventFilter,
+    EventSource,
+    EventStream,
+    EventStreamSubscriber,
+)
 from opendevin.events.action import (
     Action,
     AgentRecallAction,
@@ -28,15 +33,16 @@ from opendevin.events.serialization.action import ACTION_TYPE_TO_CLASS
 from opendevin.runtime import (
     DockerExecBox,
     DockerSSHBox,
-    E2BBox,
     LocalBox,
     Sandbox,
 )
-from opendevin.runtime.browser.browser_env import BrowserEnv
 from opendevin.runtime.plugins import PluginRequirement
 from opendevin.runtime.tools import RuntimeTool
 from opendevin.storage import FileStore, InMemoryFileStore
 
+if TYPE_CHECKING:
+    from opendevin.runtime.browser.browser_env import BrowserEnv
+
 
 def create_sandbox(sid: str = 'default', sandbox_type: str = 'exec') -> Sandbox:
     if sandbox_type == 'exec':
@@ -46,6 +52,8 @@ def create_sandbox(sid: str = 'default', sandbox_type: str = 'exec') -> Sandbox:
     elif sandbox_type == 'ssh':
         return DockerSSHBox(sid=sid)
     elif sandbox_type == 'e2b':
+        from opendevin.runtime.e2b.sandbox import E2BBox
+
         return E2BBox()
     else:
         raise ValueError(f'Invalid sandbox type: {sandbox_type}')
@@ -75,10 +83,14 @@ class Runtime:
         else:
             self.sandbox = sandbox
             self._is_external_sandbox = True
-        self.browser: BrowserEnv | None = None
+        self.browser: 'BrowserEnv | None' = None
         self.file_store = InMemoryFileStore()
         self.event_stream = event_stream
-        self.event_stream.subscribe(EventStreamSubscriber.RUNTIME, self.on_event)
+        self.event_stream.subscribe(
+            EventStreamSubscriber.RUNTIME,
+            self.on_event,
+            event_filter=EventFilter(include_types=(Action,)),
+        )
         self._bg_task = asyncio.create_task(self._start_background_observation_loop())
 
     def close(self):
@@ -102,6 +114,9 @@ class Runtime:
             if runtime_tools_config is None:
                 runtime_tools_config = {}
             browser_env_config = runtime_tools_config.get(RuntimeTool.BROWSER, {})
+            # browsergym is slow to import, and only needed with a browser
+            from opendevin.runtime.browser.browser_env import BrowserEnv
+
             try:
                 self.browser = BrowserEnv(is_async=is_async, **browser_env_config)
             except BrowserInitException:
@@ -1,12 +1,15 @@
 import os
+from typing import TYPE_CHECKING
 
 from opendevin.core.exceptions import BrowserUnavailableException
 from opendevin.core.schema import ActionType
 from opendevin.events.observation import BrowserOutputObservation
-from opendevin.runtime.browser.browser_env import BrowserEnv
 
+if TYPE_CHECKING:
+    from opendevin.runtime.browser.browser_env import BrowserEnv
 
-async def browse(action, browser: BrowserEnv | None) -> BrowserOutputObservation:
+
+async def browse(action, browser: 'BrowserEnv | None') -> BrowserOutputObservation:
     if browser is None:
         raise BrowserUnavailableException()
     if action.action == ActionType.BROWSE:
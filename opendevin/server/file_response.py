@@ -0,0 +1,91 @@
+from typing import Iterator
+
+from fastapi import Response, status
+from fastapi.responses import StreamingResponse
+
+from opendevin.storage.files import FileInfo, FileStore
+
+# files are streamed to and from the file store in chunks of this size
+CHUNK_SIZE = 1024 * 1024
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parses a Range header for a file of the given size, into the start and end
+    (exclusive) of the range.
+
+    Returns None if the header isn't a single byte range, which is served as the
+    whole file, and raises ValueError if the range is outside of the file.
+    """
+    unit, _, spec = header.partition('=')
+    first, sep, last = spec.strip().partition('-')
+    if unit.strip() != 'bytes' or not sep or ',' in spec:
+        return None
+    if (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        # the last bytes of the file
+        if not last or int(last) == 0:
+            raise ValueError(header)
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        raise ValueError(header)
+    return start, end
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches an ETag, with the weak comparison.
+    """
+    tags = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in tags
+
+
+def iter_file(
+    file_store: FileStore, path: str, start: int, end: int
+) -> Iterator[bytes]:
+    if start == 0:
+        with file_store.open_read(path) as f:
+            remaining = end
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        return
+    for offset in range(start, end, CHUNK_SIZE):
+        yield file_store.read_range(path, offset, min(CHUNK_SIZE, end - offset))
+
+
+def file_response(
+    file_store: FileStore, path: str, info: FileInfo, range_header: str | None
+) -> Response:
+    """
+    Streams a file, or the part of it asked for by a Range header.
+    """
+    headers = {'ETag': f'"{info.etag}"', 'Accept-Ranges': 'bytes'}
+    try:
+        byte_range = parse_range(range_header, info.size) if range_header else None
+    except ValueError:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={'Content-Range': f'bytes */{info.size}'},
+        )
+    if byte_range is None:
+        start, end = 0, info.size
+        status_code = status.HTTP_200_OK
+    else:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{info.size}'
+    headers['Content-Length'] = str(end - start)
+    return StreamingResponse(
+        iter_file(file_store, path, start, end),
+        status_code=status_code,
+        media_type='application/octet-stream',
+        headers=headers,
+    )
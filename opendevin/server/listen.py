@@ -1,3 +1,4 @@
+import shutil
 import uuid
 import warnings
 
@@ -21,8 +22,14 @@ from opendevin.core.logger import opendevin_logger as logger
 from opendevin.events.action import ChangeAgentStateAction, NullAction
 from opendevin.events.observation import AgentStateChangedObservation, NullObservation
 from opendevin.events.serialization import event_to_dict
+from opendevin.events.serialization.codec import negotiate_codec
 from opendevin.llm import bedrock
 from opendevin.server.auth import get_sid_from_token, sign_token
+from opendevin.server.file_response import (
+    CHUNK_SIZE,
+    etag_matches,
+    file_response,
+)
 from opendevin.server.session import session_manager
 
 app = FastAPI()
@@ -82,6 +89,9 @@ async def websocket_endpoint(websocket: WebSocket):
     """
     WebSocket endpoint for receiving events from the client (i.e., the browser).
 
+    Messages are JSON text frames by default. Clients can ask for MessagePack binary
+    frames instead by offering the `opendevin.msgpack` subprotocol.
+
     Once connected, you can send various actions:
     - Initialize the agent:
         ```json
@@ -140,7 +150,8 @@ async def websocket_endpoint(websocket: WebSocket):
         {"action": "finish", "args": {}}
         ```
     """
-    await websocket.accept()
+    codec, subprotocol = negotiate_codec(websocket.scope.get('subprotocols', []))
+    await websocket.accept(subprotocol=subprotocol)
 
     session = None
     if websocket.query_params.get('token'):
@@ -148,20 +159,20 @@ async def websocket_endpoint(websocket: WebSocket):
         sid = get_sid_from_token(token)
 
         if sid == '':
-            await websocket.send_json({'error': 'Invalid token', 'error_code': 401})
+            await codec.send(websocket, {'error': 'Invalid token', 'error_code': 401})
             await websocket.close()
             return
     else:
         sid = str(uuid.uuid4())
         token = sign_token({'sid': sid})
 
-    session = session_manager.add_or_restart_session(sid, websocket)
-    await websocket.send_json({'token': token, 'status': 'ok'})
+    session = await session_manager.add_or_restart_session(sid, websocket, codec)
+    await codec.send(websocket, {'token': token, 'status': 'ok'})
 
     latest_event_id = -1
     if websocket.query_params.get('latest_event_id'):
         latest_event_id = int(websocket.query_params.get('latest_event_id'))
-    for event in session.agent_session.event_stream.get_events(
+    async for event in session.agent_session.event_stream.aget_events(
         start_id=latest_event_id + 1
     ):
         if isinstance(event, NullAction) or isinstance(event, NullObservation):
@@ -170,7 +181,7 @@ async def websocket_endpoint(websocket: WebSocket):
             event, AgentStateChangedObservation
         ):
             continue
-        await websocket.send_json(event_to_dict(event))
+        await codec.send(websocket, event_to_dict(event))
 
     await session.loop_recv()
 
@@ -270,7 +281,7 @@ def list_files(request: Request, path: str = '/'):
 
 
 @app.get('/api/select-file')
-def select_file(file: str, request: Request):
+def select_file(file: str, request: Request, raw: bool = False):
     """
     Select a file.
 
@@ -278,9 +289,27 @@ def select_file(file: str, request: Request):
     ```sh
     curl http://localhost:3000/api/select-file?file=<file_path>
     ```
+
+    With raw=true, or a Range header, the file itself is streamed instead,
+    whole or in part:
+    ```sh
+    curl -H "Range: bytes=0-1023" http://localhost:3000/api/select-file?file=<file_path>
+    ```
+    Either way, a request with the ETag of the file in If-None-Match gets a 304.
     """
+    file_store = request.state.session.agent_session.runtime.file_store
     try:
-        content = request.state.session.agent_session.runtime.file_store.read(file)
+        info = file_store.stat(file)
+        etag = f'"{info.etag}"'
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag}
+            )
+        range_header = request.headers.get('range')
+        if raw or range_header:
+            return file_response(file_store, file, info, range_header)
+        content = file_store.read(file)
     except Exception as e:
         logger.error(f'Error opening file {file}: {e}', exc_info=False)
         error_msg = f'Error opening file: {e}'
@@ -288,11 +317,11 @@ def select_file(file: str, request: Request):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={'error': error_msg},
         )
-    return {'code': content}
+    return JSONResponse(content={'code': content}, headers={'ETag': etag})
 
 
 @app.post('/api/upload-files')
-async def upload_file(request: Request, files: list[UploadFile]):
+def upload_file(request: Request, files: list[UploadFile]):
     """
     Upload files to the workspace.
 
@@ -301,12 +330,12 @@ async def upload_file(request: Request, files: list[UploadFile]):
     curl -X POST -F "file=@<file_path1>" -F "file=@<file_path2>" http://localhost:3000/api/upload-files
     ```
     """
+    file_store = request.state.session.agent_session.runtime.file_store
     try:
         for file in files:
-            file_contents = await file.read()
-            request.state.session.agent_session.runtime.file_store.write(
-                file.filename, file_contents
-            )
+            # copied in chunks from the spooled upload, rather than read whole
+            with file_store.open_write(file.filename) as f:
+                shutil.copyfileobj(file.file, f, CHUNK_SIZE)
     except Exception as e:
         logger.error(f'Error saving files: {e}', exc_info=True)
         return JSONResponse(
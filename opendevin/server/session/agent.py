@@ -1,8 +1,8 @@
 from typing import Optional
 
-from agenthub.codeact_agent.codeact_agent import CodeActAgent
 from opendevin.controller import AgentController
 from opendevin.controller.agent import Agent
+from opendevin.controller.state.checkpoint import StateCheckpointer
 from opendevin.controller.state.state import State
 from opendevin.core.config import config
 from opendevin.core.logger import opendevin_logger as logger
@@ -26,12 +26,21 @@ class AgentSession:
     event_stream: EventStream
     controller: Optional[AgentController] = None
     runtime: Optional[Runtime] = None
+    checkpointer: StateCheckpointer
     _closed: bool = False
 
-    def __init__(self, sid):
-        """Initializes a new instance of the Session class."""
+    def __init__(self, sid, event_stream: EventStream | None = None):
+        """Initializes a new instance of the Session class.
+
+        Args:
+            sid: The session ID.
+            event_stream: The event stream of the session, opened with EventStream.aopen (optional).
+        """
         self.sid = sid
-        self.event_stream = EventStream(sid)
+        self.event_stream = (
+            event_stream if event_stream is not None else EventStream(sid)
+        )
+        self.checkpointer = StateCheckpointer(sid, self.event_stream)
 
     async def start(self, start_event: dict):
         """Starts the agent session.
@@ -51,10 +60,11 @@ class AgentSession:
             return
         if self.controller is not None:
             end_state = self.controller.get_state()
-            end_state.save_to_session(self.sid)
+            await self.checkpointer.save(end_state)
             await self.controller.close()
         if self.runtime is not None:
             self.runtime.close()
+        await self.event_stream.close()
         self._closed = True
 
     async def _create_runtime(self):
@@ -96,7 +106,8 @@ class AgentSession:
         logger.info(f'Creating agent {agent_cls} using LLM {model}')
         llm = LLM(model=model, api_key=api_key, base_url=api_base)
         agent = Agent.get_cls(agent_cls)(llm)
-        if isinstance(agent, CodeActAgent):
+        # the class is imported only now, like the other agents
+        if isinstance(agent, Agent.get_cls('CodeActAgent')):
             if not self.runtime or not isinstance(self.runtime.sandbox, DockerSSHBox):
                 logger.warning(
                     'CodeActAgent requires DockerSSHBox as sandbox! Using other sandbox that are not stateful (LocalBox, DockerExecBox) will not work properly.'
@@ -110,9 +121,13 @@ class AgentSession:
             agent=agent,
             max_iterations=int(max_iterations),
             max_chars=int(max_chars),
+            checkpointer=self.checkpointer,
         )
         try:
-            agent_state = State.restore_from_session(self.sid)
+            agent_state = await self.checkpointer.restore()
+            if agent_state is None:
+                # sessions saved before checkpoints existed
+                agent_state = await State.restore_from_session(self.sid)
             self.controller.set_state(agent_state)
             logger.info(f'Restored agent state from session, sid: {self.sid}')
         except Exception as e:
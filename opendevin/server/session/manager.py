@@ -5,6 +5,8 @@ from typing import Optional
 from fastapi import WebSocket
 
 from opendevin.core.logger import opendevin_logger as logger
+from opendevin.events.serialization.codec import EventCodec
+from opendevin.events.stream import EventStream
 
 from .session import Session
 
@@ -17,10 +19,16 @@ class SessionManager:
     def __init__(self):
         asyncio.create_task(self._cleanup_sessions())
 
-    def add_or_restart_session(self, sid: str, ws_conn: WebSocket) -> Session:
+    async def add_or_restart_session(
+        self, sid: str, ws_conn: WebSocket, codec: EventCodec | None = None
+    ) -> Session:
         if sid in self._sessions:
-            asyncio.create_task(self._sessions[sid].close())
-        self._sessions[sid] = Session(sid=sid, ws=ws_conn)
+            # the old session has to flush its events before the new one reopens the log
+            await self._sessions[sid].close()
+        event_stream = await EventStream.aopen(sid)
+        self._sessions[sid] = Session(
+            sid=sid, ws=ws_conn, codec=codec, event_stream=event_stream
+        )
         return self._sessions[sid]
 
     def get_session(self, sid: str) -> Session | None:
@@ -9,13 +9,15 @@ from opendevin.core.schema import AgentState
 from opendevin.core.schema.action import ActionType
 from opendevin.events.action import ChangeAgentStateAction, NullAction
 from opendevin.events.event import Event, EventSource
+from opendevin.events.filter import EventFilter
 from opendevin.events.observation import (
     AgentStateChangedObservation,
     CmdOutputObservation,
     NullObservation,
 )
 from opendevin.events.serialization import event_from_dict, event_to_dict
-from opendevin.events.stream import EventStreamSubscriber
+from opendevin.events.serialization.codec import EventCodec, JsonCodec, get_codec
+from opendevin.events.stream import EventStream, EventStreamSubscriber
 
 from .agent import AgentSession
 
@@ -29,13 +31,22 @@ class Session:
     is_alive: bool = True
     agent_session: AgentSession
 
-    def __init__(self, sid: str, ws: WebSocket | None):
+    def __init__(
+        self,
+        sid: str,
+        ws: WebSocket | None,
+        codec: EventCodec | None = None,
+        event_stream: EventStream | None = None,
+    ):
         self.sid = sid
         self.websocket = ws
+        self.codec = codec if codec is not None else get_codec(JsonCodec.name)
         self.last_active_ts = int(time.time())
-        self.agent_session = AgentSession(sid)
+        self.agent_session = AgentSession(sid, event_stream)
         self.agent_session.event_stream.subscribe(
-            EventStreamSubscriber.SERVER, self.on_event
+            EventStreamSubscriber.SERVER,
+            self.on_event,
+            event_filter=EventFilter(exclude_types=(NullAction, NullObservation)),
         )
 
     async def close(self):
@@ -48,9 +59,9 @@ class Session:
                 return
             while True:
                 try:
-                    data = await self.websocket.receive_json()
+                    data = await self.codec.receive(self.websocket)
                 except ValueError:
-                    await self.send_error('Invalid JSON')
+                    await self.send_error(f'Invalid {self.codec.name.upper()}')
                     continue
                 await self.dispatch(data)
         except WebSocketDisconnect:
@@ -75,6 +86,10 @@ class Session:
                 f'Error creating controller. Please check Docker is running and visit `{TROUBLESHOOTING_URL}` for more debugging information..'
             )
             return
+        if self.agent_session.controller is not None:
+            self.agent_session.controller.agent.partial_response_callback = (
+                self.send_partial_response
+            )
         await self.agent_session.event_stream.add_event(
             ChangeAgentStateAction(AgentState.INIT), EventSource.USER
         )
@@ -85,10 +100,6 @@ class Session:
         Args:
             event: The agent event (Observation or Action).
         """
-        if isinstance(event, NullAction):
-            return
-        if isinstance(event, NullObservation):
-            return
         if event.source == EventSource.AGENT:
             await self.send(event_to_dict(event))
         elif event.source == EventSource.USER and isinstance(
@@ -108,7 +119,7 @@ class Session:
         try:
             if self.websocket is None or not self.is_alive:
                 return False
-            await self.websocket.send_json(data)
+            await self.codec.send(self.websocket, data)
             await asyncio.sleep(0.001)  # This flushes the data to the client
             self.last_active_ts = int(time.time())
             return True
@@ -124,8 +135,14 @@ class Session:
         """Sends a message to the client."""
         return await self.send({'message': message})
 
-    def update_connection(self, ws: WebSocket):
+    async def send_partial_response(self, content: str) -> bool:
+        """Sends a piece of the agent's response as it is being generated."""
+        return await self.send({'partial_response': True, 'content': content})
+
+    def update_connection(self, ws: WebSocket, codec: EventCodec | None = None):
         self.websocket = ws
+        if codec is not None:
+            self.codec = codec
         self.is_alive = True
         self.last_active_ts = int(time.time())
 
@@ -3,14 +3,19 @@ from opendevin.core.config import config
 from .files import FileStore
 from .local import LocalFileStore
 from .memory import InMemoryFileStore
-from .s3 import S3FileStore
 
 
 def _get_file_store() -> FileStore:
     if config.file_store == 'local':
         return LocalFileStore(config.file_store_path)
     elif config.file_store == 's3':
-        return S3FileStore()
+        # minio is only imported when the files are stored in S3
+        from .s3 import S3FileStore
+
+        return S3FileStore(
+            cache_dir=config.file_store_cache_dir,
+            cache_size=config.file_store_cache_size,
+        )
     return InMemoryFileStore()
 
 
@@ -19,3 +24,11 @@ singleton = _get_file_store()
 
 def get_file_store() -> FileStore:
     return singleton
+
+
+def __getattr__(name: str):
+    if name == 'S3FileStore':
+        from .s3 import S3FileStore
+
+        return S3FileStore
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import zlib
+from types import ModuleType
+
+from .files import FileStore
+
+zstandard: ModuleType | None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _compress(data: str) -> str:
+    raw = data.encode('utf-8')
+    if zstandard is not None:
+        scheme, compressed = 'zstd', zstandard.ZstdCompressor().compress(raw)
+    else:
+        scheme, compressed = 'zlib', zlib.compress(raw)
+    encoded = base64.b64encode(compressed).decode('ascii')
+    # already compressed data (like base64 images) doesn't shrink, and base64 makes it grow
+    if len(encoded) >= len(data):
+        return 'raw:' + data
+    return f'{scheme}:{encoded}'
+
+
+def _decompress(contents: str) -> str:
+    scheme, _, encoded = contents.partition(':')
+    if scheme == 'raw':
+        return encoded
+    compressed = base64.b64decode(encoded)
+    if scheme == 'zlib':
+        return zlib.decompress(compressed).decode('utf-8')
+    if scheme == 'zstd':
+        if zstandard is None:
+            raise ValueError('Reading this blob requires the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(compressed).decode('utf-8')
+    raise ValueError(f'Unknown blob encoding: {scheme}')
+
+
+class BlobStore:
+    """
+    Content-addressed store of compressed strings on top of a FileStore.
+
+    Blobs are named after the SHA-256 of their contents, so storing the same
+    contents twice writes them once. They are compressed with zstd when the
+    zstandard package is installed, and zlib otherwise; either can be read back.
+    """
+
+    dirname: str
+
+    def __init__(self, file_store: FileStore, dirname: str):
+        self.file_store = file_store
+        self.dirname = dirname.rstrip('/') + '/'
+        self._known: set[str] | None = None
+
+    @staticmethod
+    def hash(data: str) -> str:
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _get_filename(self, key: str) -> str:
+        return f'{self.dirname}{key}'
+
+    def _get_known(self) -> set[str]:
+        if self._known is None:
+            try:
+                paths = self.file_store.list(self.dirname)
+            except FileNotFoundError:
+                paths = []
+            self._set_known(paths)
+        assert self._known is not None
+        return self._known
+
+    async def _aget_known(self) -> set[str]:
+        if self._known is None:
+            try:
+                paths = await self.file_store.alist(self.dirname)
+            except FileNotFoundError:
+                paths = []
+            # another call may have listed them while this one was waiting
+            if self._known is None:
+                self._set_known(paths)
+        assert self._known is not None
+        return self._known
+
+    def _set_known(self, paths: list[str]):
+        self._known = {path.rstrip('/').split('/')[-1] for path in paths}
+
+    def has(self, key: str) -> bool:
+        return key in self._get_known()
+
+    def write(self, data: str) -> str:
+        """
+        Stores data unless it is already there, and returns its key.
+        """
+        key = self.hash(data)
+        if not self.has(key):
+            self.file_store.write(self._get_filename(key), _compress(data))
+            self._get_known().add(key)
+        return key
+
+    async def awrite(self, data: str) -> str:
+        key = self.hash(data)
+        known = await self._aget_known()
+        if key not in known:
+            await self.file_store.awrite(self._get_filename(key), _compress(data))
+            known.add(key)
+        return key
+
+    def read(self, key: str) -> str:
+        return _decompress(self.file_store.read(self._get_filename(key)))
+
+    async def aread(self, key: str) -> str:
+        return _decompress(await self.file_store.aread(self._get_filename(key)))
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """
+    Least recently used cache of file contents on local disk, keyed by path and
+    version (like an ETag), so a changed file is never served stale. Only the
+    latest version of each path is kept.
+
+    Entries survive restarts: the cache is rebuilt from the directory, oldest first.
+    """
+
+    dirname: str
+    max_bytes: int
+
+    def __init__(self, dirname: str, max_bytes: int):
+        self.dirname = dirname
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key hash -> (version hash, size), least recently used first
+        self._entries: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(dirname, exist_ok=True)
+        found = []
+        for filename in os.listdir(dirname):
+            full_path = os.path.join(dirname, filename)
+            key_hash, _, version_hash = filename.partition('-')
+            if not version_hash or filename.endswith('.tmp'):
+                os.remove(full_path)
+                continue
+            stat = os.stat(full_path)
+            found.append((stat.st_mtime, key_hash, version_hash, stat.st_size))
+        for _, key_hash, version_hash, size in sorted(found):
+            self._remove(key_hash)
+            self._entries[key_hash] = (version_hash, size)
+            self.size += size
+
+    def _get_path(self, key_hash: str, version_hash: str) -> str:
+        return os.path.join(self.dirname, f'{key_hash}-{version_hash}')
+
+    def get(self, key: str, version: str) -> bytes | None:
+        key_hash, version_hash = _hash(key), _hash(version)[:16]
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None or entry[0] != version_hash:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key_hash)
+        try:
+            with open(self._get_path(key_hash, version_hash), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._remove(key_hash)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, version: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        key_hash, version_hash = _hash(key), _hash(version)[:16]
+        path = self._get_path(key_hash, version_hash)
+        # write then rename, so that readers never see a partial entry
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is not None and entry[0] != version_hash:
+                self._remove(key_hash)
+            elif entry is not None:
+                self.size -= self._entries.pop(key_hash)[1]
+            os.replace(tmp_path, path)
+            self._entries[key_hash] = (version_hash, len(data))
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._remove(_hash(key))
+
+    def _remove(self, key_hash: str):
+        entry = self._entries.pop(key_hash, None)
+        if entry is None:
+            return
+        self.size -= entry[1]
+        try:
+            os.remove(self._get_path(key_hash, entry[0]))
+        except FileNotFoundError:
+            pass
+
+    def get_metrics(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
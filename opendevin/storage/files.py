@@ -1,7 +1,50 @@
+import asyncio
+import builtins
+import hashlib
+import io
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import BinaryIO, Iterator
+
+# blocking file store calls made from the event loop run on this many threads at most
+MAX_WORKERS = 8
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=MAX_WORKERS, thread_name_prefix='file_store'
+        )
+    return _executor
+
+
+@dataclass
+class FileInfo:
+    size: int
+    # changes whenever the contents do
+    etag: str
+
+
+def _encode(contents: str) -> bytes:
+    # stores of strings keep bytes that aren't valid UTF-8 as surrogates, so that
+    # binary files survive the round trip
+    return contents.encode('utf-8', 'surrogateescape')
+
+
+def _decode(data: bytes) -> str:
+    return data.decode('utf-8', 'surrogateescape')
 
 
 class FileStore:
+    # whether append writes only the new contents, rather than rewriting the file
+    appends_natively: bool = False
+
     @abstractmethod
     def write(self, path: str, contents: str) -> None:
         pass
@@ -17,3 +60,96 @@ class FileStore:
     @abstractmethod
     def delete(self, path: str) -> None:
         pass
+
+    def append(self, path: str, contents: str) -> None:
+        """
+        Append contents to the end of a file, creating it if it does not exist.
+
+        Stores that can append natively should override this; the default
+        rewrites the whole file.
+        """
+        try:
+            existing = self.read(path)
+        except FileNotFoundError:
+            existing = ''
+        self.write(path, existing + contents)
+
+    def read_many(self, paths: builtins.list[str]) -> dict[str, str]:
+        """
+        Read several files at once. Raises FileNotFoundError if any of them is missing.
+        """
+        return {path: self.read(path) for path in paths}
+
+    @contextmanager
+    def open_read(self, path: str) -> Iterator[BinaryIO]:
+        """
+        Open a file to read it as bytes, like `with store.open_read(path) as f`.
+
+        Stores that can stream should override this; the default reads the whole file.
+        """
+        yield io.BytesIO(_encode(self.read(path)))
+
+    @contextmanager
+    def open_write(self, path: str) -> Iterator[BinaryIO]:
+        """
+        Open a file to write it as bytes. The file is only replaced once the block
+        exits without an error.
+
+        Stores that can stream should override this; the default buffers the whole file.
+        """
+        buffer = io.BytesIO()
+        yield buffer
+        self.write(path, _decode(buffer.getvalue()))
+
+    def read_range(self, path: str, offset: int, length: int) -> bytes:
+        """
+        Read at most length bytes of a file, starting at offset.
+        """
+        with self.open_read(path) as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def stat(self, path: str) -> FileInfo:
+        data = _encode(self.read(path))
+        return FileInfo(len(data), hashlib.md5(data).hexdigest())
+
+    def fsync(self, path: str) -> None:
+        """
+        Flush a file to durable storage. A no-op for stores whose writes are already durable.
+        """
+        pass
+
+    # The async variants run the blocking methods on a bounded thread pool, so a
+    # slow storage call doesn't stall the event loop. Stores that don't block
+    # can override them to skip the thread hop.
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), partial(func, *args))
+
+    async def awrite(self, path: str, contents: str) -> None:
+        await self._run(self.write, path, contents)
+
+    async def aread(self, path: str) -> str:
+        return await self._run(self.read, path)
+
+    async def aread_many(self, paths: builtins.list[str]) -> dict[str, str]:
+        return await self._run(self.read_many, paths)
+
+    async def alist(self, path: str) -> builtins.list[str]:
+        return await self._run(self.list, path)
+
+    async def adelete(self, path: str) -> None:
+        await self._run(self.delete, path)
+
+    async def aappend(self, path: str, contents: str) -> None:
+        await self._run(self.append, path, contents)
+
+    async def aread_range(self, path: str, offset: int, length: int) -> bytes:
+        return await self._run(self.read_range, path, offset, length)
+
+    async def astat(self, path: str) -> FileInfo:
+        return await self._run(self.stat, path)
+
+    async def afsync(self, path: str) -> None:
+        await self._run(self.fsync, path)
@@ -1,10 +1,14 @@
 import os
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
 
-from .files import FileStore
+from .files import FileInfo, FileStore
 
 
 class LocalFileStore(FileStore):
     root: str
+    appends_natively = True
 
     def __init__(self, root: str):
         self.root = root
@@ -21,11 +25,50 @@ class LocalFileStore(FileStore):
         with open(full_path, 'w') as f:
             f.write(contents)
 
+    def append(self, path: str, contents: str) -> None:
+        full_path = self.get_full_path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'a') as f:
+            f.write(contents)
+
+    def fsync(self, path: str) -> None:
+        full_path = self.get_full_path(path)
+        with open(full_path, 'a') as f:
+            os.fsync(f.fileno())
+
     def read(self, path: str) -> str:
         full_path = self.get_full_path(path)
         with open(full_path, 'r') as f:
             return f.read()
 
+    @contextmanager
+    def open_read(self, path: str) -> Iterator[BinaryIO]:
+        with open(self.get_full_path(path), 'rb') as f:
+            yield f
+
+    @contextmanager
+    def open_write(self, path: str) -> Iterator[BinaryIO]:
+        full_path = self.get_full_path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # written aside and renamed, so a failed write leaves the previous file as is
+        tmp_path = f'{full_path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                yield f
+            os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def read_range(self, path: str, offset: int, length: int) -> bytes:
+        with open(self.get_full_path(path), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def stat(self, path: str) -> FileInfo:
+        stat = os.stat(self.get_full_path(path))
+        return FileInfo(stat.st_size, f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
     def list(self, path: str) -> list[str]:
         full_path = self.get_full_path(path)
         files = [os.path.join(path, f) for f in os.listdir(full_path)]
@@ -1,40 +1,172 @@
+import builtins
 import os
+import sys
 
-from .files import FileStore
+from .files import FileInfo, FileStore
+
+
+class _Directory:
+    __slots__ = ('dirs', 'files')
+
+    def __init__(self):
+        self.dirs: dict[str, _Directory] = {}
+        self.files: set[str] = set()
+
+
+def _split(path: str) -> builtins.list[str]:
+    return [part for part in path.split('/') if part not in ('', '.')]
+
+
+def _sizeof(chunks: builtins.list[str]) -> int:
+    return sum(sys.getsizeof(chunk) for chunk in chunks)
 
 
 class InMemoryFileStore(FileStore):
-    files: dict[str, str]
+    """
+    File store that keeps files in a dict, indexed by a tree of directories so that
+    listing a directory only looks at its children.
+
+    Paths are normalized like on a file system: 'foo/bar', './foo/bar' and
+    '/foo/bar' are the same file. Appends are kept as chunks, joined on the next
+    read, so that appending to a file doesn't copy it.
+    """
+
+    files: dict[str, builtins.list[str]]
+    appends_natively = True
 
     def __init__(self):
         self.files = {}
+        self._root = _Directory()
+        # approximate memory taken by the keys and contents, in bytes
+        self._size = 0
+
+    def _get_key(self, path: str) -> str:
+        return '/'.join(_split(path))
+
+    def _find_dir(self, parts: builtins.list[str]) -> _Directory | None:
+        node: _Directory | None = self._root
+        for part in parts:
+            if node is None:
+                return None
+            node = node.dirs.get(part)
+        return node
+
+    def _set(self, key: str, contents: str):
+        previous = self.files.get(key)
+        if previous is None:
+            parts = key.split('/')
+            node = self._root
+            for part in parts[:-1]:
+                node = node.dirs.setdefault(part, _Directory())
+            node.files.add(parts[-1])
+            self._size += sys.getsizeof(key)
+        else:
+            self._size -= _sizeof(previous)
+        self.files[key] = [contents]
+        self._size += sys.getsizeof(contents)
 
     def write(self, path: str, contents: str) -> None:
-        self.files[path] = contents
+        self._set(self._get_key(path), contents)
+
+    def append(self, path: str, contents: str) -> None:
+        key = self._get_key(path)
+        chunks = self.files.get(key)
+        if chunks is None:
+            self._set(key, contents)
+            return
+        chunks.append(contents)
+        self._size += sys.getsizeof(contents)
 
     def read(self, path: str) -> str:
-        if path not in self.files:
+        key = self._get_key(path)
+        chunks = self.files.get(key)
+        if chunks is None:
             raise FileNotFoundError(path)
-        return self.files[path]
+        if len(chunks) > 1:
+            self._size -= _sizeof(chunks)
+            chunks[:] = [''.join(chunks)]
+            self._size += _sizeof(chunks)
+        return chunks[0]
+
+    def read_many(self, paths: builtins.list[str]) -> dict[str, str]:
+        return {path: self.read(path) for path in paths}
 
     def list(self, path: str) -> list[str]:
-        files = []
-        for file in self.files:
-            if not file.startswith(path):
-                continue
-            suffix = file.removeprefix(path)
-            parts = suffix.split('/')
-            if parts[0] == '':
-                parts.pop(0)
-            if len(parts) == 1:
-                files.append(file)
-            else:
-                dir_path = os.path.join(path, parts[0])
-                if not dir_path.endswith('/'):
-                    dir_path += '/'
-                if dir_path not in files:
-                    files.append(dir_path)
-        return files
+        node = self._find_dir(_split(path))
+        if node is None:
+            return []
+        files = [os.path.join(path, name) for name in node.files]
+        files += [os.path.join(path, name) + '/' for name in node.dirs]
+        return sorted(files)
 
     def delete(self, path: str) -> None:
-        del self.files[path]
+        """
+        Deletes a file, or a directory with everything in it.
+        """
+        parts = _split(path)
+        key = '/'.join(parts)
+        if key in self.files:
+            self._size -= sys.getsizeof(key) + _sizeof(self.files.pop(key))
+            parent = self._find_dir(parts[:-1])
+            assert parent is not None
+            parent.files.discard(parts[-1])
+        else:
+            parent = self._find_dir(parts[:-1])
+            if not parts or parent is None or parts[-1] not in parent.dirs:
+                raise FileNotFoundError(path)
+            self._delete_dir(key, parent.dirs.pop(parts[-1]))
+        self._prune(parts[:-1])
+
+    def _delete_dir(self, key: str, node: _Directory):
+        for name in node.files:
+            file_key = f'{key}/{name}'
+            self._size -= sys.getsizeof(file_key) + _sizeof(self.files.pop(file_key))
+        for name, child in node.dirs.items():
+            self._delete_dir(f'{key}/{name}', child)
+
+    def _prune(self, parts: builtins.list[str]):
+        # drop the directories left empty, like they never existed
+        while parts:
+            parent = self._find_dir(parts[:-1])
+            assert parent is not None
+            node = parent.dirs[parts[-1]]
+            if node.dirs or node.files:
+                return
+            del parent.dirs[parts[-1]]
+            parts = parts[:-1]
+
+    def get_metrics(self) -> dict:
+        """
+        Returns the number of files, and the approximate memory in bytes taken by
+        their paths and contents.
+        """
+        return {'files': len(self.files), 'bytes': self._size}
+
+    # nothing here blocks, so the async variants skip the executor
+
+    async def awrite(self, path: str, contents: str) -> None:
+        self.write(path, contents)
+
+    async def aread(self, path: str) -> str:
+        return self.read(path)
+
+    async def aread_many(self, paths: builtins.list[str]) -> dict[str, str]:
+        return self.read_many(paths)
+
+    async def aread_range(self, path: str, offset: int, length: int) -> bytes:
+        return self.read_range(path, offset, length)
+
+    async def astat(self, path: str) -> FileInfo:
+        return self.stat(path)
+
+    async def alist(self, path: str) -> builtins.list[str]:
+        return self.list(path)
+
+    async def adelete(self, path: str) -> None:
+        self.delete(path)
+
+    async def aappend(self, path: str, contents: str) -> None:
+        self.append(path, contents)
+
+    async def afsync(self, path: str) -> None:
+        pass
@@ -1,27 +1,203 @@
+import builtins
+import io
 import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, cast
 
+import certifi
+import urllib3
 from minio import Minio
+from minio.error import S3Error
 
-from .files import FileStore
+from .disk_cache import DiskCache
+from .files import MAX_WORKERS, FileInfo, FileStore
 
 AWS_S3_ENDPOINT = 's3.amazonaws.com'
+# objects are uploaded in parts of this size, so large ones are streamed rather
+# than buffered whole (S3 requires at least 5 MiB)
+PART_SIZE = 8 * 1024 * 1024
+
+_http_client: urllib3.PoolManager | None = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> urllib3.PoolManager:
+    """
+    Returns the connection pool shared by all S3 file stores. It keeps a connection
+    per file store thread alive, and retries failed requests with backoff.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = urllib3.PoolManager(
+                maxsize=MAX_WORKERS * 2,
+                block=False,
+                timeout=urllib3.Timeout(connect=10, read=120),
+                cert_reqs='CERT_REQUIRED',
+                ca_certs=os.getenv('SSL_CERT_FILE') or certifi.where(),
+                retries=urllib3.Retry(
+                    total=5,
+                    backoff_factor=0.2,
+                    status_forcelist=[500, 502, 503, 504],
+                ),
+            )
+        return _http_client
+
+
+def _get_key(path: str) -> str:
+    return '/'.join(part for part in path.split('/') if part not in ('', '.'))
+
+
+def _check_not_found(e: S3Error, path: str):
+    if e.code in ('NoSuchKey', 'NoSuchObject'):
+        raise FileNotFoundError(path) from e
 
 
 class S3FileStore(FileStore):
-    def __init__(self, endpoint: str = AWS_S3_ENDPOINT) -> None:
-        access_key = os.getenv('AWS_ACCESS_KEY_ID')
-        secret_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-        self.bucket = os.getenv('AWS_S3_BUCKET')
-        self.client = Minio(endpoint, access_key, secret_key)
+    """
+    File store on an S3 compatible object storage.
+
+    The endpoint, bucket and credentials come from the AWS_S3_ENDPOINT, AWS_S3_BUCKET,
+    AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables, and
+    AWS_S3_SECURE=false talks plain HTTP, like to a local MinIO server.
+
+    With a cache_dir, files read are kept on local disk by ETag, so reading a file
+    that didn't change only asks the storage for its metadata.
+    """
+
+    bucket: str
+    cache: DiskCache | None
+
+    def __init__(
+        self,
+        endpoint: str | None = None,
+        client: Minio | None = None,
+        cache_dir: str = '',
+        cache_size: int = 1024 * 1024 * 1024,
+    ) -> None:
+        self.bucket = os.getenv('AWS_S3_BUCKET', '')
+        if client is None:
+            client = Minio(
+                endpoint or os.getenv('AWS_S3_ENDPOINT') or AWS_S3_ENDPOINT,
+                os.getenv('AWS_ACCESS_KEY_ID'),
+                os.getenv('AWS_SECRET_ACCESS_KEY'),
+                secure=os.getenv('AWS_S3_SECURE', 'true').lower() != 'false',
+                http_client=get_http_client(),
+            )
+        self.client = client
+        self.cache = DiskCache(cache_dir, cache_size) if cache_dir else None
 
     def write(self, path: str, contents: str) -> None:
-        self.client.put_object(self.bucket, path, contents)
+        data = contents.encode('utf-8')
+        key = _get_key(path)
+        result = self.client.put_object(
+            self.bucket, key, io.BytesIO(data), len(data), part_size=PART_SIZE
+        )
+        if self.cache is not None and result.etag:
+            self.cache.put(key, result.etag, data)
+
+    def write_stream(self, path: str, stream: BinaryIO, length: int = -1) -> None:
+        """
+        Uploads a file from a binary stream, in parts, without reading it whole in
+        memory. The length may be left out when it isn't known.
+        """
+        key = _get_key(path)
+        self.client.put_object(self.bucket, key, stream, length, part_size=PART_SIZE)
+        if self.cache is not None:
+            self.cache.invalidate(key)
 
     def read(self, path: str) -> str:
-        return self.client.get_object(self.bucket, path).data.decode('utf-8')
+        key = _get_key(path)
+        try:
+            if self.cache is not None:
+                etag = self.client.stat_object(self.bucket, key).etag or ''
+                data = self.cache.get(key, etag)
+                if data is not None:
+                    return data.decode('utf-8')
+            response = self.client.get_object(self.bucket, key)
+            try:
+                data = response.read()
+                etag = response.headers.get('ETag', '').strip('"')
+            finally:
+                response.close()
+                response.release_conn()
+        except S3Error as e:
+            _check_not_found(e, path)
+            raise
+        if self.cache is not None and etag:
+            self.cache.put(key, etag, data)
+        return data.decode('utf-8')
+
+    @contextmanager
+    def open_read(self, path: str) -> Iterator[BinaryIO]:
+        try:
+            response = self.client.get_object(self.bucket, _get_key(path))
+        except S3Error as e:
+            _check_not_found(e, path)
+            raise
+        try:
+            yield cast(BinaryIO, response)
+        finally:
+            response.close()
+            response.release_conn()
+
+    @contextmanager
+    def open_write(self, path: str) -> Iterator[BinaryIO]:
+        # spooled to disk past a part, then uploaded in parts
+        with tempfile.SpooledTemporaryFile(max_size=PART_SIZE) as f:
+            yield cast(BinaryIO, f)
+            length = f.tell()
+            f.seek(0)
+            self.write_stream(path, cast(BinaryIO, f), length)
 
-    def list(self, path: str) -> list[str]:
-        return [obj.object_name for obj in self.client.list_objects(self.bucket, path)]
+    def read_range(self, path: str, offset: int, length: int) -> bytes:
+        if length <= 0:
+            return b''
+        try:
+            response = self.client.get_object(
+                self.bucket, _get_key(path), offset=offset, length=length
+            )
+        except S3Error as e:
+            _check_not_found(e, path)
+            raise
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def stat(self, path: str) -> FileInfo:
+        try:
+            obj = self.client.stat_object(self.bucket, _get_key(path))
+        except S3Error as e:
+            _check_not_found(e, path)
+            raise
+        return FileInfo(obj.size or 0, obj.etag or '')
+
+    def iter_list(self, path: str) -> Iterator[str]:
+        """
+        Yields the files and directories (ending with a slash) right under a
+        directory, fetching them a page at a time.
+        """
+        prefix = _get_key(path)
+        if prefix:
+            prefix += '/'
+        for obj in self.client.list_objects(self.bucket, prefix, recursive=False):
+            yield obj.object_name
+
+    def list(self, path: str) -> builtins.list[str]:
+        return list(self.iter_list(path))
 
     def delete(self, path: str) -> None:
-        self.client.remove_object(self.bucket, path)
+        key = _get_key(path)
+        self.client.remove_object(self.bucket, key)
+        if self.cache is not None:
+            self.cache.invalidate(key)
+
+    def get_metrics(self) -> dict:
+        """
+        Returns the metrics of the read cache, if any.
+        """
+        return self.cache.get_metrics() if self.cache is not None else {}
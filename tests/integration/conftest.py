@@ -161,6 +161,10 @@ def mock_completion(*args, test_name, **kwargs):
     return response
 
 
+async def mock_acompletion(*args, test_name, **kwargs):
+    return mock_completion(*args, test_name=test_name, **kwargs)
+
+
 @pytest.fixture(autouse=True)
 def patch_completion(monkeypatch, request):
     test_name = request.node.name
@@ -169,6 +173,10 @@ def patch_completion(monkeypatch, request):
         'opendevin.llm.llm.litellm_completion',
         partial(mock_completion, test_name=test_name),
     )
+    monkeypatch.setattr(
+        'opendevin.llm.llm.litellm_acompletion',
+        partial(mock_acompletion, test_name=test_name),
+    )
 
     # Mock user input (only for tests that have user_responses.log)
     user_responses_str = mock_user_response(test_name=test_name)
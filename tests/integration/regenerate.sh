@@ -174,7 +174,24 @@ regenerate_with_llm() {
   set +x
 
   mkdir -p tests/integration/mock/$agent/$test_name/
-  mv logs/llm/**/* tests/integration/mock/$agent/$test_name/
+  # split the LLM transcript into the prompt and response files of the mock
+  poetry run python - tests/integration/mock/$agent/$test_name/ <<'EOF'
+import json
+import os
+import sys
+
+from opendevin.llm.llm import message_separator
+
+with open('logs/llm/transcript.jsonl') as f:
+    records = [json.loads(line) for line in f]
+calls = [r for r in records if 'response' in r and not r.get('cached')]
+for i, record in enumerate(calls, start=1):
+    prompt = ''.join(message_separator + m['content'] for m in record['messages'])
+    with open(os.path.join(sys.argv[1], f'prompt_{i:03}.log'), 'w') as f:
+        f.write(prompt)
+    with open(os.path.join(sys.argv[1], f'response_{i:03}.log'), 'w') as f:
+        f.write(record['response'])
+EOF
 
 }
 
@@ -0,0 +1,174 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from opendevin.controller.agent_controller import AgentController
+from opendevin.controller.state.checkpoint import StateCheckpointer
+from opendevin.controller.state.state import State
+from opendevin.core.metrics import Metrics
+from opendevin.core.schema import AgentState
+from opendevin.events import EventSource, EventStream
+from opendevin.events.action import (
+    AddTaskAction,
+    CmdRunAction,
+    MessageAction,
+    NullAction,
+)
+from opendevin.events.observation import CmdOutputObservation, NullObservation
+from opendevin.storage import get_file_store
+
+
+async def run_command(stream, command, output):
+    action = CmdRunAction(command=command)
+    await stream.add_event(action, EventSource.AGENT)
+    observation = CmdOutputObservation(output, command_id=-1, command=command)
+    observation._cause = action.id  # type: ignore[attr-defined]
+    await stream.add_event(observation, EventSource.AGENT)
+    return action, observation
+
+
+def summarize(history):
+    return [
+        (type(action).__name__, action.id, type(obs).__name__, obs.id)
+        for action, obs in history
+    ]
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_and_replay():
+    stream = EventStream('checkpoint1')
+    checkpointer = StateCheckpointer('checkpoint1', stream)
+    state = State(agent_state=AgentState.RUNNING)
+    message = MessageAction('list the files')
+    await stream.add_event(message, EventSource.USER)
+    state.history.append((message, NullObservation('')))
+    state.history.append(await run_command(stream, 'ls', 'a.txt'))
+    state.root_task.add_subtask('', 'list files')
+    state.iteration = 1
+    state.metrics.add_cost(0.5)
+    state.metrics.add_tokens(100, 20)
+    await checkpointer.save(state)
+
+    # events that came after the checkpoint are replayed on restore
+    add_task = AddTaskAction(parent='', goal='read a.txt', subtasks=[])
+    await stream.add_event(add_task, EventSource.AGENT)
+    state.history.append((add_task, NullObservation('')))
+    state.history.append(await run_command(stream, 'cat a.txt', 'hello'))
+    background = CmdOutputObservation('tick', command_id=1, command='watch')
+    await stream.add_event(background, EventSource.USER)
+    state.history.append((NullAction(), background))
+    await stream.close()
+
+    stream = EventStream('checkpoint1')
+    restored = await StateCheckpointer('checkpoint1', stream).restore()
+    assert restored is not None
+    assert summarize(restored.history) == summarize(state.history)
+    assert restored.history[1][1].content == 'a.txt'
+    assert [task.goal for task in restored.root_task.subtasks] == [
+        'list files',
+        'read a.txt',
+    ]
+    assert restored.iteration == 3
+    assert restored.metrics.accumulated_cost == 0.5
+    assert restored.metrics.prompt_tokens == 100
+    assert restored.agent_state == AgentState.LOADING
+    assert restored.resume_state == AgentState.RUNNING
+    assert any(
+        path.startswith('sessions/checkpoint1/checkpoint.')
+        for path in get_file_store().list('sessions/checkpoint1')
+    )
+
+
+@pytest.mark.asyncio
+async def test_no_checkpoint():
+    stream = EventStream('checkpoint2')
+    assert await StateCheckpointer('checkpoint2', stream).restore() is None
+
+
+@pytest.mark.asyncio
+async def test_latest_checkpoint_wins():
+    stream = EventStream('checkpoint3')
+    checkpointer = StateCheckpointer('checkpoint3', stream)
+    for iteration in range(3):
+        await checkpointer.save(State(iteration=iteration))
+    # a new checkpointer continues the sequence instead of starting over
+    await StateCheckpointer('checkpoint3', stream).save(State(iteration=3))
+    restored = await StateCheckpointer('checkpoint3', stream).restore()
+    assert restored is not None
+    assert restored.iteration == 3
+
+
+@pytest.mark.asyncio
+async def test_replay_pairs_actions_pending_at_the_checkpoint():
+    stream = EventStream('checkpoint4')
+    checkpointer = StateCheckpointer('checkpoint4', stream)
+    action = CmdRunAction(command='sleep 5')
+    await stream.add_event(action, EventSource.AGENT)
+    # the action is still pending, so it isn't in the history yet
+    await checkpointer.save(State(iteration=1))
+    observation = CmdOutputObservation('', command_id=-1, command='sleep 5')
+    observation._cause = action.id  # type: ignore[attr-defined]
+    await stream.add_event(observation, EventSource.AGENT)
+    await stream.close()
+
+    restored = await StateCheckpointer(
+        'checkpoint4', EventStream('checkpoint4')
+    ).restore()
+    assert restored is not None
+    assert summarize(restored.history) == [
+        ('CmdRunAction', action.id, 'CmdOutputObservation', observation.id)
+    ]
+    assert restored.iteration == 1
+
+
+@pytest.mark.asyncio
+async def test_event_handled_during_save():
+    stream = EventStream('checkpoint6')
+    checkpointer = StateCheckpointer('checkpoint6', stream)
+    state = State()
+    load = checkpointer._load
+
+    async def load_while_the_agent_runs():
+        add_task = AddTaskAction(parent='', goal='read a.txt', subtasks=[])
+        await stream.add_event(add_task, EventSource.AGENT)
+        state.history.append((add_task, NullObservation('')))
+        state.root_task.add_subtask('', 'read a.txt')
+        state.iteration += 1
+        return await load()
+
+    checkpointer._load = load_while_the_agent_runs  # type: ignore[method-assign]
+    await checkpointer.save(state)
+    await stream.close()
+
+    restored = await StateCheckpointer(
+        'checkpoint6', EventStream('checkpoint6')
+    ).restore()
+    assert restored is not None
+    # in the checkpoint or replayed, but not both
+    assert summarize(restored.history) == summarize(state.history)
+    assert [task.goal for task in restored.root_task.subtasks] == ['read a.txt']
+    assert restored.iteration == 1
+
+
+@pytest.mark.asyncio
+async def test_controller_waits_for_its_checkpoint_on_close():
+    stream = EventStream('checkpoint5')
+    agent = MagicMock()
+    agent.llm.metrics = Metrics()
+    controller = AgentController(
+        agent,
+        stream,
+        sid='checkpoint5',
+        max_budget_per_task=None,
+        initial_state=State(iteration=2),
+        is_delegate=True,
+        checkpointer=StateCheckpointer('checkpoint5', stream),
+        checkpoint_interval=2,
+    )
+    await controller.update_state_after_step()
+    assert controller._checkpoint_task is not None
+    await controller.close()
+    assert controller._checkpoint_task is None
+    restored = await StateCheckpointer('checkpoint5', stream).restore()
+    assert restored is not None
+    assert restored.iteration == 2
@@ -279,6 +279,8 @@ def test_api_keys_repr_str():
     # This will fail when new attrs are added, and attract attention
     known_key_token_attrs_llm = [
         'api_key',
+        'api_keys',
+        'tier_api_keys',
         'aws_access_key_id',
         'aws_secret_access_key',
         'input_cost_per_token',
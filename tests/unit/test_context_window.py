@@ -0,0 +1,148 @@
+import threading
+from functools import partial
+from unittest.mock import MagicMock
+
+import litellm
+
+from agenthub.codeact_agent.codeact_agent import CodeActAgent
+from opendevin.controller.state.state import State
+from opendevin.events import EventSource
+from opendevin.events.action import MessageAction
+from opendevin.events.observation import CmdOutputObservation, NullObservation
+from opendevin.llm import llm as llm_module
+from opendevin.llm.llm import LLM
+from opendevin.llm.tokens import TokenCounter
+from opendevin.memory.context_window import ContextWindow
+
+
+def _llm(max_input_tokens: int, summary: str = 'It listed the files.'):
+    llm = MagicMock()
+    llm.max_input_tokens = max_input_tokens
+    llm.token_counter = TokenCounter('gpt-4o')
+    llm.summarized = threading.Event()
+    llm.prompts = []
+
+    def completion(messages):
+        llm.prompts.append(messages[0]['content'])
+        llm.summarized.wait(5)
+        return {'choices': [{'message': {'content': summary}}]}
+
+    llm.for_tier.return_value.completion.side_effect = completion
+    return llm
+
+
+def _turns(n: int) -> list[list[dict]]:
+    return [
+        [
+            {
+                'role': 'assistant',
+                'content': f'<execute_bash>\nls dir{i}\n</execute_bash>',
+            },
+            {'role': 'user', 'content': 'OBSERVATION:\n' + f'file{i}.py ' * 100},
+        ]
+        for i in range(n)
+    ]
+
+
+PINNED = [
+    {'role': 'system', 'content': 'You are a helpful assistant.'},
+    {'role': 'user', 'content': 'List the files.'},
+]
+
+
+def test_fits_without_dropping():
+    llm = _llm(100_000)
+    window = ContextWindow(llm)
+    turns = _turns(5)
+    assert window.get_messages(PINNED, turns) == PINNED + [
+        m for turn in turns for m in turn
+    ]
+    llm.for_tier.assert_not_called()
+
+
+def test_drops_and_summarizes_the_oldest_turns():
+    llm = _llm(2000)
+    window = ContextWindow(llm)
+    turns = _turns(20)
+    messages = window.get_messages(PINNED, turns)
+    assert messages[:2] == PINNED
+    assert 'earlier steps left out' in messages[2]['content']
+    assert messages[-1] == turns[-1][-1]
+    assert llm.token_counter.count_messages(messages) <= 2000
+    # dropped down to the low water mark, so the next turns fit for a while
+    start = window.start
+    assert window.get_messages(PINNED, turns + _turns(1))[3:5] == turns[start]
+
+    # the summary replaces the note once ready
+    llm.summarized.set()
+    window._pending.result()
+    messages = window.get_messages(PINNED, turns)
+    assert (
+        messages[2]['content'] == 'SUMMARY OF THE EARLIER STEPS:\nIt listed the files.'
+    )
+    assert 'ls dir0' in llm.prompts[0]
+    assert window.get_metrics()['summarized_turns'] == start
+
+
+def test_shrinks_a_turn_too_long_for_the_window():
+    llm = _llm(500)
+    window = ContextWindow(llm)
+    turns = [[{'role': 'user', 'content': 'OBSERVATION:\n' + 'word ' * 2000}]]
+    messages = window.get_messages(PINNED, turns)
+    assert 'truncated due to length' in messages[-1]['content']
+    assert llm.token_counter.count_messages(messages) <= 500
+
+
+def test_counts_only_the_new_turns():
+    llm = _llm(2000)
+    window = ContextWindow(llm)
+    turns = _turns(30)
+    window.get_messages(PINNED, turns[:20])
+    count_message = llm.token_counter.count_message
+    counted = []
+
+    def count(message):
+        counted.append(message)
+        return count_message(message)
+
+    llm.token_counter.count_message = count
+    window.get_messages(PINNED, turns)
+    # the latest turn counted before is counted again, with the new ones
+    assert not any(m in counted for turn in turns[:19] for m in turn)
+
+    def kept_tokens():
+        return sum(count_message(m) for turn in turns[window.start :] for m in turn)
+
+    assert window._kept_tokens == kept_tokens()
+    turns = turns[:25]
+    window.get_messages(PINNED, turns)
+    assert window._kept_tokens == kept_tokens()
+
+
+def test_long_task_stays_within_the_token_budget(monkeypatch):
+    response = 'Let me check.\n<execute_bash>\nls\n</execute_bash>'
+    monkeypatch.setattr(
+        llm_module,
+        'litellm_completion',
+        partial(litellm.completion, mock_response=response),
+    )
+    llm = LLM(
+        model='gpt-4o', api_key='x', max_input_tokens=8000, cost_metric_supported=False
+    )
+    agent = CodeActAgent(llm)
+    message = MessageAction('List the files')
+    message._source = EventSource.USER
+    state = State(history=[(message, NullObservation(''))], max_iterations=100)
+    for i in range(40):
+        tokens = state.num_of_tokens
+        action = agent.step(state)
+        # each prompt fills the window, and is counted with the response
+        assert (
+            0
+            < state.num_of_tokens - tokens
+            <= 8000 + llm.get_response_token_count(response)
+        )
+        obs = CmdOutputObservation(f'file{i}.py ' * 1000, command_id=i, command='ls')
+        state.history.append((action, obs))
+        state.iteration += 1
+    assert agent.context_window.get_metrics()['dropped_turns'] > 0
@@ -0,0 +1,43 @@
+import pytest
+
+from opendevin.events.observation import CmdOutputObservation
+from opendevin.events.serialization import event_from_dict, event_to_dict
+from opendevin.events.serialization.codec import (
+    available_codecs,
+    get_codec,
+    negotiate_codec,
+)
+
+
+@pytest.mark.parametrize('name', available_codecs())
+def test_codec_roundtrip(name):
+    codec = get_codec(name)
+    data = event_to_dict(
+        CmdOutputObservation('total 0\né', command_id=3, command='ls -l')
+    )
+    encoded = codec.encode(data)
+    assert isinstance(encoded, bytes)
+    assert codec.decode(encoded) == data
+    assert isinstance(event_from_dict(codec.decode(encoded)), CmdOutputObservation)
+    with pytest.raises(ValueError):
+        codec.decode(b'\xc1 not an event')
+
+
+def test_negotiate_codec():
+    codec, subprotocol = negotiate_codec([])
+    assert codec.name == 'json'
+    assert subprotocol is None
+
+    codec, subprotocol = negotiate_codec(['graphql-ws', 'opendevin.json'])
+    assert codec.name == 'json'
+    assert subprotocol == 'opendevin.json'
+
+    if 'msgpack' in available_codecs():
+        codec, subprotocol = negotiate_codec(['opendevin.msgpack', 'opendevin.json'])
+        assert codec.name == 'msgpack'
+        assert subprotocol == 'opendevin.msgpack'
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec('xml')
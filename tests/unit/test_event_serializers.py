@@ -0,0 +1,68 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from opendevin.events import EventSource
+from opendevin.events.action import (
+    AddTaskAction,
+    AgentFinishAction,
+    CmdRunAction,
+    MessageAction,
+    NullAction,
+)
+from opendevin.events.observation import (
+    BrowserOutputObservation,
+    CmdOutputObservation,
+    NullObservation,
+)
+from opendevin.events.serialization import event_to_dict, event_to_memory
+from opendevin.events.serialization.benchmark import (
+    asdict_event_to_dict,
+    asdict_event_to_memory,
+)
+
+
+def make_events():
+    stored = CmdOutputObservation('total 0', command_id=3, command='ls', exit_code=1)
+    stored._id = 7  # type: ignore[attr-defined]
+    stored._cause = 6  # type: ignore[attr-defined]
+    stored._source = EventSource.AGENT  # type: ignore[attr-defined]
+    stored._timestamp = datetime(2024, 6, 1, 12, 0, 0)  # type: ignore[attr-defined]
+    return [
+        NullAction(),
+        NullObservation(''),
+        MessageAction('hello', wait_for_response=True),
+        CmdRunAction(command='ls -l', background=True),
+        AgentFinishAction(outputs={'answer': [1, {'nested': (2, 3)}]}),
+        AddTaskAction(parent='', goal='do it', subtasks=[{'goal': 'sub'}]),
+        stored,
+        BrowserOutputObservation(
+            'page',
+            url='https://example.com',
+            screenshot='abc',
+            dom_object={'node': {'screenshot': 'nested', 'children': []}},
+            axtree_object={'role': 'root'},
+            open_pages_urls=['https://example.com'],
+        ),
+    ]
+
+
+@pytest.mark.parametrize('event', make_events(), ids=lambda event: type(event).__name__)
+def test_serializers_match_asdict(event):
+    assert json.dumps(event_to_dict(event)) == json.dumps(asdict_event_to_dict(event))
+    assert json.dumps(event_to_memory(event)) == json.dumps(
+        asdict_event_to_memory(event)
+    )
+
+
+def test_serialized_values_are_copies():
+    event = AgentFinishAction(outputs={'files': ['a.txt']})
+    event_to_dict(event)['args']['outputs']['files'].append('b.txt')
+    assert event.outputs == {'files': ['a.txt']}
+
+    obs = BrowserOutputObservation(
+        '', url='', screenshot='', dom_object={'screenshot': 'x', 'node': 1}
+    )
+    assert 'screenshot' not in event_to_memory(obs)['extras'].get('dom_object', {})
+    assert obs.dom_object == {'screenshot': 'x', 'node': 1}
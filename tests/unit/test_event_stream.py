@@ -1,10 +1,31 @@
+import asyncio
 import json
+import threading
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 
-from opendevin.events import EventSource, EventStream
-from opendevin.events.action import NullAction
-from opendevin.events.observation import NullObservation
+from opendevin.controller.agent_controller import AgentController
+from opendevin.controller.state.state import State
+from opendevin.core.metrics import Metrics
+from opendevin.core.schema import AgentState
+from opendevin.events import (
+    EventFilter,
+    EventSource,
+    EventStream,
+    EventStreamSubscriber,
+)
+from opendevin.events.action import (
+    Action,
+    AgentFinishAction,
+    MessageAction,
+    NullAction,
+)
+from opendevin.events.cache import EventCache
+from opendevin.events.log import OBJECT_STORE_SEGMENT_BYTES, EventLog
+from opendevin.events.observation import CmdOutputObservation, NullObservation
+from opendevin.events.subscriber_queue import OverflowPolicy
+from opendevin.storage import InMemoryFileStore, LocalFileStore, get_file_store
 
 
 def collect_events(stream):
@@ -23,7 +44,8 @@ async def test_stream_storage():
     stream = EventStream('def')
     await stream.add_event(NullObservation(''), EventSource.AGENT)
     assert len(collect_events(stream)) == 1
-    content = stream._file_store.read('sessions/def/events/0.json')
+    await stream.flush()
+    content = stream._log.read(0)
     assert content is not None
     data = json.loads(content)
     assert 'timestamp' in data
@@ -44,6 +66,7 @@ async def test_rehydration():
     await stream1.add_event(NullObservation('obs1'), EventSource.AGENT)
     await stream1.add_event(NullObservation('obs2'), EventSource.AGENT)
     assert len(collect_events(stream1)) == 2
+    await stream1.close()
 
     stream2 = EventStream('es2')
     assert len(collect_events(stream2)) == 0
@@ -53,3 +76,524 @@ async def test_rehydration():
     assert len(events) == 2
     assert events[0].content == 'obs1'
     assert events[1].content == 'obs2'
+
+
+def test_log_segments():
+    log = EventLog('log1', get_file_store(), max_segment_events=3)
+    for id in range(10):
+        log.append(id, f'event{id}')
+    assert len(log._segments) == 4
+    assert log.read(0) == 'event0'
+    assert log.read(7) == 'event7'
+    assert [id for id, _ in log.read_range(2, 5)] == [2, 3, 4, 5]
+    with pytest.raises(FileNotFoundError):
+        log.read(10)
+    with pytest.raises(ValueError):
+        log.append(12, 'event12')
+
+    reopened = EventLog('log1', get_file_store(), max_segment_events=3)
+    assert reopened.next_id == 10
+    assert [payload for _, payload in reopened.read_range(8)] == ['event8', 'event9']
+
+
+def test_log_truncated_tail():
+    file_store = get_file_store()
+    log = EventLog('log2', file_store)
+    log.append(0, 'event0')
+    log.append(1, 'event1')
+    file_store.append('sessions/log2/event_log/0000000000.log', '0000000aeve')
+
+    reopened = EventLog('log2', file_store)
+    assert reopened.next_id == 2
+    reopened.append(2, 'event2')
+    assert [payload for _, payload in reopened.read_range()] == [
+        'event0',
+        'event1',
+        'event2',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_legacy_migration():
+    file_store = get_file_store()
+    for id, content in enumerate(['obs1', 'obs2']):
+        data = {'id': id, 'source': 'agent', 'observation': 'null', 'content': content}
+        file_store.write(f'sessions/legacy/events/{id}.json', json.dumps(data))
+
+    stream = EventStream('legacy')
+    await stream.add_event(NullObservation('obs3'), EventSource.AGENT)
+    events = collect_events(stream)
+    assert [event.content for event in events] == ['obs1', 'obs2', 'obs3']
+    assert events[2].id == 2
+
+
+def test_log_manifest(monkeypatch):
+    file_store = get_file_store()
+    log = EventLog('log3', file_store, max_segment_events=3)
+    for id in range(7):
+        log.append(id, f'event{id}')
+
+    def fail_list(path):
+        raise AssertionError(f'unexpected listing of {path}')
+
+    with monkeypatch.context() as m:
+        m.setattr(file_store, 'list', fail_list)
+        reopened = EventLog('log3', file_store, max_segment_events=3)
+        assert reopened.next_id == 7
+        assert reopened.read(4) == 'event4'
+
+    # a corrupt manifest falls back to rebuilding it from the segment files
+    for slot in range(2):
+        file_store.write(f'sessions/log3/event_log/manifest.{slot}.json', '{"bad')
+    repaired = EventLog('log3', file_store, max_segment_events=3)
+    assert repaired.next_id == 7
+    assert [payload for _, payload in repaired.read_range(5)] == ['event5', 'event6']
+
+
+def test_log_manifest_behind_segments():
+    file_store = get_file_store()
+    log = EventLog('log4', file_store, max_segment_events=2)
+    for id in range(4):
+        log.append(id, f'event{id}')
+    # simulate a crash between appending a record and writing the manifest
+    log._append_record(4, 'event4')
+
+    reopened = EventLog('log4', file_store, max_segment_events=2)
+    assert reopened.next_id == 5
+    reopened.append(5, 'event5')
+    assert [id for id, _ in reopened.read_range()] == [0, 1, 2, 3, 4, 5]
+
+
+def test_log_reads_only_the_records_it_needs(monkeypatch, tmp_path):
+    file_store = LocalFileStore(str(tmp_path))
+    log = EventLog('log5', file_store)
+    # non-ASCII payloads take more bytes than characters
+    for id in range(400):
+        log.append(id, f'événement{id}')
+    reads = []
+    read_range = file_store.read_range
+
+    def spy(path, offset, length):
+        reads.append(length)
+        return read_range(path, offset, length)
+
+    monkeypatch.setattr(file_store, 'read', None)
+    monkeypatch.setattr(file_store, 'read_range', spy)
+    assert log.read(300) == 'événement300'
+    assert [payload for _, payload in log.read_range(62, 65)] == [
+        f'événement{id}' for id in range(62, 66)
+    ]
+    # one span of indexed records at most for the single event
+    assert reads[0] < log._segments[0].size // 5
+
+
+def test_log_small_segments_without_native_append(monkeypatch):
+    file_store = InMemoryFileStore()
+    monkeypatch.setattr(file_store, 'appends_natively', False)
+    log = EventLog('log6', file_store)
+    for id in range(2000):
+        log.append(id, 'x' * 100)
+    assert len(log._segments) > 1
+    assert all(
+        segment.size <= OBJECT_STORE_SEGMENT_BYTES + 200 for segment in log._segments
+    )
+    assert log.read(1999) == 'x' * 100
+
+
+@pytest.mark.asyncio
+async def test_log_reads_during_append(monkeypatch):
+    file_store = InMemoryFileStore()
+    log = EventLog('log7', file_store)
+    await log.aappend_many([(0, 'event0'), (1, 'event1')])
+    written = asyncio.Event()
+    aappend = file_store.aappend
+
+    async def slow_aappend(path, content):
+        # like a write the executor is still in the middle of
+        half = len(content) // 2
+        await aappend(path, content[:half])
+        await written.wait()
+        await aappend(path, content[half:])
+
+    monkeypatch.setattr(file_store, 'aappend', slow_aappend)
+    append = asyncio.create_task(log.aappend_many([(2, 'event2'), (3, 'event3')]))
+    await asyncio.sleep(0.01)
+    # the records being written aren't visible yet
+    assert [id for id, _ in log.read_range()] == [0, 1]
+    with pytest.raises(FileNotFoundError):
+        log.read(2)
+    written.set()
+    await append
+    assert [id for id, _ in log.read_range()] == [0, 1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_open_off_the_event_loop(monkeypatch):
+    file_store = InMemoryFileStore()
+    monkeypatch.setattr('opendevin.events.stream.get_file_store', lambda: file_store)
+    stream = EventStream('open1')
+    await stream.add_event(NullObservation('obs1'), EventSource.AGENT)
+    await stream.close()
+
+    read = file_store.read
+    read_on = []
+
+    def spy(path):
+        read_on.append(threading.current_thread())
+        return read(path)
+
+    monkeypatch.setattr(file_store, 'read', spy)
+    reopened = await EventStream.aopen('open1')
+    assert read_on
+    assert threading.current_thread() not in read_on
+    assert reopened.persisted_id == 0
+    await reopened.add_event(NullObservation('obs2'), EventSource.AGENT)
+    assert [event.content for event in collect_events(reopened)] == ['obs1', 'obs2']
+
+
+@pytest.mark.asyncio
+async def test_async_get_events():
+    stream = EventStream('async1')
+    for content in ['obs1', 'obs2', 'obs3']:
+        await stream.add_event(NullObservation(content), EventSource.AGENT)
+    events = [event async for event in stream.aget_events(start_id=1)]
+    assert [event.content for event in events] == ['obs2', 'obs3']
+
+
+@pytest.mark.asyncio
+async def test_write_behind_group_commit():
+    stream = EventStream('wb1', flush_interval=60, max_batch_size=100)
+    received = []
+
+    async def on_event(event):
+        received.append(event)
+
+    stream.subscribe(EventStreamSubscriber.TEST, on_event)
+    for content in ['obs1', 'obs2', 'obs3']:
+        await stream.add_event(NullObservation(content), EventSource.AGENT)
+    # subscribers and readers see the events before they are persisted
+    await stream.join_subscribers()
+    assert len(received) == 3
+    assert stream._log.next_id == 0
+    assert [event.content for event in collect_events(stream)] == [
+        'obs1',
+        'obs2',
+        'obs3',
+    ]
+
+    await stream.close()
+    assert stream._log.next_id == 3
+    assert [event.content for event in collect_events(EventStream('wb1'))] == [
+        'obs1',
+        'obs2',
+        'obs3',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_flush_after_a_failed_manifest_write(monkeypatch):
+    file_store = InMemoryFileStore()
+    monkeypatch.setattr('opendevin.events.stream.get_file_store', lambda: file_store)
+    stream = EventStream('wb4', flush_interval=60)
+    awrite = file_store.awrite
+    failures = [OSError('manifest write failed')]
+
+    async def flaky_awrite(path, content):
+        if 'manifest' in path and failures:
+            raise failures.pop()
+        await awrite(path, content)
+
+    monkeypatch.setattr(file_store, 'awrite', flaky_awrite)
+    await stream.add_event(NullObservation('obs1'), EventSource.AGENT)
+    # the record is written, but not the manifest
+    with pytest.raises(OSError):
+        await stream.flush()
+    assert stream._log.next_id == 1
+    assert not stream._pending
+    await stream.add_event(NullObservation('obs2'), EventSource.AGENT)
+    await stream.flush()
+    await stream.close()
+    reopened = EventStream('wb4')
+    assert [event.content for event in collect_events(reopened)] == ['obs1', 'obs2']
+
+
+@pytest.mark.asyncio
+async def test_write_behind_max_batch_size():
+    stream = EventStream('wb2', flush_interval=60, max_batch_size=2)
+    await stream.add_event(NullObservation('obs1'), EventSource.AGENT)
+    await stream.add_event(NullObservation('obs2'), EventSource.AGENT)
+    await asyncio.sleep(0.01)
+    assert stream._log.next_id == 2
+    await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_fsync_always(monkeypatch):
+    stream = EventStream('wb3', fsync='always')
+    synced = []
+
+    async def afsync(path):
+        synced.append(path)
+
+    monkeypatch.setattr(stream._file_store, 'afsync', afsync)
+    await stream.add_event(NullObservation('obs1'), EventSource.AGENT)
+    assert stream._log.next_id == 1
+    assert synced == ['sessions/wb3/event_log/0000000000.log']
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_does_not_delay_others():
+    stream = EventStream('fanout1')
+    release = asyncio.Event()
+    slow_received = []
+    fast_received = []
+
+    async def slow(event):
+        await release.wait()
+        slow_received.append(event.content)
+
+    async def fast(event):
+        fast_received.append(event.content)
+
+    stream.subscribe(EventStreamSubscriber.RUNTIME, slow)
+    stream.subscribe(EventStreamSubscriber.SERVER, fast)
+    for content in ['obs1', 'obs2', 'obs3']:
+        await stream.add_event(NullObservation(content), EventSource.AGENT)
+    await asyncio.sleep(0.01)
+    assert fast_received == ['obs1', 'obs2', 'obs3']
+    assert slow_received == []
+    assert stream.get_subscriber_metrics()[EventStreamSubscriber.RUNTIME]['depth'] == 2
+
+    release.set()
+    await stream.join_subscribers()
+    assert slow_received == ['obs1', 'obs2', 'obs3']
+    await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_overflow_policies():
+    stream = EventStream('fanout2')
+    release = asyncio.Event()
+    dropped = []
+    coalesced = []
+
+    async def blocked(received, event):
+        await release.wait()
+        received.append(getattr(event, 'content', None))
+
+    stream.subscribe(
+        EventStreamSubscriber.RUNTIME,
+        lambda event: blocked(dropped, event),
+        overflow_policy=OverflowPolicy.DROP_OLDEST,
+        queue_size=2,
+    )
+    stream.subscribe(
+        EventStreamSubscriber.SERVER,
+        lambda event: blocked(coalesced, event),
+        overflow_policy=OverflowPolicy.COALESCE,
+        queue_size=2,
+    )
+    await stream.add_event(NullObservation('obs1'), EventSource.AGENT)
+    await asyncio.sleep(0.01)  # obs1 is now being delivered
+    await stream.add_event(NullAction(), EventSource.AGENT)
+    for content in ['obs2', 'obs3']:
+        await stream.add_event(NullObservation(content), EventSource.AGENT)
+
+    release.set()
+    await stream.join_subscribers()
+    assert dropped == ['obs1', 'obs2', 'obs3']
+    assert coalesced == ['obs1', None, 'obs3']
+    metrics = stream.get_subscriber_metrics()
+    assert metrics[EventStreamSubscriber.RUNTIME]['dropped'] == 1
+    assert metrics[EventStreamSubscriber.SERVER]['coalesced'] == 1
+    await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_filtered_subscribers():
+    stream = EventStream('filtered')
+    actions = []
+    user_messages = []
+    observations = []
+
+    async def on_action(event):
+        actions.append(event)
+
+    async def on_user_message(event):
+        user_messages.append(event)
+
+    async def on_observation(event):
+        observations.append(event)
+
+    stream.subscribe(
+        EventStreamSubscriber.RUNTIME,
+        on_action,
+        event_filter=EventFilter(include_types=(Action,), exclude_types=(NullAction,)),
+    )
+    stream.subscribe(
+        EventStreamSubscriber.SERVER,
+        on_user_message,
+        event_filter=EventFilter(
+            sources=(EventSource.USER,), action_types=('message',)
+        ),
+    )
+    stream.subscribe(
+        EventStreamSubscriber.MAIN,
+        on_observation,
+        event_filter=EventFilter(observation_types=('null',)),
+    )
+    await stream.add_event(NullAction(), EventSource.AGENT)
+    await stream.add_event(MessageAction('hi'), EventSource.AGENT)
+    await stream.add_event(MessageAction('hello'), EventSource.USER)
+    await stream.add_event(NullObservation(''), EventSource.AGENT)
+    await stream.join_subscribers()
+
+    assert [event.id for event in actions] == [1, 2]
+    assert [event.id for event in user_messages] == [2]
+    assert [event.id for event in observations] == [3]
+
+    stream.unsubscribe(EventStreamSubscriber.RUNTIME)
+    await stream.add_event(MessageAction('again'), EventSource.USER)
+    await stream.join_subscribers()
+    assert len(actions) == 2
+    assert [event.id for event in user_messages] == [2, 4]
+    await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_close_delivers_queued_events():
+    stream = EventStream('closing')
+    received = []
+    release = asyncio.Event()
+
+    async def slow(event):
+        await asyncio.sleep(0.01)
+        received.append(event.content)
+
+    async def blocked(event):
+        await release.wait()
+
+    stream.subscribe(EventStreamSubscriber.RUNTIME, slow)
+    for content in ['obs1', 'obs2', 'obs3']:
+        await stream.add_event(NullObservation(content), EventSource.AGENT)
+    await stream.close()
+    assert received == ['obs1', 'obs2', 'obs3']
+
+    # a subscriber that never catches up doesn't hold the close for long
+    stream = EventStream('closing')
+    stream.subscribe(EventStreamSubscriber.SERVER, blocked)
+    await stream.add_event(NullObservation('obs4'), EventSource.AGENT)
+    await asyncio.wait_for(stream.close(timeout=0.05), 1)
+    assert stream.get_subscriber_metrics()[EventStreamSubscriber.SERVER]['depth'] == 0
+
+
+@pytest.mark.asyncio
+async def test_close_releases_blocked_producers():
+    stream = EventStream('closing2')
+    received = []
+    release = asyncio.Event()
+
+    async def blocked(event):
+        received.append(event.content)
+        await release.wait()
+
+    stream.subscribe(
+        EventStreamSubscriber.RUNTIME,
+        blocked,
+        overflow_policy=OverflowPolicy.BLOCK,
+        queue_size=1,
+    )
+    await stream.add_event(NullObservation('obs1'), EventSource.AGENT)
+    await asyncio.sleep(0.01)  # obs1 is now being delivered
+    await stream.add_event(NullObservation('obs2'), EventSource.AGENT)
+    producer = asyncio.create_task(
+        stream.add_event(NullObservation('obs3'), EventSource.AGENT)
+    )
+    await asyncio.sleep(0.01)
+    assert not producer.done()
+    await stream.close(timeout=0.05)
+    await asyncio.wait_for(producer, 1)
+
+    # events added after closing are stored, but not delivered
+    await stream.add_event(NullObservation('obs4'), EventSource.AGENT)
+    await asyncio.sleep(0.01)
+    assert received == ['obs1']
+    assert stream.get_event(3).content == 'obs4'
+
+
+@pytest.mark.asyncio
+async def test_controller_handles_its_action_within_the_step():
+    stream = EventStream('controller-step')
+    agent = MagicMock()
+    agent.llm.metrics = Metrics()
+    agent.astep = AsyncMock(return_value=AgentFinishAction(outputs={'answer': 42}))
+    controller = AgentController(
+        agent,
+        stream,
+        sid='controller-step',
+        max_budget_per_task=None,
+        initial_state=State(agent_state=AgentState.RUNNING),
+        is_delegate=True,
+    )
+    await controller._step()
+    # not left to the controller's subscriber queue, which hasn't run yet
+    assert controller.get_agent_state() == AgentState.FINISHED
+    assert controller.state.outputs == {'answer': 42}
+    await controller.close()
+    await stream.close()
+
+
+def test_event_cache_bounds():
+    cache = EventCache(max_entries=2, max_bytes=100)
+    cache.put('a', 0, NullAction(), 10)
+    cache.put('a', 1, NullAction(), 10)
+    assert cache.get('a', 0) is not None
+    cache.put('a', 2, NullAction(), 10)  # evicts 1, the least recently used
+    assert cache.get('a', 1) is None
+    cache.put('b', 0, NullAction(), 95)  # only fits on its own
+    assert cache.get_metrics()['entries'] == 1
+    assert cache.get('b', 0) is not None
+    cache.put('b', 1, NullAction(), 101)  # too large to cache
+    assert cache.get('b', 1) is None
+    cache.invalidate('b')
+    assert cache.get_metrics() == {
+        'entries': 0,
+        'bytes': 0,
+        'hits': 2,
+        'misses': 2,
+        'evictions': 3,
+    }
+
+
+@pytest.mark.asyncio
+async def test_event_cache():
+    stream = EventStream('cached')
+    action = NullAction()
+    await stream.add_event(action, EventSource.AGENT)
+    before = stream.get_cache_metrics()
+    assert stream.get_event(0) is action
+    assert collect_events(stream)[0] is action
+    assert stream.get_cache_metrics()['hits'] - before['hits'] == 2
+
+    await stream.close()
+    reopened = EventStream('cached')
+    event = reopened.get_event(0)
+    assert event is not action
+    assert reopened.get_event(0) is event
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_large_values_spill_to_blobs():
+    stream = EventStream('blobs1')
+    output = 'x' * 100_000
+    for i in range(2):
+        await stream.add_event(
+            CmdOutputObservation(output, command_id=i, command='ls'), EventSource.USER
+        )
+    await stream.close()
+
+    assert len(stream._log.read(0)) < 1000
+    assert len(get_file_store().list('sessions/blobs1/blobs')) == 1
+    events = collect_events(EventStream('blobs1'))
+    assert [event.content for event in events] == [output, output]
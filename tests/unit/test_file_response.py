@@ -0,0 +1,58 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from opendevin.server import file_response
+from opendevin.server.file_response import etag_matches, parse_range
+from opendevin.storage.memory import InMemoryFileStore
+
+
+def test_parse_range():
+    assert parse_range('bytes=0-9', 100) == (0, 10)
+    assert parse_range('bytes=90-', 100) == (90, 100)
+    assert parse_range('bytes=90-200', 100) == (90, 100)
+    assert parse_range('bytes=-10', 100) == (90, 100)
+    assert parse_range('bytes=-200', 100) == (0, 100)
+    # served whole
+    assert parse_range('bytes=0-1,5-9', 100) is None
+    assert parse_range('items=0-9', 100) is None
+    assert parse_range('bytes=a-b', 100) is None
+    for header in ['bytes=100-', 'bytes=9-0', 'bytes=-0']:
+        with pytest.raises(ValueError):
+            parse_range(header, 100)
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches('*', '"abc"')
+    assert not etag_matches('"abc"', '"def"')
+
+
+def test_file_response(monkeypatch):
+    monkeypatch.setattr(file_response, 'CHUNK_SIZE', 8)
+    file_store = InMemoryFileStore()
+    file_store.write('foo.txt', 'Hello, world! ' * 10)
+    app = FastAPI()
+
+    @app.get('/file')
+    def get_file(request: Request):
+        info = file_store.stat('foo.txt')
+        return file_response.file_response(
+            file_store, 'foo.txt', info, request.headers.get('range')
+        )
+
+    client = TestClient(app)
+    response = client.get('/file')
+    assert response.status_code == 200
+    assert response.text == 'Hello, world! ' * 10
+    assert response.headers['etag'] == f'"{file_store.stat("foo.txt").etag}"'
+
+    response = client.get('/file', headers={'Range': 'bytes=7-20'})
+    assert response.status_code == 206
+    assert response.text == 'world! Hello, '
+    assert response.headers['content-range'] == 'bytes 7-20/140'
+
+    response = client.get('/file', headers={'Range': 'bytes=140-'})
+    assert response.status_code == 416
+    assert response.headers['content-range'] == 'bytes */140'
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+# seconds the CLI may take to import, generous for slow CI machines
+IMPORT_TIME_BUDGET = 3.0
+# imported on first use only
+HEAVY_MODULES = ['litellm', 'chromadb', 'llama_index', 'browsergym', 'minio', 'e2b']
+
+
+def _import(module: str) -> tuple[float, set[str]]:
+    """
+    Imports a module in a fresh interpreter, and returns how long it took, in
+    seconds, and the modules it imported.
+    """
+    code = f'import sys, {module}; print(" ".join(sys.modules))'
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, 'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'x')},
+    )
+    cumulative = None
+    # import time: self [us] | cumulative | imported package
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1].strip())
+    assert cumulative is not None, f'{module} not in the -X importtime output'
+    return cumulative / 1e6, set(result.stdout.split())
+
+
+def test_cli_import_time():
+    elapsed, modules = _import('opendevin.core.main')
+    assert elapsed < IMPORT_TIME_BUDGET
+    assert not modules & set(HEAVY_MODULES)
+
+
+def test_agenthub_import_is_lazy():
+    _, modules = _import('agenthub')
+    assert 'agenthub.codeact_agent' not in modules
+    assert not modules & set(HEAVY_MODULES)
+
+    import agenthub  # noqa: F401
+    from opendevin.controller.agent import Agent
+
+    # agents are imported when first asked for, micro agents are all listed
+    assert 'CodeActAgent' in Agent.list_agents()
+    assert 'CoderAgent' in Agent.list_agents()
+    assert Agent.get_cls('CodeActAgent').__name__ == 'CodeActAgent'
@@ -0,0 +1,406 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import litellm
+import pytest
+from litellm.exceptions import RateLimitError
+
+from agenthub.codeact_agent.codeact_agent import CodeActAgent
+from opendevin.controller.agent import Agent
+from opendevin.controller.state.state import State
+from opendevin.core.config import config
+from opendevin.core.utils import json
+from opendevin.events.action import Action, CmdRunAction, MessageAction
+from opendevin.events.event import EventSource
+from opendevin.events.observation import NullObservation
+from opendevin.llm import llm as llm_module
+from opendevin.llm.cache import LLMCache, get_llm_cache
+from opendevin.llm.hedging import LatencyTracker, hedge
+from opendevin.llm.llm import LLM
+from opendevin.llm.rate_limit import RateLimiter
+from opendevin.llm.tokens import TokenCounter
+
+
+def _response(content: str) -> dict:
+    return {'choices': [{'message': {'content': content}}]}
+
+
+@pytest.mark.asyncio
+async def test_acompletion_retries(monkeypatch):
+    calls = []
+
+    async def mock_acompletion(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise RateLimitError('slow down', 'openai', 'gpt-4o')
+        return _response('Hello!')
+
+    monkeypatch.setattr(llm_module, 'litellm_acompletion', mock_acompletion)
+    llm = LLM(
+        model='gpt-4o',
+        api_key='x',
+        num_retries=2,
+        retry_min_wait=0,
+        retry_max_wait=0,
+        cost_metric_supported=False,
+    )
+    response = await llm.acompletion(messages=[{'role': 'user', 'content': 'Hi'}])
+    assert response['choices'][0]['message']['content'] == 'Hello!'
+    assert len(calls) == 2
+    assert calls[1]['model'] == 'gpt-4o'
+    assert calls[1]['messages'] == [{'role': 'user', 'content': 'Hi'}]
+
+
+@pytest.mark.asyncio
+async def test_astream():
+    llm = LLM(model='gpt-4o', api_key='x', cost_metric_supported=False)
+    stream = llm.astream(
+        messages=[{'role': 'user', 'content': 'Hi'}],
+        mock_response='Hello, how are you?',
+    )
+    pieces = [piece async for piece in stream]
+    assert len(pieces) > 1
+    assert ''.join(pieces) == 'Hello, how are you?'
+
+
+@pytest.mark.asyncio
+async def test_codeact_astep_streams(monkeypatch):
+    response = 'Let me check.\n<execute_bash>\nls\n</execute_bash>\nOBSERVATION: none'
+    monkeypatch.setattr(
+        llm_module,
+        'litellm_acompletion',
+        partial(litellm.acompletion, mock_response=response),
+    )
+    llm = LLM(model='gpt-4o', api_key='x', cost_metric_supported=False)
+    llm.stream = True
+    agent = CodeActAgent(llm)
+    pieces = []
+
+    async def on_partial_response(content: str):
+        pieces.append(content)
+
+    agent.partial_response_callback = on_partial_response
+    message = MessageAction('List the files')
+    message._source = EventSource.USER
+    state = State(history=[(message, NullObservation(''))])
+    action = await agent.astep(state)
+    assert action == CmdRunAction(command='ls', thought='Let me check.')
+    assert ''.join(pieces) == response[: response.index('OBSERVATION')].rstrip()
+    assert state.num_of_tokens > 0
+
+
+class _SlowAgent(Agent):
+    def step(self, state) -> Action:
+        time.sleep(0.3)
+        return MessageAction('done')
+
+    def search_memory(self, query: str) -> list[str]:
+        return []
+
+
+@pytest.mark.asyncio
+async def test_astep_runs_sync_agents_in_a_thread():
+    agent = _SlowAgent(LLM(model='gpt-4o', api_key='x'))
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    action = await agent.astep(None)
+    ticker.cancel()
+    assert isinstance(action, MessageAction)
+    # the event loop kept running while the agent stepped
+    assert ticks > 5
+
+
+def test_response_cache(monkeypatch, tmp_path):
+    calls = []
+
+    def mock_completion(**kwargs):
+        calls.append(kwargs)
+        return litellm.completion(**kwargs, mock_response='Hello!')
+
+    monkeypatch.setattr(llm_module, 'litellm_completion', mock_completion)
+    monkeypatch.setattr(config.llm, 'response_cache', True)
+    monkeypatch.setattr(config.llm, 'response_cache_path', str(tmp_path / 'llm.db'))
+    messages = [{'role': 'user', 'content': 'Hi'}]
+    llm = LLM(model='gpt-4o', api_key='x', cost_metric_supported=False)
+    llm.completion(messages=messages, temperature=0)
+    response = llm.completion(messages=messages, temperature=0)
+    assert response.choices[0].message.content == 'Hello!'
+    assert response['choices'][0]['message']['content'] == 'Hello!'
+    assert len(calls) == 1
+
+    # other parameters make another call, and other credentials don't
+    llm.completion(messages=messages, temperature=0, stop=['</execute_bash>'])
+    assert len(calls) == 2
+    LLM(model='gpt-4o', api_key='y').completion(messages=messages, temperature=0)
+    assert len(calls) == 2
+
+    # responses that change every time aren't cached, unless forced
+    llm.completion(messages=messages, temperature=0.7)
+    llm.completion(messages=messages, temperature=0.7)
+    assert len(calls) == 4
+    llm.cache_force = True
+    llm.completion(messages=messages, temperature=0.7)
+    llm.completion(messages=messages, temperature=0.7)
+    assert len(calls) == 5
+
+    metrics = llm.metrics.get()
+    assert metrics['cache_hits'] == 2
+    assert metrics['cache_misses'] == 3
+    assert metrics['cache_bytes_saved'] > 0
+
+
+@pytest.mark.asyncio
+async def test_response_cache_off_the_event_loop(monkeypatch, tmp_path):
+    async def mock_acompletion(**kwargs):
+        return _response('Hello!')
+
+    monkeypatch.setattr(llm_module, 'litellm_acompletion', mock_acompletion)
+    monkeypatch.setattr(config.llm, 'response_cache', True)
+    monkeypatch.setattr(config.llm, 'response_cache_path', str(tmp_path / 'llm.db'))
+    llm = LLM(model='gpt-4o', api_key='x', cost_metric_supported=False)
+    assert llm.cache is not None
+    threads = []
+    get, put = llm.cache.get, llm.cache.put
+
+    def spy(method, *args):
+        threads.append(threading.current_thread())
+        return method(*args)
+
+    monkeypatch.setattr(llm.cache, 'get', partial(spy, get))
+    monkeypatch.setattr(llm.cache, 'put', partial(spy, put))
+    messages = [{'role': 'user', 'content': 'Hi'}]
+    await llm.acompletion(messages=messages, temperature=0)
+    response = await llm.acompletion(messages=messages, temperature=0)
+    assert response['choices'][0]['message']['content'] == 'Hello!'
+    assert llm.metrics.get()['cache_hits'] == 1
+    assert len(threads) == 3
+    assert threading.current_thread() not in threads
+
+
+def _fill_cache(path: str, worker: int) -> int:
+    cache = get_llm_cache(path, 1024 * 1024, 60)
+    for i in range(20):
+        cache.put(f'{worker}-{i}', f'response {i}')
+    return sum(cache.get(f'{worker}-{i}') is not None for i in range(20))
+
+
+def test_llm_cache(tmp_path):
+    path = str(tmp_path / 'llm.db')
+    cache = LLMCache(path, max_bytes=100, ttl=60)
+    cache.put('a', 'x' * 1000)
+    cache.put('b', 'y' * 1000)
+    assert cache.get('a') == 'x' * 1000
+    # compressed, two of them fit: a third one evicts the least recently used
+    cache.max_bytes = 40
+    cache.put('c', 'z' * 1000)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+    # the total size is kept as entries are written, replaced and evicted
+    cache.put('c', 'w' * 1000)
+    conn = cache._connect()
+    assert cache._size == cache._get_size(conn)
+    statements: list[str] = []
+    conn.set_trace_callback(statements.append)
+    cache.max_bytes = 1024
+    cache.put('d', 'v' * 1000)
+    conn.set_trace_callback(None)
+    assert 'SELECT TOTAL(size) FROM responses' not in statements
+    assert cache._size == cache._get_size(conn)
+
+    cache.ttl = -1
+    assert cache.get('a') is None
+
+    # processes share the database
+    get_llm_cache(path, 1024 * 1024, 60).get('warm-up')
+    with ProcessPoolExecutor(3) as executor:
+        counts = list(executor.map(partial(_fill_cache, path), range(3)))
+    assert counts == [20, 20, 20]
+    assert LLMCache(path, 1024 * 1024, 60).get('2-19') == 'response 19'
+
+
+def test_token_counter():
+    counter = TokenCounter('gpt-4o')
+    messages = [
+        {'role': 'system', 'content': 'You are a helpful assistant.'},
+        {'role': 'user', 'content': 'List the files.'},
+    ]
+    for _ in range(3):
+        assert counter.count_messages(messages) == litellm.token_counter(
+            model='gpt-4o', messages=messages
+        )
+        messages.append({'role': 'assistant', 'content': 'ls -l ' * len(messages)})
+    # each message was tokenized once
+    assert counter.get_metrics()['misses'] == 4
+    assert counter.count_messages([]) == 0
+
+
+def test_token_metrics(monkeypatch):
+    monkeypatch.setattr(
+        llm_module,
+        'litellm_completion',
+        partial(litellm.completion, mock_response='Hello!'),
+    )
+    llm = LLM(model='gpt-4o', api_key='x')
+    llm.completion(messages=[{'role': 'user', 'content': 'Hi'}])
+    llm.completion(messages=[{'role': 'user', 'content': 'Hi'}])
+    metrics = llm.metrics.get()
+    assert metrics['prompt_tokens'] > 0 and metrics['completion_tokens'] > 0
+    assert metrics['prompt_tokens'] % 2 == 0
+
+
+def test_hedge():
+    calls = []
+    hedges = []
+    losers = []
+
+    def call():
+        calls.append(None)
+        time.sleep(0.5 if len(calls) == 1 else 0)
+        return len(calls)
+
+    def on_hedge():
+        hedges.append(None)
+        return True
+
+    # fast enough, not hedged
+    assert hedge(lambda: 'fast', 0.2, on_hedge, losers.append) == ('fast', False)
+    assert hedge(call, 0.05, on_hedge, losers.append) == (2, True)
+    assert len(hedges) == 1
+    # the first call can't be interrupted, and finishes later
+    time.sleep(0.6)
+    assert losers == [2]
+
+    # no room for the duplicate
+    calls.clear()
+    assert hedge(call, 0.05, lambda: False, losers.append) == (1, False)
+    assert len(calls) == 1
+
+
+def test_latency_percentile_with_censored_calls():
+    tracker = LatencyTracker()
+    for _ in range(15):
+        tracker.record(0.01)
+    for _ in range(10):
+        tracker.record(0.5, censored=True)
+    assert tracker.percentile(50) == 0.01
+    # the cancelled calls are slower than the answered ones, not left out
+    assert tracker.percentile(95) == 0.5
+
+
+@pytest.mark.asyncio
+async def test_hedged_acompletion(monkeypatch):
+    calls = []
+
+    async def mock_acompletion(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+        return _response(f'Hello from call {len(calls)}')
+
+    monkeypatch.setattr(llm_module, 'litellm_acompletion', mock_acompletion)
+    monkeypatch.setattr(config.llm, 'hedge_percentile', 95)
+    monkeypatch.setattr(config.llm, 'hedge_min_delay', 0.05)
+    monkeypatch.setattr(config.llm, 'input_cost_per_token', 0.001)
+    llm = LLM(model='gpt-4o', api_key='x')
+    llm.latencies = LatencyTracker()
+    messages = [{'role': 'user', 'content': 'Hi'}]
+    # no hedging until there are enough latencies to know what is slow
+    assert llm._get_hedge_delay(llm.latencies) is None
+    for _ in range(20):
+        llm.latencies.record(0.01)
+    assert llm._get_hedge_delay(llm.latencies) == 0.05
+
+    start = time.monotonic()
+    response = await llm.acompletion(messages=messages)
+    assert time.monotonic() - start < 5
+    assert response['choices'][0]['message']['content'] == 'Hello from call 2'
+    metrics = llm.metrics.get()
+    assert metrics['hedged_requests'] == 1 and metrics['hedge_wins'] == 1
+    # the cancelled call is charged for its prompt
+    assert metrics['hedge_cost'] == pytest.approx(llm.get_token_count(messages) * 0.001)
+    assert metrics['accumulated_cost'] >= metrics['hedge_cost']
+    # the wait from the start of the first call, and a lower bound of its latency
+    (latency, censored), (bound, bound_censored) = list(llm.latencies._latencies)[-2:]
+    assert latency >= 0.05 and not censored
+    assert bound == latency and bound_censored
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_without_a_free_rate_limit_slot(monkeypatch):
+    calls = []
+
+    async def mock_acompletion(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.2)
+        return _response('Hello!')
+
+    monkeypatch.setattr(llm_module, 'litellm_acompletion', mock_acompletion)
+    monkeypatch.setattr(config.llm, 'hedge_percentile', 95)
+    monkeypatch.setattr(config.llm, 'hedge_min_delay', 0.05)
+    llm = LLM(model='gpt-4o', api_key='x', cost_metric_supported=False)
+    llm.latencies = LatencyTracker()
+    for _ in range(20):
+        llm.latencies.record(0.01)
+    llm.rate_limiter = RateLimiter('hedge', max_concurrency=1)
+    await llm.acompletion(messages=[{'role': 'user', 'content': 'Hi'}])
+    assert len(calls) == 1
+    assert llm.metrics.get()['hedged_requests'] == 0
+
+    # with a slot free, the duplicate takes it, and frees it once cancelled
+    llm.rate_limiter = RateLimiter('hedge', max_concurrency=2)
+    calls.clear()
+    await llm.acompletion(messages=[{'role': 'user', 'content': 'Hi'}])
+    assert len(calls) == 2
+    assert llm.rate_limiter.in_flight == 0
+
+
+def test_cascade(monkeypatch):
+    def mock_completion(model, **kwargs):
+        # the small model doesn't answer in JSON
+        content = 'run ls' if model == 'gpt-4o-mini' else '{"action": "run"}'
+        return _response(content)
+
+    monkeypatch.setattr(llm_module, 'litellm_completion', mock_completion)
+    monkeypatch.setattr(config.llm, 'tier_models', 'plan=gpt-4o-mini, delegate=')
+    llm = LLM(model='gpt-4o', api_key='x', cost_metric_supported=False)
+    assert llm.for_tier('condense') is llm
+    assert llm.for_tier('delegate') is llm
+    assert llm.for_tier('plan').model_name == 'gpt-4o-mini'
+    assert llm.for_tier('plan').metrics is llm.metrics
+
+    models = []
+
+    def plan(tier_llm: LLM) -> dict:
+        models.append(tier_llm.model_name)
+        resp = tier_llm.completion(messages=[{'role': 'user', 'content': 'Hi'}])
+        return json.loads(resp['choices'][0]['message']['content'])
+
+    assert llm.cascade('plan', plan) == {'action': 'run'}
+    assert models == ['gpt-4o-mini', 'gpt-4o']
+    assert llm.metrics.get()['escalations'] == 1
+
+
+def test_tier_base_urls(monkeypatch):
+    monkeypatch.setattr(config.llm, 'base_url', 'http://localhost:8000')
+    monkeypatch.setattr(
+        config.llm,
+        'tier_models',
+        'plan=gpt-4o-mini, condense=ollama/llama3, delegate=ollama/llama3',
+    )
+    monkeypatch.setattr(config.llm, 'tier_base_urls', 'condense=http://ollama:11434')
+    llm = LLM(model='ollama/llama3', api_key='x', cost_metric_supported=False)
+    # a model of another provider doesn't go to the endpoint of the main model
+    assert llm.for_tier('plan').base_url is None
+    assert llm.for_tier('condense').base_url == 'http://ollama:11434'
+    assert llm.for_tier('delegate').base_url == 'http://localhost:8000'
@@ -1,10 +1,23 @@
+import gzip
+import json
 import logging
+from functools import partial
 from io import StringIO
 
+import litellm
 import pytest
 
 from opendevin.core.config import AppConfig, LLMConfig
+from opendevin.core.logger import (
+    CompressedRotatingFileHandler,
+    JsonFormatter,
+    llm_transcript_logger,
+    transcript_session,
+    transcript_step,
+)
 from opendevin.core.logger import opendevin_logger as opendevin_logger
+from opendevin.llm import llm as llm_module
+from opendevin.llm.llm import LLM
 
 
 @pytest.fixture
@@ -133,3 +146,41 @@ def test_special_cases_masking(test_handler):
     for attr, value in sensitive_data.items():
         assert f"{attr}='******'" in log_output
         assert value not in log_output
+
+
+def test_llm_transcript(monkeypatch, tmp_path):
+    handler = CompressedRotatingFileHandler(
+        str(tmp_path / 'transcript.jsonl'), max_bytes=2000, backup_count=2
+    )
+    handler.setFormatter(JsonFormatter())
+    monkeypatch.setattr(llm_transcript_logger, 'handlers', [handler])
+    monkeypatch.setattr(
+        llm_module,
+        'litellm_completion',
+        partial(litellm.completion, mock_response='Hello!'),
+    )
+    llm = LLM(model='gpt-4o', api_key='x', cost_metric_supported=False)
+    level = llm_transcript_logger.level
+    llm_transcript_logger.setLevel(logging.DEBUG)
+    session_token = transcript_session.set('sid')
+    try:
+        for step in range(10):
+            step_token = transcript_step.set(step)
+            llm.completion(messages=[{'role': 'user', 'content': 'Hi ' * 100}])
+            transcript_step.reset(step_token)
+    finally:
+        transcript_session.reset(session_token)
+        llm_transcript_logger.setLevel(level)
+        handler.close()
+
+    with open(tmp_path / 'transcript.jsonl') as f:
+        record = json.loads(f.readlines()[-1])
+    assert record['session'] == 'sid' and record['step'] == 9
+    assert record['model'] == 'gpt-4o' and record['latency'] >= 0
+    assert record['messages'][0]['content'] == 'Hi ' * 100
+    assert record['response'] == 'Hello!'
+    assert record['prompt_tokens'] > 0 and record['completion_tokens'] > 0
+    # the older records were rotated and compressed
+    with gzip.open(tmp_path / 'transcript.jsonl.1.gz', 'rt') as f:
+        assert json.loads(f.readline())['session'] == 'sid'
+    assert not (tmp_path / 'transcript.jsonl.3.gz').exists()
@@ -36,6 +36,8 @@ def test_coder_agent_with_summary():
     mock_llm = MagicMock()
     content = json.dumps({'action': 'finish', 'args': {}})
     mock_llm.completion.return_value = {'choices': [{'message': {'content': content}}]}
+    # the tier of micro agents uses the main model
+    mock_llm.cascade.side_effect = lambda tier, call: call(mock_llm)
 
     coder_agent = Agent.get_cls('CoderAgent')(llm=mock_llm)
     assert coder_agent is not None
@@ -63,6 +65,8 @@ def test_coder_agent_without_summary():
     mock_llm = MagicMock()
     content = json.dumps({'action': 'finish', 'args': {}})
     mock_llm.completion.return_value = {'choices': [{'message': {'content': content}}]}
+    # the tier of micro agents uses the main model
+    mock_llm.cascade.side_effect = lambda tier, call: call(mock_llm)
 
     coder_agent = Agent.get_cls('CoderAgent')(llm=mock_llm)
     assert coder_agent is not None
@@ -0,0 +1,105 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from opendevin.core.config import config
+from opendevin.llm import rate_limit
+from opendevin.llm.llm import LLM
+from opendevin.llm.rate_limit import POLL_INTERVAL, RateLimiter, get_retry_after
+
+
+def test_token_buckets():
+    limiter = RateLimiter('openai/gpt-4o', requests_per_minute=2)
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == pytest.approx(30, abs=1)
+
+    limiter = RateLimiter('openai/gpt-4o', tokens_per_minute=100)
+    assert limiter.try_acquire(80) == 0
+    assert limiter.try_acquire(50) == pytest.approx(18, abs=1)
+    # calls larger than the bucket wait for it to be full
+    assert limiter.try_acquire(500) == pytest.approx(48, abs=1)
+
+
+def test_adaptive_concurrency():
+    limiter = RateLimiter('openai/gpt-4o', max_concurrency=4)
+    for _ in range(4):
+        assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == POLL_INTERVAL
+
+    limiter.release(succeeded=False, rate_limited=True)
+    assert limiter.concurrency == 2
+    limiter.release(succeeded=False, rate_limited=True, retry_after=10)
+    assert limiter.concurrency == 1
+    assert limiter.try_acquire() == pytest.approx(10, abs=1)
+
+    limiter = RateLimiter('openai/gpt-4o', max_concurrency=4)
+    limiter._state.concurrency = 1
+    for _ in range(6):
+        limiter.try_acquire()
+        limiter.release()
+    assert limiter.concurrency == 3
+    # failures that aren't about the rate limits change nothing
+    limiter.try_acquire()
+    limiter.release(succeeded=False)
+    assert limiter.concurrency == 3
+
+
+def test_shared_state(tmp_path):
+    # limiters of different processes share the buckets and the hold
+    first = RateLimiter('openai/gpt-4o', 2, state_dir=str(tmp_path))
+    second = RateLimiter('openai/gpt-4o', 2, state_dir=str(tmp_path))
+    assert first.try_acquire() == 0
+    assert second.try_acquire() == 0
+    assert first.try_acquire() > 0
+    first.release(succeeded=False, rate_limited=True, retry_after=60)
+    assert second.try_acquire() == pytest.approx(60, abs=1)
+    assert RateLimiter('openai/gpt-4', 2, state_dir=str(tmp_path)).try_acquire() == 0
+
+
+@pytest.mark.asyncio
+async def test_shared_state_off_the_event_loop(tmp_path):
+    limiter = RateLimiter('openai/gpt-4o', 2, state_dir=str(tmp_path))
+    threads = []
+    try_acquire, release = limiter.try_acquire, limiter.release
+
+    def in_thread(func):
+        def wrapper(*args):
+            threads.append(threading.current_thread())
+            return func(*args)
+
+        return wrapper
+
+    limiter.try_acquire = in_thread(try_acquire)  # type: ignore
+    limiter.release = in_thread(release)  # type: ignore
+    assert await limiter.aacquire() < 1
+    await limiter.arelease()
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def test_unlimited_calls_skip_the_limiter(monkeypatch):
+    monkeypatch.setattr(rate_limit, '_limiters', {})
+    monkeypatch.setattr(config.llm, 'rate_limit_requests_per_minute', 0)
+    monkeypatch.setattr(config.llm, 'rate_limit_tokens_per_minute', 0)
+    monkeypatch.setattr(config.llm, 'rate_limit_max_concurrency', 0)
+    assert LLM(model='gpt-4o', api_key='x').rate_limiter is None
+
+    monkeypatch.setattr(config.llm, 'rate_limit_requests_per_minute', 60)
+    llm = LLM(model='gpt-4o', api_key='x')
+    assert llm.rate_limiter is not None
+    assert llm.rate_limiter.requests_per_minute == 60
+    # no cap on concurrent calls unless one is set
+    assert all(llm.rate_limiter.try_acquire() == 0 for _ in range(32))
+
+
+def test_get_retry_after():
+    def error(headers):
+        return SimpleNamespace(response=SimpleNamespace(headers=headers))
+
+    assert get_retry_after(error({'retry-after': '7'})) == 7
+    assert get_retry_after(error({'retry-after-ms': '1500'})) == 1.5
+    assert get_retry_after(error({'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'})) == 0
+    assert get_retry_after(error({})) is None
+    assert get_retry_after(Exception()) is None
@@ -1,5 +1,11 @@
+from types import SimpleNamespace
+
 import pytest
 
+from agenthub.codeact_agent.action_parser import (
+    CodeActResponseParser,
+    CodeActStreamParser,
+)
 from agenthub.micro.agent import parse_response as parse_response_micro
 from agenthub.monologue_agent.utils.prompts import (
     parse_action_response as parse_response_monologue,
@@ -8,6 +14,7 @@ from agenthub.planner_agent.prompt import parse_response as parse_response_plann
 from opendevin.core.exceptions import LLMResponseError
 from opendevin.core.utils.json import loads as custom_loads
 from opendevin.events.action import (
+    CmdRunAction,
     FileWriteAction,
     MessageAction,
 )
@@ -94,3 +101,25 @@ def test_no_json_found():
     input_response = 'This is just a string with no JSON object.'
     with pytest.raises(LLMResponseError):
         custom_loads(input_response)
+
+
+@pytest.mark.parametrize('piece_size', [1, 3, 7, 1000])
+def test_codeact_stream_parser(piece_size):
+    response = 'Let me list the files.\n<execute_bash>\nls -l\n</execute_bash>\nOBSERVATION: nothing'
+    parser = CodeActStreamParser(CodeActResponseParser())
+    action = None
+    for i in range(0, len(response), piece_size):
+        action = parser.feed(response[i : i + piece_size])
+        if action is not None:
+            break
+    assert action == CmdRunAction(command='ls -l', thought='Let me list the files.')
+    assert parser.text.endswith('</execute_bash>')
+
+    # the same action as when the stop sequence ends the response
+    content = response[: response.index('</execute_bash>')]
+    message = SimpleNamespace(content=content)
+    full = SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    assert CodeActResponseParser().parse(full) == action
+    parser = CodeActStreamParser(CodeActResponseParser())
+    assert parser.feed(content) is None
+    assert parser.finish() == action
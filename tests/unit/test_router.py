@@ -0,0 +1,150 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from opendevin.llm.llm import LLM
+from opendevin.llm.router import Endpoint, EndpointRouter
+
+
+class _CompletionHandler(BaseHTTPRequestHandler):
+    """
+    Answers chat completions like an OpenAI-compatible server, after a delay.
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.delay)  # type: ignore
+        self.server.requests += 1  # type: ignore
+        body = json.dumps(
+            {
+                'id': 'chatcmpl-1',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': 'mock',
+                'choices': [
+                    {
+                        'index': 0,
+                        'message': {
+                            'role': 'assistant',
+                            'content': self.server.content,  # type: ignore
+                        },
+                        'finish_reason': 'stop',
+                    }
+                ],
+                'usage': {
+                    'prompt_tokens': 1,
+                    'completion_tokens': 1,
+                    'total_tokens': 2,
+                },
+            }
+        ).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+
+    def start(content: str, delay: float = 0.0) -> str:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _CompletionHandler)
+        server.content, server.delay, server.requests = content, delay, 0  # type: ignore
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}/v1'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _unused_url() -> str:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{s.getsockname()[1]}/v1'
+
+
+def _llm(base_urls: list[str]) -> LLM:
+    return LLM(
+        model='openai/mock',
+        api_key='x',
+        base_urls=base_urls,
+        num_retries=1,
+        cost_metric_supported=False,
+    )
+
+
+def _complete(llm: LLM) -> str:
+    resp = llm.completion(
+        messages=[{'role': 'user', 'content': 'Hi'}], max_retries=0, timeout=10
+    )
+    return resp['choices'][0]['message']['content']
+
+
+def test_router_ranking():
+    fast, slow, new = Endpoint('fast'), Endpoint('slow'), Endpoint('new')
+    router = EndpointRouter([slow, fast, new])
+    for endpoint, latency in ((fast, 1.0), (slow, 3.0)):
+        router.start(endpoint)
+        router.succeed(endpoint, latency)
+    # endpoints never timed are tried first, as fast as the fastest
+    assert [e.base_url for e in router.ranked()] == ['new', 'fast', 'slow']
+    router.start(new)
+    router.succeed(new, 2.0)
+    assert [e.base_url for e in router.ranked()] == ['fast', 'new', 'slow']
+
+    # the busy endpoints are expected to be slower
+    router.start(fast)
+    assert [e.base_url for e in router.ranked()] == ['new', 'fast', 'slow']
+    router.start(fast)
+    assert [e.base_url for e in router.ranked()] == ['new', 'slow', 'fast']
+
+    # failed endpoints go last
+    router.fail(new)
+    assert [e.base_url for e in router.ranked()][-1] == 'new'
+    assert not new.healthy
+
+
+def test_failover(start_server):
+    down = _unused_url()
+    up = start_server('Hello from up')
+    llm = _llm([down, up])
+    assert _complete(llm) == 'Hello from up'
+    metrics = {m['base_url']: m for m in llm.router.get_metrics()}
+    assert metrics[down]['errors'] == 1 and not metrics[down]['healthy']
+    assert metrics[up]['requests'] == 1 and metrics[up]['healthy']
+
+    # the endpoint that is down isn't tried again until its cooldown ends
+    assert _complete(llm) == 'Hello from up'
+    assert llm.router.get_metrics()[0]['requests'] == 1
+
+
+def test_routes_to_the_fastest(start_server):
+    slow = start_server('slow', delay=0.3)
+    fast = start_server('fast')
+    llm = _llm([slow, fast])
+    responses = [_complete(llm) for _ in range(5)]
+    # each endpoint is tried once, then the fast one is kept
+    assert responses.count('slow') == 1
+    assert responses[-3:] == ['fast'] * 3
+
+
+@pytest.mark.asyncio
+async def test_async_failover(start_server):
+    llm = _llm([_unused_url(), start_server('Hello')])
+    resp = await llm.acompletion(
+        messages=[{'role': 'user', 'content': 'Hi'}], max_retries=0, timeout=10
+    )
+    assert resp['choices'][0]['message']['content'] == 'Hello'
+    assert [m['errors'] for m in llm.router.get_metrics()] == [1, 0]
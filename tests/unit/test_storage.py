@@ -1,10 +1,19 @@
+import hashlib
+import io
 import os
 import shutil
+import threading
+from types import SimpleNamespace
 
 import pytest
+from minio.error import S3Error
 
+from opendevin.storage import blob
+from opendevin.storage.blob import BlobStore
+from opendevin.storage.disk_cache import DiskCache
 from opendevin.storage.local import LocalFileStore
 from opendevin.storage.memory import InMemoryFileStore
+from opendevin.storage.s3 import S3FileStore
 
 
 @pytest.fixture
@@ -63,3 +72,240 @@ def test_deep_list(setup_env):
         store.delete('foo/bar/baz.txt')
         store.delete('foo/bar/qux.txt')
         store.delete('foo/bar/quux.txt')
+
+
+@pytest.mark.asyncio
+async def test_async_fileops(setup_env):
+    for store in [LocalFileStore('./_test_files_tmp'), InMemoryFileStore()]:
+        await store.awrite('foo/bar.txt', 'Hello, ')
+        await store.aappend('foo/bar.txt', 'world!')
+        assert await store.aread('foo/bar.txt') == 'Hello, world!'
+        assert await store.alist('foo') == ['foo/bar.txt']
+        await store.adelete('foo/bar.txt')
+        with pytest.raises(FileNotFoundError):
+            await store.aread('foo/bar.txt')
+
+
+def test_blob_store(setup_env, monkeypatch):
+    output = 'total 0\n' * 1000
+    for store in [LocalFileStore('./_test_files_tmp'), InMemoryFileStore()]:
+        blobs = BlobStore(store, 'blobs')
+        key = blobs.write(output)
+        assert blobs.write(output) == key
+        assert store.list('blobs') == [f'blobs/{key}']
+        assert len(store.read(f'blobs/{key}')) < len(output)
+        assert blobs.read(key) == output
+
+        # blobs written without zstandard stay readable, and vice versa
+        monkeypatch.setattr(blob, 'zstandard', None)
+        key = blobs.write('no zstd\n' * 1000)
+        assert store.read(f'blobs/{key}').startswith('zlib:')
+        assert BlobStore(store, 'blobs').read(key) == 'no zstd\n' * 1000
+        monkeypatch.undo()
+
+        # incompressible data is stored as is
+        key = blobs.write('a')
+        assert blobs.read(key) == 'a'
+
+
+@pytest.mark.asyncio
+async def test_blob_store_async(monkeypatch, tmp_path):
+    store = LocalFileStore(str(tmp_path))
+    key = BlobStore(store, 'blobs').write('total 0\n' * 1000)
+
+    list = store.list
+    listed_on = []
+
+    def spy(path):
+        listed_on.append(threading.current_thread())
+        return list(path)
+
+    monkeypatch.setattr(store, 'list', spy)
+    blobs = BlobStore(store, 'blobs')
+    assert await blobs.awrite('total 0\n' * 1000) == key
+    # the blobs are listed once, off the event loop
+    assert len(listed_on) == 1
+    assert listed_on[0] is not threading.current_thread()
+    new_key = await blobs.awrite('total 1\n' * 1000)
+    assert await blobs.aread(new_key) == 'total 1\n' * 1000
+
+
+def test_read_many(setup_env):
+    for store in [LocalFileStore('./_test_files_tmp'), InMemoryFileStore()]:
+        store.write('foo/a.txt', 'a')
+        store.write('foo/b.txt', 'b')
+        assert store.read_many(['foo/a.txt', 'foo/b.txt']) == {
+            'foo/a.txt': 'a',
+            'foo/b.txt': 'b',
+        }
+        with pytest.raises(FileNotFoundError):
+            store.read_many(['foo/a.txt', 'foo/c.txt'])
+        store.delete('foo/a.txt')
+        store.delete('foo/b.txt')
+
+
+def test_in_memory_index():
+    store = InMemoryFileStore()
+    store.write('sessions/a/events/0.json', 'x' * 100)
+    store.write('./sessions/a/events/1.json', 'y')
+    store.write('sessions/b/state.json', 'z')
+    store.write('sessionsfoo.txt', 'not in sessions/')
+    assert store.read('/sessions/a/events/1.json') == 'y'
+    assert sorted(store.list('sessions')) == ['sessions/a/', 'sessions/b/']
+    assert sorted(store.list('sessions/a/events/')) == [
+        'sessions/a/events/0.json',
+        'sessions/a/events/1.json',
+    ]
+    assert store.list('missing') == []
+    assert store.get_metrics()['files'] == 4
+    size = store.get_metrics()['bytes']
+    # appends are kept as chunks until the next read joins them
+    for _ in range(4):
+        store.append('sessions/b/state.json', 'z' * 25)
+    assert store.files['sessions/b/state.json'][-1] == 'z' * 25
+    assert store.read('sessions/b/state.json') == 'z' * 101
+    assert store.get_metrics()['bytes'] == size + 100
+    # listed in a stable order
+    store.write('sessions/0.json', '')
+    assert store.list('sessions') == ['sessions/0.json', 'sessions/a/', 'sessions/b/']
+    store.delete('sessions/0.json')
+
+    store.delete('sessions/a')
+    assert store.list('sessions') == ['sessions/b/']
+    with pytest.raises(FileNotFoundError):
+        store.read('sessions/a/events/0.json')
+    store.delete('sessions/b/state.json')
+    assert store.list('') == ['sessionsfoo.txt']
+    store.delete('sessionsfoo.txt')
+    assert store.get_metrics() == {'files': 0, 'bytes': 0}
+    with pytest.raises(FileNotFoundError):
+        store.delete('sessions')
+
+
+class _FakeS3Client:
+    """
+    In-process stand-in for the Minio client, with the S3 listing semantics.
+    """
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.gets = 0
+
+    def put_object(self, bucket, key, data, length, part_size=0):
+        assert part_size >= 5 * 1024 * 1024
+        contents = data.read() if length < 0 else data.read(length)
+        self.objects[key] = contents
+        return SimpleNamespace(etag=hashlib.md5(contents).hexdigest())
+
+    def _get(self, key):
+        if key not in self.objects:
+            raise S3Error(None, 'NoSuchKey', 'missing', key, '', '')
+        return self.objects[key]
+
+    def stat_object(self, bucket, key):
+        contents = self._get(key)
+        return SimpleNamespace(
+            etag=hashlib.md5(contents).hexdigest(), size=len(contents)
+        )
+
+    def get_object(self, bucket, key, offset=0, length=0):
+        self.gets += 1
+        contents = self._get(key)
+        if length:
+            contents = contents[offset : offset + length]
+        return SimpleNamespace(
+            read=lambda: contents,
+            headers={'ETag': f'"{hashlib.md5(contents).hexdigest()}"'},
+            close=lambda: None,
+            release_conn=lambda: None,
+        )
+
+    def list_objects(self, bucket, prefix, recursive=False):
+        names = set()
+        for key in sorted(self.objects):
+            if key.startswith(prefix):
+                name, slash, _ = key[len(prefix) :].partition('/')
+                names.add(prefix + name + slash)
+        for name in sorted(names):
+            yield SimpleNamespace(object_name=name)
+
+    def remove_object(self, bucket, key):
+        self.objects.pop(key, None)
+
+
+def test_s3_file_store(setup_env):
+    client = _FakeS3Client()
+    store = S3FileStore(client=client, cache_dir='./_test_files_tmp/cache')
+    store.write('/foo/bar/baz.txt', 'Hello, world!')
+    store.write_stream('foo/qux.txt', io.BytesIO(b'streamed'))
+    assert store.list('') == ['foo/']
+    assert store.list('foo') == ['foo/bar/', 'foo/qux.txt']
+    assert store.read('foo/bar/baz.txt') == 'Hello, world!'
+    assert store.read('foo/qux.txt') == 'streamed'
+    # the first file was cached when written, the second when read
+    assert store.read('foo/qux.txt') == 'streamed'
+    assert client.gets == 1
+
+    # a file changed behind the cache's back has another ETag
+    client.objects['foo/bar/baz.txt'] = b'changed'
+    assert store.read('foo/bar/baz.txt') == 'changed'
+
+    store.delete('foo/bar/baz.txt')
+    with pytest.raises(FileNotFoundError):
+        store.read('foo/bar/baz.txt')
+    assert store.get_metrics()['entries'] == 1
+
+
+def test_disk_cache(setup_env):
+    cache = DiskCache('./_test_files_tmp/cache', max_bytes=10)
+    cache.put('a', 'v1', b'aaaa')
+    cache.put('b', 'v1', b'bbbb')
+    assert cache.get('a', 'v1') == b'aaaa'
+    assert cache.get('a', 'v2') is None
+    # b is the least recently used, and makes room for c
+    cache.put('c', 'v1', b'cccc')
+    assert cache.get('b', 'v1') is None
+    cache.put('a', 'v2', b'AAAA')
+    assert cache.get('a', 'v1') is None
+    assert cache.get_metrics()['bytes'] == 8
+    # too large to be cached
+    cache.put('d', 'v1', b'd' * 11)
+    assert cache.get('d', 'v1') is None
+
+    # the cache is rebuilt from disk
+    cache = DiskCache('./_test_files_tmp/cache', max_bytes=10)
+    assert cache.get('a', 'v2') == b'AAAA'
+    assert cache.get('c', 'v1') == b'cccc'
+    assert len(os.listdir('./_test_files_tmp/cache')) == 2
+
+
+def test_byte_streams(setup_env):
+    binary = bytes(range(256)) * 4
+    for store in [
+        LocalFileStore('./_test_files_tmp'),
+        InMemoryFileStore(),
+        S3FileStore(client=_FakeS3Client()),
+    ]:
+        with store.open_write('foo/bin.dat') as f:
+            f.write(binary[:512])
+            f.write(binary[512:])
+        with store.open_read('foo/bin.dat') as f:
+            assert f.read() == binary
+        assert store.read_range('foo/bin.dat', 250, 10) == binary[250:260]
+        assert store.read_range('foo/bin.dat', 1020, 10) == binary[1020:]
+        info = store.stat('foo/bin.dat')
+        assert info.size == 1024
+
+        # a failed write leaves the file as it was
+        with pytest.raises(RuntimeError):
+            with store.open_write('foo/bin.dat') as f:
+                f.write(b'partial')
+                raise RuntimeError()
+        assert store.stat('foo/bin.dat') == info
+        assert store.list('foo') == ['foo/bin.dat']
+
+        store.write('foo/bin.dat', 'changed')
+        assert store.stat('foo/bin.dat').etag != info.etag
+        with pytest.raises(FileNotFoundError):
+            store.stat('foo/missing.dat')
+        store.delete('foo/bin.dat')